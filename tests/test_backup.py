@@ -0,0 +1,159 @@
+"""BackupManager 备份与恢复测试：主库和归档库一起备份、轮换和恢复"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import todo_app_v2  # noqa: E402
+from todo_app_v2 import BackupManager, Database  # noqa: E402
+
+
+class BackupTestBase:
+    compress = False
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'todo.db')
+        self.db = Database(self.db_path)
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.manager = BackupManager(self.db_path, keep=2, compress=self.compress)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def titles(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return sorted(row[0] for row in conn.execute('SELECT title FROM todos'))
+        finally:
+            conn.close()
+
+    def history_count(self):
+        conn = self.db._connect_history()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM all_completed_tasks').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_backups_in_same_second_are_kept_apart(self):
+        first = self.manager.create_backup()
+        second = self.manager.create_backup()
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.manager.list_backups(), [second, first])
+
+    def test_rotation_keeps_newest(self):
+        paths = [self.manager.create_backup() for _ in range(4)]
+        self.assertEqual(self.manager.list_backups(), paths[:1:-1])
+
+    def test_restore_oldest_at_keep_limit(self):
+        self.db.add_todo('第一版', task_date=self.today)
+        oldest = self.manager.create_backup()
+        self.db.add_todo('第二版', task_date=self.today)
+        self.manager.create_backup()
+        self.assertEqual(len(self.manager.list_backups()), self.manager.keep)
+
+        safety_path = self.manager.restore_backup(oldest)
+        self.assertEqual(self.titles(), ['第一版'])
+        # 恢复前的备份不轮换，恢复用的备份仍然在
+        self.assertTrue(os.path.exists(oldest))
+        self.assertIn(safety_path, self.manager.list_backups())
+
+        self.manager.restore_backup(safety_path)
+        self.assertEqual(self.titles(), ['第一版', '第二版'])
+
+    def test_restore_missing_backup_keeps_database(self):
+        self.db.add_todo('保留', task_date=self.today)
+        with self.assertRaises(OSError):
+            self.manager.restore_backup(os.path.join(self.temp_dir, 'missing.db'))
+        self.assertEqual(self.titles(), ['保留'])
+
+    def test_archive_backed_up_and_restored(self):
+        todo_id = self.db.add_todo('已完成', task_date=self.today)
+        self.db.complete_task(todo_id)
+        self.db.archive_completed_tasks(retention_days=-1)
+        backup_path = self.manager.create_backup()
+        self.assertTrue(os.path.exists(self.manager._archive_backup_path(backup_path)))
+        self.assertEqual(self.manager.check_backup(backup_path), 'ok')
+
+        self.manager.restore_backup(backup_path)
+        self.assertEqual(self.history_count(), 1)
+
+    def test_restore_without_archive_removes_current_archive(self):
+        todo_id = self.db.add_todo('已完成', task_date=self.today)
+        self.db.complete_task(todo_id)
+        backup_path = self.manager.create_backup()
+        self.db.archive_completed_tasks(retention_days=-1)
+
+        self.manager.restore_backup(backup_path)
+        self.assertFalse(os.path.exists(self.db.archive_path))
+        self.assertEqual(self.history_count(), 1)
+
+
+    def test_writers_not_blocked_during_backup(self):
+        for index in range(200):
+            self.db.add_todo(f'任务 {index}', description='x' * 500, task_date=self.today)
+        writes = []
+
+        def write_between_steps(seconds):
+            # 不等待锁：备份在两步之间持有读锁时这里会报 database is locked
+            if len(writes) < 3:
+                conn = sqlite3.connect(self.db_path, timeout=0)
+                try:
+                    conn.execute("UPDATE todos SET title = title || '+' WHERE id = 1")
+                    conn.commit()
+                finally:
+                    conn.close()
+                writes.append(seconds)
+
+        with mock.patch.object(todo_app_v2, 'BACKUP_PAGES_PER_STEP', 2), \
+                mock.patch.object(todo_app_v2.time, 'sleep', write_between_steps):
+            backup_path = self.manager.create_backup()
+        self.assertEqual(len(writes), 3)
+        self.assertEqual(self.manager.check_backup(backup_path), 'ok')
+
+    def test_archived_between_copies_not_duplicated(self):
+        for index in range(3):
+            self.db.complete_task(self.db.add_todo(f'已完成 {index}', task_date=self.today))
+        # 先有一个归档库，备份才会复制它
+        self.db.complete_task(self.db.add_todo('早已归档', task_date='2000-01-01'))
+        self.db.archive_completed_tasks()
+        archive_copies = []
+        real_connect = sqlite3.connect
+
+        def connect(path, *args, **kwargs):
+            # 主库复制完、开始复制归档库时，把今天完成的任务移入归档库
+            if path == self.db.archive_path and not archive_copies:
+                archive_copies.append(path)
+                self.db.archive_completed_tasks(retention_days=-1)
+            return real_connect(path, *args, **kwargs)
+
+        with mock.patch.object(todo_app_v2.sqlite3, 'connect', connect):
+            backup_path = self.manager.create_backup()
+        self.assertEqual(archive_copies, [self.db.archive_path])
+
+        restored = Database(os.path.join(self.temp_dir, 'restored.db'))
+        BackupManager(restored.db_path, self.manager.backup_dir).restore_backup(backup_path)
+        conn = restored._connect_history()
+        try:
+            titles = sorted(row[0] for row in conn.execute('SELECT title FROM all_completed_tasks'))
+        finally:
+            conn.close()
+        self.assertEqual(titles, ['已完成 0', '已完成 1', '已完成 2', '早已归档'])
+
+
+class PlainBackupTest(BackupTestBase, unittest.TestCase):
+    compress = False
+
+
+class CompressedBackupTest(BackupTestBase, unittest.TestCase):
+    compress = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""CalendarSync 导入去重测试：本应用导出的条目在任务完成、归档后重新导入时不会重复"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import CalendarSync, Database  # noqa: E402
+
+
+class CalendarReimportTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.temp_dir, 'todo.db'))
+        self.sync = CalendarSync(self.db)
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.ics_path = os.path.join(self.temp_dir, 'export.ics')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def export(self):
+        self.sync.export(self.ics_path, '2000-01-01')
+
+    def archive_all(self):
+        # 保留期为负数时今天完成的任务也移入归档库
+        self.assertGreater(self.db.archive_completed_tasks(retention_days=-1), 0)
+
+    def assert_nothing_imported(self):
+        result = self.sync.import_file(self.ics_path)
+        self.assertEqual((result['todos'], result['templates']), (0, 0))
+        self.assertGreater(result['skipped'], 0)
+
+    def test_reimport_open_todo(self):
+        self.db.add_todo('写周报', task_date=self.today)
+        self.export()
+        self.assert_nothing_imported()
+
+    def test_reimport_completed_todo(self):
+        todo_id = self.db.add_todo('写周报', task_date=self.today)
+        self.export()
+        self.db.complete_task(todo_id)
+        self.assert_nothing_imported()
+        self.assertEqual(self.db.get_today_todos(), [])
+
+    def test_reimport_archived_todo(self):
+        todo_id = self.db.add_todo('写周报', task_date=self.today)
+        self.export()
+        self.db.complete_task(todo_id)
+        self.archive_all()
+        self.assert_nothing_imported()
+
+    def test_reimport_archived_done_event(self):
+        todo_id = self.db.add_todo('写周报', task_date=self.today)
+        self.db.complete_task(todo_id)
+        self.export()
+        self.archive_all()
+        self.assert_nothing_imported()
+
+    def write_todo(self, uid, title='新任务'):
+        with open(self.ics_path, 'w', encoding='utf-8', newline='') as f:
+            f.write('BEGIN:VCALENDAR\r\nBEGIN:VTODO\r\n'
+                    f'UID:{uid}\r\nSUMMARY:{title}\r\n'
+                    f'DUE;VALUE=DATE:{self.today.replace("-", "")}\r\nEND:VTODO\r\nEND:VCALENDAR\r\n')
+
+    def test_unknown_todo_uid_is_imported(self):
+        self.write_todo(self.sync._uid('todo', 999, self.db.get_database_id()))
+        self.assertEqual(self.sync.import_file(self.ics_path)['todos'], 1)
+
+    def test_database_id_is_stable(self):
+        self.assertEqual(self.db.get_database_id(), Database(self.db.db_path).get_database_id())
+
+    def test_other_database_export_with_same_ids_is_imported(self):
+        other = Database(os.path.join(self.temp_dir, 'other.db'))
+        other_path = os.path.join(self.temp_dir, 'other.ics')
+        other_id = other.add_todo('别处的任务', task_date=self.today)
+        CalendarSync(other).export(other_path, '2000-01-01')
+        # 本库中恰好有同一 id 的任务，不能因此跳过
+        self.assertEqual(self.db.add_todo('本库的任务', task_date=self.today), other_id)
+        self.assertEqual(self.sync.import_file(other_path)['todos'], 1)
+        self.assertEqual(self.sync.import_file(other_path)['todos'], 0)
+        self.assertEqual(sorted(todo.title for todo in self.db.get_today_todos()), sorted(['本库的任务', '别处的任务']))
+
+    def test_uid_without_database_id_matched_by_stored_uid(self):
+        todo_id = self.db.add_todo('本库的任务', task_date=self.today)
+        self.write_todo(f'todo-{todo_id}@todo-reminder', '旧格式')
+        self.assertEqual(self.sync.import_file(self.ics_path)['todos'], 1)
+        self.assertEqual(self.sync.import_file(self.ics_path)['todos'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
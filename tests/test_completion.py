@@ -0,0 +1,251 @@
+"""Database.complete_task / complete_tasks 测试：旧版 9 列、11 列数据库升级后与新建数据库行为一致"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import SESSION_BREAK, Database  # noqa: E402
+
+# 最早版本的 todos 表（9 列，还没有重复任务字段）
+LEGACY_TODOS_9 = '''
+    CREATE TABLE todos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        task_date TEXT NOT NULL,
+        estimated_duration INTEGER DEFAULT 0,
+        priority INTEGER DEFAULT 0,
+        status INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        notified INTEGER DEFAULT 0
+    )
+'''
+
+# 加入重复任务后的 todos 表（11 列）
+LEGACY_TODOS_11 = '''
+    CREATE TABLE todos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        task_date TEXT NOT NULL,
+        estimated_duration INTEGER DEFAULT 0,
+        priority INTEGER DEFAULT 0,
+        status INTEGER DEFAULT 0,
+        repeat_type INTEGER DEFAULT 0,
+        repeat_template_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        notified INTEGER DEFAULT 0
+    )
+'''
+
+LEGACY_TABLES = '''
+    CREATE TABLE task_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        todo_id INTEGER,
+        start_time DATETIME,
+        end_time DATETIME,
+        duration INTEGER DEFAULT 0,
+        summary TEXT,
+        FOREIGN KEY (todo_id) REFERENCES todos(id)
+    );
+    CREATE TABLE completed_tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        task_date TEXT NOT NULL,
+        completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        total_duration INTEGER DEFAULT 0,
+        priority INTEGER DEFAULT 0,
+        summary TEXT
+    );
+'''
+
+
+class CompletionTestBase:
+    """三种来源的数据库共用的用例，子类在 create_database 中准备数据库文件并写入任务"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'todo.db')
+        self.today = datetime.now().strftime('%Y-%m-%d')
+        self.create_database()
+        self.db = Database(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def query_update(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def title_id(self, title):
+        return self.query('SELECT id FROM todos WHERE title=?', (title,))[0][0]
+
+    def test_complete_copies_task_and_duration(self):
+        todo_id = self.title_id('写报告')
+        self.assertTrue(self.db.complete_task(todo_id, '写完了'))
+        rows = self.query('''
+            SELECT title, description, task_date, total_duration, priority, summary, todo_id
+            FROM completed_tasks WHERE title='写报告'
+        ''')
+        self.assertEqual(rows, [('写报告', '季度', self.today, 1500, 2, '写完了', todo_id)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM todos WHERE id=?', (todo_id,)), [(0,)])
+
+    def test_sessions_relinked_to_history(self):
+        todo_id = self.title_id('写报告')
+        self.db.complete_task(todo_id)
+        (completed_id,), = self.query("SELECT id FROM completed_tasks WHERE title='写报告'")
+        sessions = self.query('SELECT todo_id, completed_task_id, duration FROM task_sessions ORDER BY id')
+        self.assertEqual(sessions, [(None, completed_id, 900), (None, completed_id, 600)])
+
+    def test_complete_missing_task(self):
+        self.assertFalse(self.db.complete_task(99999))
+        self.assertEqual(self.db.complete_tasks([]), 0)
+
+    def test_complete_tasks_batch(self):
+        ids = [self.title_id('写报告'), self.title_id('回邮件'), 99999]
+        self.assertEqual(self.db.complete_tasks(ids, '批量'), 2)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM completed_tasks WHERE summary='批量'"), [(2,)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM todos WHERE id IN (?, ?)', ids[:2]), [(0,)])
+
+    def test_legacy_history_kept(self):
+        self.db.complete_task(self.title_id('回邮件'))
+        titles = [task.title for task in self.db.get_completed_tasks(days=3650)]
+        self.assertIn('回邮件', titles)
+        self.assertEqual(titles.count('旧的完成记录'), self.legacy_history)
+
+    def test_subtree_completed_with_parent(self):
+        parent_id = self.title_id('写报告')
+        child_id = self.db.add_todo('查数据', task_date=self.today, parent_id=parent_id)
+        grandchild_id = self.db.add_todo('画图表', task_date=self.today, parent_id=child_id)
+        session_id = self.db.start_task_session(grandchild_id)
+        self.db.stop_task_session(session_id)
+        self.query_update('UPDATE task_sessions SET duration=300 WHERE id=?', (session_id,))
+
+        self.assertEqual(self.db.complete_tasks([parent_id]), 3)
+        rows = dict((title, (todo_id, parent)) for title, todo_id, parent in self.query(
+            'SELECT title, todo_id, parent_id FROM completed_tasks WHERE title IN (?, ?, ?)',
+            ('写报告', '查数据', '画图表')))
+        self.assertEqual(rows, {'写报告': (parent_id, None), '查数据': (child_id, parent_id),
+                                '画图表': (grandchild_id, child_id)})
+        self.assertEqual(self.query('SELECT COUNT(*) FROM todos WHERE id IN (?, ?, ?)',
+                                    (parent_id, child_id, grandchild_id)), [(0,)])
+        (completed_id, total), = self.query("SELECT id, total_duration FROM completed_tasks WHERE title='画图表'")
+        self.assertEqual(total, 300)
+        self.assertEqual(self.query('SELECT completed_task_id FROM task_sessions WHERE id=?', (session_id,)),
+                         [(completed_id,)])
+
+    def test_completing_child_keeps_parent(self):
+        parent_id = self.title_id('写报告')
+        child_id = self.db.add_todo('查数据', task_date=self.today, parent_id=parent_id)
+        self.assertEqual(self.db.complete_tasks([child_id, child_id]), 1)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM todos WHERE id=?', (parent_id,)), [(1,)])
+
+    def test_summary_only_on_requested_tasks(self):
+        parent_id = self.title_id('写报告')
+        self.db.add_todo('查数据', task_date=self.today, parent_id=parent_id)
+        self.db.complete_task(parent_id, '写完了')
+        self.assertEqual(self.query("SELECT summary FROM completed_tasks WHERE title='写报告'"), [('写完了',)])
+        self.assertEqual(self.query("SELECT summary FROM completed_tasks WHERE title='查数据'"), [('',)])
+
+    def test_break_sessions_not_counted(self):
+        todo_id = self.title_id('回邮件')
+        session_id = self.db.start_task_session(todo_id, SESSION_BREAK)
+        self.db.stop_task_session(session_id)
+        self.query_update('UPDATE task_sessions SET duration=500 WHERE id=?', (session_id,))
+        self.db.complete_task(todo_id)
+        self.assertEqual(self.query("SELECT total_duration FROM completed_tasks WHERE title='回邮件'"), [(0,)])
+
+    def test_break_session_keeps_status(self):
+        todo_id = self.title_id('回邮件')
+        session_id = self.db.start_task_session(todo_id, SESSION_BREAK)
+        self.db.stop_task_session(session_id)
+        self.assertEqual(self.query('SELECT status FROM todos WHERE id=?', (todo_id,)), [(0,)])
+
+    def test_tags_moved_to_history(self):
+        todo_id = self.db.add_todo('整理', task_date=self.today, tags=['工作'])
+        self.db.complete_task(todo_id)
+        rows = self.query('''
+            SELECT tags.name FROM completed_task_tags JOIN tags ON tags.id = completed_task_tags.tag_id
+            JOIN completed_tasks ON completed_tasks.id = completed_task_tags.completed_task_id
+            WHERE completed_tasks.title='整理'
+        ''')
+        self.assertEqual(rows, [('工作',)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM todo_tags WHERE todo_id=?', (todo_id,)), [(0,)])
+
+
+class LegacyDatabaseMixin:
+    """用旧版建表语句直接写入任务、计时记录和完成历史，之后由 init_db 升级"""
+    todos_sql = None
+    legacy_history = 1
+
+    def create_database(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(self.todos_sql + ';' + LEGACY_TABLES)
+        conn.execute("INSERT INTO todos (title, description, task_date, estimated_duration, priority, status) "
+                     "VALUES ('写报告', '季度', ?, 3600, 2, 1)", (self.today,))
+        report_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        conn.execute("INSERT INTO todos (title, description, task_date) VALUES ('回邮件', '', ?)", (self.today,))
+        conn.executemany('INSERT INTO task_sessions (todo_id, start_time, end_time, duration) VALUES (?, ?, ?, ?)', [
+            (report_id, f'{self.today} 09:00:00', f'{self.today} 09:15:00', 900),
+            (report_id, f'{self.today} 10:00:00', f'{self.today} 10:10:00', 600),
+        ])
+        conn.execute("INSERT INTO completed_tasks (title, task_date, total_duration) VALUES ('旧的完成记录', ?, 60)",
+                     (self.today,))
+        conn.commit()
+        conn.close()
+
+
+class Legacy9ColumnCompletionTest(LegacyDatabaseMixin, CompletionTestBase, unittest.TestCase):
+    todos_sql = LEGACY_TODOS_9
+
+    def test_upgraded_columns(self):
+        columns = [row[1] for row in self.query('PRAGMA table_info(todos)')]
+        for column in ('repeat_type', 'repeat_template_id', 'parent_id', 'deleted_at'):
+            self.assertIn(column, columns)
+
+    def test_converted_to_incremental_vacuum(self):
+        # 转换在打开数据库时完成，后台维护只做增量回收
+        self.assertEqual(self.query('PRAGMA auto_vacuum'), [(2,)])
+        self.db.run_maintenance()
+        self.assertEqual(self.query('PRAGMA auto_vacuum'), [(2,)])
+
+
+class Legacy11ColumnCompletionTest(LegacyDatabaseMixin, CompletionTestBase, unittest.TestCase):
+    todos_sql = LEGACY_TODOS_11
+
+
+class FreshDatabaseCompletionTest(CompletionTestBase, unittest.TestCase):
+    legacy_history = 0
+
+    def create_database(self):
+        db = Database(self.db_path)
+        report_id = db.add_todo('写报告', '季度', self.today, 3600, 2)
+        db.add_todo('回邮件', '', self.today)
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('INSERT INTO task_sessions (todo_id, start_time, end_time, duration) VALUES (?, ?, ?, ?)', [
+            (report_id, f'{self.today} 09:00:00', f'{self.today} 09:15:00', 900),
+            (report_id, f'{self.today} 10:00:00', f'{self.today} 10:10:00', 600),
+        ])
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+"""DependencyGraph 依赖图测试：环检测、增量维护的拓扑序，以及大图的耗时"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import Database, DependencyGraph  # noqa: E402
+
+
+def edges_of(graph):
+    return {(blocker, todo) for blocker, todos in graph.successors.items() for todo in todos}
+
+
+def reaches(graph, start, target):
+    """从 start 沿依赖方向能否到达 target（逐个节点遍历，作为对照）"""
+    stack = [start]
+    seen = {start}
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for neighbor in graph.successors.get(node, ()):
+            if neighbor not in seen:
+                seen.add(neighbor)
+                stack.append(neighbor)
+    return False
+
+
+class DependencyGraphTest(unittest.TestCase):
+    def assert_valid(self, graph):
+        """前驱/后继一致、序号互不相同，且每条边的前置任务序号更小"""
+        self.assertEqual(set(graph.rank), set(graph.successors))
+        self.assertEqual(set(graph.rank), set(graph.predecessors))
+        self.assertEqual(len(set(graph.rank.values())), len(graph.rank))
+        for blocker, todo in edges_of(graph):
+            self.assertIn(blocker, graph.predecessors[todo])
+            self.assertLess(graph.rank[blocker], graph.rank[todo])
+        for todo, blockers in graph.predecessors.items():
+            for blocker in blockers:
+                self.assertIn(todo, graph.successors[blocker])
+
+    def test_self_dependency_rejected(self):
+        graph = DependencyGraph()
+        with self.assertRaises(ValueError):
+            graph.add_edge(1, 1)
+        self.assertEqual(edges_of(graph), set())
+
+    def test_cycle_rejected_with_path(self):
+        graph = DependencyGraph()
+        graph.add_edge(1, 2)
+        graph.add_edge(2, 3)
+        with self.assertRaises(ValueError) as context:
+            graph.add_edge(3, 1)
+        self.assertEqual(context.exception.args[0], [3, 1, 2, 3])
+        self.assertEqual(edges_of(graph), {(1, 2), (2, 3)})
+        self.assert_valid(graph)
+
+    def test_out_of_order_edge_reorders(self):
+        graph = DependencyGraph()
+        graph.add_edge(1, 2)
+        graph.add_edge(3, 4)
+        # 4 的序号比 1 大，加入 4 → 1 需要调整受影响区间
+        graph.add_edge(4, 1)
+        self.assert_valid(graph)
+        self.assertLess(graph.rank[3], graph.rank[2])
+
+    def test_load_rejects_cycle_edges(self):
+        graph = DependencyGraph()
+        rejected = graph.load([(1, 2), (2, 3), (3, 1), (3, 4), (5, 6), (1, 2)])
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(edges_of(graph) | set(rejected), {(1, 2), (2, 3), (3, 1), (3, 4), (5, 6)})
+        self.assert_valid(graph)
+
+    def test_remove_edge_drops_isolated_nodes(self):
+        graph = DependencyGraph()
+        graph.add_edge(1, 2)
+        graph.add_edge(2, 3)
+        graph.remove_edge(1, 2)
+        self.assertNotIn(1, graph.rank)
+        self.assertIn(2, graph.rank)
+        graph.remove_edge(2, 3)
+        self.assertEqual(graph.rank, {})
+
+    def test_remove_missing_edge(self):
+        graph = DependencyGraph()
+        graph.add_edge(1, 2)
+        graph.remove_edge(1, 3)
+        graph.remove_edge(4, 1)
+        self.assertEqual(edges_of(graph), {(1, 2)})
+        self.assert_valid(graph)
+
+    def test_remove_node_returns_unblocked(self):
+        graph = DependencyGraph()
+        graph.load([(1, 3), (2, 3), (1, 4), (4, 5)])
+        self.assertEqual(sorted(graph.remove_node(1)), [4])
+        self.assertEqual(graph.predecessors[3], {2})
+        self.assert_valid(graph)
+
+    def test_random_changes_keep_topological_order(self):
+        rng = random.Random(43)
+        graph = DependencyGraph()
+        for _ in range(3000):
+            blocker, todo = rng.randrange(80), rng.randrange(80)
+            action = rng.random()
+            if action < 0.6:
+                would_cycle = blocker == todo or reaches(graph, todo, blocker)
+                before = edges_of(graph)
+                try:
+                    graph.add_edge(blocker, todo)
+                except ValueError:
+                    self.assertTrue(would_cycle)
+                    self.assertEqual(edges_of(graph), before)
+                else:
+                    self.assertFalse(would_cycle)
+            elif action < 0.9:
+                graph.remove_edge(blocker, todo)
+            elif blocker in graph.rank:
+                graph.remove_node(blocker)
+            self.assert_valid(graph)
+
+    def test_large_graph_within_time_bound(self):
+        rng = random.Random(10000)
+        node_count = 12000
+        # 按随机排列给出无环的边，初始载入的顺序与最终拓扑序无关
+        order = list(range(node_count))
+        rng.shuffle(order)
+        edges = []
+        for index in range(1, node_count):
+            for _ in range(2):
+                edges.append((order[rng.randrange(max(0, index - 50), index)], order[index]))
+
+        started = time.perf_counter()
+        graph = DependencyGraph()
+        self.assertEqual(graph.load(edges), [])
+        added = rejected = 0
+        # 大多数新依赖发生在相近的任务之间，少量跨越整个图
+        pairs = [rng.sample(range(node_count), 2) for _ in range(300)]
+        for _ in range(3000):
+            index = rng.randrange(node_count - 100)
+            pairs.append((order[index + rng.randrange(100)], order[index + rng.randrange(100)]))
+        for first, second in pairs:
+            if first == second:
+                continue
+            try:
+                graph.add_edge(first, second)
+                added += 1
+            except ValueError:
+                rejected += 1
+        for blocker, todo in rng.sample(sorted(edges_of(graph)), 1000):
+            graph.remove_edge(blocker, todo)
+        elapsed = time.perf_counter() - started
+
+        self.assertGreater(added, 0)
+        self.assertGreater(rejected, 0)
+        self.assertGreaterEqual(len(graph.rank), 10000)
+        self.assert_valid(graph)
+        self.assertLess(elapsed, 3.0)
+
+
+class SetDependenciesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'todo.db')
+        self.db = Database(self.db_path)
+        today = datetime.now().strftime('%Y-%m-%d')
+        self.a = self.db.add_todo('需求', task_date=today)
+        self.b = self.db.add_todo('设计', task_date=today)
+        self.c = self.db.add_todo('实现', task_date=today)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def stored_edges(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return set(conn.execute('SELECT blocker_id, todo_id FROM todo_dependencies').fetchall())
+        finally:
+            conn.close()
+
+    def test_cycle_raises_and_changes_nothing(self):
+        self.db.set_dependencies(self.b, [self.a])
+        self.db.set_dependencies(self.c, [self.b])
+        with self.assertRaises(ValueError) as context:
+            self.db.set_dependencies(self.a, [self.c])
+        self.assertIn('需求', str(context.exception))
+        self.assertEqual(self.stored_edges(), {(self.a, self.b), (self.b, self.c)})
+        self.assertEqual(self.db.get_blockers(self.a), set())
+
+    def test_self_dependency_raises(self):
+        with self.assertRaises(ValueError):
+            self.db.set_dependencies(self.a, [self.a])
+        self.assertEqual(self.stored_edges(), set())
+
+    def test_failed_replacement_restores_removed_blockers(self):
+        self.db.set_dependencies(self.b, [self.a])
+        self.db.set_dependencies(self.c, [self.b])
+        # 把 b 的前置任务从 a 换成 c 会形成 b → c → b，a 要恢复
+        with self.assertRaises(ValueError):
+            self.db.set_dependencies(self.b, [self.c])
+        self.assertEqual(self.db.get_blockers(self.b), {self.a})
+        self.assertEqual(self.stored_edges(), {(self.a, self.b), (self.b, self.c)})
+
+    def test_replacement_persists(self):
+        self.db.set_dependencies(self.c, [self.a, self.b])
+        self.db.set_dependencies(self.c, [self.b])
+        self.db.set_dependencies(self.a, [self.c])
+        self.assertEqual(self.stored_edges(), {(self.b, self.c), (self.c, self.a)})
+        reloaded = Database(self.db_path)
+        self.assertEqual(reloaded.get_blockers(self.c), {self.b})
+        self.assertEqual(reloaded.get_blockers(self.a), {self.c})
+
+
+if __name__ == '__main__':
+    unittest.main()
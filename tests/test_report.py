@@ -0,0 +1,38 @@
+"""ReportExporter 测试"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import Database, ReportExporter  # noqa: E402
+
+
+class HtmlReportTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'todo.db')
+        self.db = Database(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_fields_escaped(self):
+        # task_date 是文本列，其他工具可能写入任意内容
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO completed_tasks (title, task_date, summary) "
+                     "VALUES ('<b>标题</b>', '2026-10-19<script>', 'a & b')")
+        conn.commit()
+        conn.close()
+        report = ''.join(ReportExporter(self.db).iter_html('2026-10-19', '2026-10-20'))
+        self.assertNotIn('<script>', report)
+        self.assertIn('2026-10-19&lt;script&gt;', report)
+        self.assertIn('&lt;b&gt;标题&lt;/b&gt;', report)
+        self.assertIn('a &amp; b', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""DayScheduler 日程安排测试：固定的当前时间，不依赖界面和数据库"""
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import SCHEDULE_DEFAULTS, DayScheduler, parse_clock  # noqa: E402
+
+HOUR = 3600
+MINUTE = 60
+
+
+def clock(text):
+    return parse_clock(text)
+
+
+class OrderTasksTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DayScheduler(SCHEDULE_DEFAULTS)
+
+    def test_priority_then_list_order(self):
+        tasks = [(1, 0, HOUR), (2, 2, HOUR), (3, 1, HOUR), (4, 2, HOUR)]
+        self.assertEqual(self.scheduler.order_tasks(tasks, {}), [2, 4, 3, 1])
+
+    def test_blockers_before_priority(self):
+        # 高优先级的 2 被低优先级的 1 阻塞，只能排在 1 之后
+        tasks = [(1, 0, HOUR), (2, 3, HOUR), (3, 2, HOUR)]
+        order = self.scheduler.order_tasks(tasks, {2: {1}})
+        self.assertEqual(order, [3, 1, 2])
+
+    def test_unblocked_task_released_by_priority(self):
+        tasks = [(1, 0, HOUR), (2, 1, HOUR), (3, 3, HOUR), (4, 0, HOUR)]
+        order = self.scheduler.order_tasks(tasks, {2: {1}, 3: {1}})
+        self.assertEqual(order, [1, 3, 2, 4])
+
+    def test_blocker_outside_tasks_is_ignored(self):
+        tasks = [(1, 0, HOUR), (2, 1, HOUR)]
+        self.assertEqual(self.scheduler.order_tasks(tasks, {2: {99}}), [2, 1])
+
+    def test_cycle_goes_last_in_list_order(self):
+        tasks = [(1, 3, HOUR), (2, 2, HOUR), (3, 0, HOUR)]
+        order = self.scheduler.order_tasks(tasks, {1: {2}, 2: {1}})
+        self.assertEqual(order, [3, 1, 2])
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DayScheduler(SCHEDULE_DEFAULTS)
+
+    def test_task_split_around_lunch(self):
+        tasks = [(1, 0, 2 * HOUR), (2, 0, 30 * MINUTE)]
+        self.assertTrue(self.scheduler.plan(tasks, clock('11:00')))
+        self.assertEqual(self.scheduler.entries[1], (clock('11:00'), clock('14:00'), 0))
+        self.assertEqual(self.scheduler.entries[2], (clock('14:00'), clock('14:30'), 0))
+        self.assertEqual(self.scheduler.overflow, 0)
+
+    def test_task_starting_in_lunch_waits_for_break_end(self):
+        self.scheduler.plan([(1, 0, HOUR)], clock('12:20'))
+        self.assertEqual(self.scheduler.entries[1], (clock('13:00'), clock('14:00'), 0))
+
+    def test_before_work_starts_at_work_start(self):
+        self.scheduler.plan([(1, 0, HOUR)], clock('07:30'))
+        self.assertEqual(self.scheduler.entries[1], (clock('09:00'), clock('10:00'), 0))
+
+    def test_appointments_are_skipped(self):
+        appointments = [(clock('14:00'), clock('15:00'))]
+        self.scheduler.plan([(1, 0, 2 * HOUR)], clock('13:30'), appointments)
+        self.assertEqual(self.scheduler.entries[1], (clock('13:30'), clock('16:30'), 0))
+
+    def test_blocked_task_scheduled_after_blocker(self):
+        tasks = [(1, 0, HOUR), (2, 3, HOUR)]
+        self.scheduler.plan(tasks, clock('09:00'), blockers={2: {1}})
+        self.assertEqual(self.scheduler.entries[1], (clock('09:00'), clock('10:00'), 0))
+        self.assertEqual(self.scheduler.entries[2], (clock('10:00'), clock('11:00'), 0))
+
+    def test_overflow_past_work_end(self):
+        tasks = [(1, 1, 2 * HOUR), (2, 0, HOUR)]
+        self.scheduler.plan(tasks, clock('17:00'))
+        self.assertEqual(self.scheduler.entries[1], (clock('17:00'), clock('18:00'), HOUR))
+        self.assertEqual(self.scheduler.entries[2], (clock('18:00'), clock('18:00'), HOUR))
+        self.assertEqual(self.scheduler.overflow, 2 * HOUR)
+
+    def test_after_work_everything_overflows(self):
+        self.scheduler.plan([(1, 0, HOUR), (2, 0, 0)], clock('19:00'))
+        self.assertEqual(self.scheduler.overflow, HOUR)
+        self.assertEqual(self.scheduler.entries[1][2], HOUR)
+        self.assertEqual(self.scheduler.entries[2][2], 0)
+
+
+class ReplanTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DayScheduler(SCHEDULE_DEFAULTS)
+        self.tasks = [(1, 0, HOUR), (2, 0, HOUR), (3, 0, HOUR)]
+
+    def test_same_minute_is_not_repacked(self):
+        self.scheduler.plan(self.tasks, clock('09:00'))
+        self.assertFalse(self.scheduler.replan(clock('09:00') + 30))
+        self.assertTrue(self.scheduler.replan(clock('09:01')))
+        self.assertEqual(self.scheduler.entries[1][0], clock('09:01'))
+
+    def test_active_task_goes_first(self):
+        self.scheduler.plan(self.tasks, clock('09:00'), active_id=3, active_remaining=HOUR)
+        self.assertEqual(self.scheduler.entries[3], (clock('09:00'), clock('10:00'), 0))
+        self.assertEqual(self.scheduler.entries[1], (clock('10:00'), clock('11:00'), 0))
+
+    def test_replan_during_session(self):
+        self.scheduler.plan(self.tasks, clock('09:00'), active_id=1, active_remaining=HOUR)
+        # 计时 20 分钟后，剩余 40 分钟，后面的任务不变
+        self.assertTrue(self.scheduler.replan(clock('09:20'), 1, 40 * MINUTE))
+        self.assertEqual(self.scheduler.entries[1], (clock('09:20'), clock('10:00'), 0))
+        self.assertEqual(self.scheduler.entries[2], (clock('10:00'), clock('11:00'), 0))
+
+    def test_overrun_pushes_later_tasks(self):
+        self.scheduler.plan(self.tasks, clock('09:00'), active_id=1, active_remaining=HOUR)
+        # 超出预估后剩余为 0，后面的任务从现在开始顺延
+        self.scheduler.replan(clock('10:30'), 1, 0)
+        self.assertEqual(self.scheduler.entries[1], (clock('10:30'), clock('10:30'), 0))
+        self.assertEqual(self.scheduler.entries[2], (clock('10:30'), clock('11:30'), 0))
+        self.assertEqual(self.scheduler.entries[3], (clock('11:30'), clock('13:30'), 0))
+
+    def test_plan_after_session_uses_reduced_remaining(self):
+        self.scheduler.plan(self.tasks, clock('09:00'))
+        # 任务 1 计时 45 分钟后停止，重新安排时剩余 15 分钟
+        tasks = [(1, 0, 15 * MINUTE)] + self.tasks[1:]
+        self.scheduler.plan(tasks, clock('09:45'))
+        self.assertEqual(self.scheduler.entries[1], (clock('09:45'), clock('10:00'), 0))
+        self.assertEqual(self.scheduler.entries[3], (clock('11:00'), clock('12:00'), 0))
+
+    def test_finished_active_task_left_out(self):
+        self.scheduler.plan(self.tasks[1:], clock('09:00'), active_id=1, active_remaining=HOUR)
+        self.assertNotIn(1, self.scheduler.entries)
+        self.assertEqual(self.scheduler.entries[2], (clock('09:00'), clock('10:00'), 0))
+
+
+class SchedulerTimingTest(unittest.TestCase):
+    def test_several_hundred_tasks(self):
+        rng = random.Random(20240101)
+        tasks = [(task_id, rng.randint(0, 3), rng.randint(1, 12) * 5 * MINUTE) for task_id in range(1, 601)]
+        blockers = {}
+        for task_id in range(2, 601):
+            if rng.random() < 0.3:
+                blockers[task_id] = {rng.randint(1, task_id - 1)}
+        scheduler = DayScheduler(dict(SCHEDULE_DEFAULTS, schedule_breaks='10:30-10:45, 12:00-13:00, 15:30-15:45'))
+        appointments = [(clock('14:00'), clock('14:30')), (clock('16:00'), clock('17:00'))]
+
+        started = time.perf_counter()
+        for minute in range(60):
+            scheduler.plan(tasks, clock('09:00') + minute * MINUTE, appointments, blockers,
+                           active_id=1, active_remaining=HOUR)
+        for second in range(600):
+            scheduler.replan(clock('10:00') + second, 1, HOUR - second)
+        elapsed = time.perf_counter() - started
+
+        order = scheduler.order
+        self.assertEqual(sorted(order), list(range(1, 601)))
+        position = {task_id: index for index, task_id in enumerate(order)}
+        for task_id, blocked_by in blockers.items():
+            for blocker_id in blocked_by:
+                self.assertLess(position[blocker_id], position[task_id])
+        self.assertGreater(scheduler.overflow, 0)
+        # 60 次完整安排 + 10 分钟的逐秒重排，远低于界面每秒刷新的预算
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
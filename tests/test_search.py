@@ -0,0 +1,71 @@
+"""FuzzyIndex 排名和命令面板索引数据测试"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app_v2 import Database, FuzzyIndex  # noqa: E402
+
+TITLES = ['写周报', 'review code', 'code review', 'weekly report', 'read book', 'reply email', 'deploy api']
+
+
+class FuzzyIndexTest(unittest.TestCase):
+    def build(self, scan):
+        index = FuzzyIndex(group_count=2)
+        if scan:
+            # 强制走分块扫描路径
+            index.INTERSECT_LIMIT = 0
+            index.CHUNK_SIZE = 2
+        for number, title in enumerate(TITLES):
+            index.add(number, title, None, number % 2)
+        return index
+
+    def assert_both_paths(self, query, expected, limit=20):
+        for scan in (False, True):
+            with self.subTest(scan=scan):
+                self.assertEqual([title for key, title, data in self.build(scan).search(query, limit)], expected)
+
+    def test_prefix_before_substring_before_fuzzy(self):
+        # 同档内分组靠前、标题较短的优先
+        self.assert_both_paths('re', ['read book', 'review code', 'reply email', 'code review', 'weekly report'])
+        self.assert_both_paths('rc', ['review code'])
+
+    def test_limit_keeps_prefix_matches(self):
+        self.assert_both_paths('re', ['read book', 'review code'], limit=2)
+
+    def test_fuzzy_span(self):
+        # "e...o" 在 deploy api 中跨度比 read book 短
+        self.assert_both_paths('eo', ['deploy api', 'read book', 'review code', 'weekly report'])
+
+    def test_no_match(self):
+        self.assert_both_paths('zz', [])
+        self.assert_both_paths('周报x', [])
+
+    def test_remove(self):
+        index = self.build(True)
+        index.remove(1)
+        self.assertEqual([key for key, title, data in index.search('review')], [2])
+
+
+class SearchItemsTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.temp_dir, 'todo.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_only_today_and_later_todos(self):
+        today = datetime.now()
+        for offset in (-1, 0, 1):
+            self.db.add_todo(f'task {offset}', task_date=(today + timedelta(days=offset)).strftime('%Y-%m-%d'))
+        titles = sorted(title for todo_id, title, task_date in self.db.get_search_items()['todos'])
+        self.assertEqual(titles, ['task 0', 'task 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
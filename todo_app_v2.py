@@ -3,13 +3,33 @@
 功能：今日任务清单、任务计时、完成总结、历史复盘
 """
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-from datetime import datetime, timedelta
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import threading
 import time
 import os
 import sys
+import argparse
+import contextlib
+import gzip
+import shutil
+import tempfile
+import csv
+import html
+import io
+import json
+import queue
+import bisect
+import heapq
+import re
+import gc
+import statistics
+import tracemalloc
+import uuid
+import cProfile
+import pstats
+from array import array
 
 if sys.platform == 'win32':
     from win10toast import ToastNotifier
@@ -17,19 +37,543 @@ if sys.platform == 'win32':
 # 数据库路径
 DB_PATH = os.path.join(os.path.expanduser('~'), 'todo_reminder_v2.db')
 
+# 已完成任务在主库中保留的天数，更早的记录移入归档库
+ARCHIVE_RETENTION_DAYS = 180
+# 后台维护（归档、增量清理、ANALYZE）的首次延迟和间隔（毫秒）
+MAINTENANCE_DELAY_MS = 60 * 1000
+MAINTENANCE_INTERVAL_MS = 6 * 60 * 60 * 1000
+# 每次增量清理最多释放的空闲页数
+INCREMENTAL_VACUUM_PAGES = 2000
+
+# 自动备份的首次延迟和间隔（毫秒）、保留份数
+BACKUP_DELAY_MS = 5 * 60 * 1000
+BACKUP_INTERVAL_MS = 12 * 60 * 60 * 1000
+BACKUP_KEEP = 10
+# 备份是否压缩
+BACKUP_COMPRESS = True
+# 在线备份每一步复制的页数，以及每步之间让出的时间（秒）
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.002
+
+# 通知合并：收到第一条通知后等待的秒数（期间的通知合并为一条摘要）、两次弹出通知的最小间隔（秒）、
+# 摘要中最多列出的条数、单条通知的显示秒数
+NOTIFY_COALESCE_SECONDS = 1.5
+NOTIFY_MIN_INTERVAL_SECONDS = 10
+NOTIFY_DIGEST_LINES = 4
+NOTIFY_TOAST_DURATION = 5
+# 退出时等待已入队通知发出的最长秒数（Windows 通知在显示期间阻塞发送线程）
+NOTIFY_CLOSE_TIMEOUT = NOTIFY_TOAST_DURATION + 1
+
+# 事件总线：每个异步订阅者的队列长度、队列满时发布方最多等待的秒数（超时后丢弃这条事件）
+EVENT_QUEUE_SIZE = 256
+EVENT_PUT_TIMEOUT = 0.2
+# 检查是否已经过了零点（换天后生成当天的重复任务、刷新列表）的间隔（毫秒）
+DAY_ROLLOVER_CHECK_MS = 60 * 1000
+
+# 任务生命周期事件及其携带的字段（发布时校验，订阅者可以直接取用）
+EVENT_FIELDS = {
+    'task_added': ('todo_id', 'title', 'task_date'),
+    'task_updated': ('todo_id', 'title', 'task_date'),
+    'task_deleted': ('todo_id',),
+    'task_started': ('todo_id', 'session_id', 'session_type'),
+    'task_paused': ('todo_id', 'session_id'),
+    'task_resumed': ('todo_id', 'session_id'),
+    'task_stopped': ('todo_id', 'session_id', 'duration'),
+    # requested 为 False 表示随父任务一起完成的子任务
+    'task_completed': ('todo_id', 'completed_task_id', 'title', 'task_date', 'total_duration',
+                       'estimated_duration', 'priority', 'repeat_template_id', 'requested'),
+    'tasks_imported': ('todos', 'templates'),
+    'template_saved': ('template_id', 'title'),
+    'template_deleted': ('template_id',),
+    'dependencies_changed': ('todo_id',),
+    'day_rolled_over': ('date', 'previous_date', 'recurring'),
+}
+
+# 需要刷新任务列表的事件
+VIEW_EVENTS = ('task_added', 'task_updated', 'task_deleted', 'task_stopped', 'task_completed', 'tasks_imported',
+               'dependencies_changed', 'day_rolled_over')
+
+# 浸泡测试（--soak）：每个模拟日的操作轮数、开始检查增长前的预热天数，以及预热后各项指标每天允许的增长
+# （Tk 控件、待执行的 after 任务和 Tcl 命令不允许增长，内存允许少量碎片）
+SOAK_ROUNDS_PER_DAY = 10
+SOAK_WARMUP_DAYS = 3
+SOAK_GROWTH_LIMITS = {
+    'rss_kb': 1024,
+    'traced_kb': 256,
+    'objects': 1000,
+    'widgets': 0,
+    'after_jobs': 0,
+    'tcl_commands': 0,
+}
+
+# 界面卡顿分析（隐藏快捷键或 --profile 开关）：主线程调用栈的采样间隔（秒）、汇总中列出的条数
+PROFILE_HOTKEY = '<Control-Shift-F12>'
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOP_N = 30
+
+# 报告中优先级的显示名称
+PRIORITY_NAMES = ['普通', '重要', '紧急']
+# 日历导出时本应用生成的 UID 后缀（如 todo-12@todo-reminder），导入时据此识别已有的任务
+ICAL_UID_DOMAIN = 'todo-reminder'
+
+# 任务列表左侧色条的优先级颜色
+PRIORITY_COLORS = ['#C8C8C8', '#FF9800', '#E53935']
+
+# 删除的任务先保留为墓碑（可撤销），超过保留天数后由后台维护清除；撤销日志最多保留的条数
+TOMBSTONE_RETENTION_DAYS = 7
+UNDO_JOURNAL_MAX = 200
+
+# 外键约束：(表, 列) -> (引用的表, 删除时的动作)。旧数据库启动时按此重建表，孤立记录按同样的动作修复
+FOREIGN_KEYS = {
+    ('todos', 'parent_id'): ('todos', 'SET NULL'),
+    ('todos', 'repeat_template_id'): ('repeat_templates', 'SET NULL'),
+    ('task_sessions', 'todo_id'): ('todos', 'CASCADE'),
+    ('task_sessions', 'completed_task_id'): ('completed_tasks', 'CASCADE'),
+    ('timer_pauses', 'session_id'): ('task_sessions', 'CASCADE'),
+    ('todo_tags', 'todo_id'): ('todos', 'CASCADE'),
+    ('todo_tags', 'tag_id'): ('tags', 'CASCADE'),
+    ('template_tags', 'template_id'): ('repeat_templates', 'CASCADE'),
+    ('template_tags', 'tag_id'): ('tags', 'CASCADE'),
+    ('completed_task_tags', 'completed_task_id'): ('completed_tasks', 'CASCADE'),
+    ('todo_dependencies', 'todo_id'): ('todos', 'CASCADE'),
+    ('todo_dependencies', 'blocker_id'): ('todos', 'CASCADE'),
+    ('undo_journal', 'todo_id'): ('todos', 'CASCADE'),
+}
+
+# 手动排序：相邻任务排序键的最小间距，低于此值时重新编号
+SORT_KEY_MIN_GAP = 1e-9
+
+# 效率分析缓存的最大条数，移动平均的窗口天数
+ANALYTICS_CACHE_SIZE = 16
+MOVING_AVERAGE_DAYS = 7
+
+# 标题自动补全：最多记住的标题数，每个标题保留的最近完成记录数
+TITLE_SUGGEST_MAX_TITLES = 5000
+TITLE_SUGGEST_SAMPLES = 20
+
+# 用时预测：每个标题/模板保留的最近实际/预估比值个数、生效所需的最少样本数、最多记住的键数
+ESTIMATE_SAMPLES = 20
+ESTIMATE_MIN_SAMPLES = 3
+ESTIMATE_MAX_KEYS = 5000
+# 启动时最多读取的历史记录数（只影响启动耗时，之后增量更新）
+ESTIMATE_HISTORY_ROWS = 20000
+# 单个比值的取值范围，避免极端记录（如忘记暂停）影响预测
+ESTIMATE_RATIO_RANGE = (0.25, 4.0)
+
+# 番茄钟默认设置（可在界面中修改，保存在 settings 表）：专注/短休息/长休息分钟数、
+# 每几个番茄一次长休息、阶段结束后是否自动进入下一阶段
+POMODORO_DEFAULTS = {
+    'pomodoro_work_minutes': 25,
+    'pomodoro_short_break_minutes': 5,
+    'pomodoro_long_break_minutes': 15,
+    'pomodoro_long_break_every': 4,
+    'pomodoro_auto_continue': 0,
+}
+
+# 日程安排默认设置（可在界面中修改，保存在 settings 表）：上下班时间、休息时段（逗号分隔）、
+# 没填预估的任务按多少分钟安排
+SCHEDULE_DEFAULTS = {
+    'schedule_work_start': '09:00',
+    'schedule_work_end': '18:00',
+    'schedule_breaks': '12:00-13:00',
+    'schedule_default_minutes': 30,
+}
+
+# 多个计时器同时运行时重叠时段计入用时的方式（可在界面中修改，保存在 settings 表）：
+# full 每个任务都记全部时长，split 重叠时段按同时在计时的任务数平分
+TIMER_DEFAULTS = {
+    'timer_overlap_attribution': 'full',
+}
+TIMER_OVERLAP_MODES = {
+    'full': "各自记全部时长（后台任务和专注任务都算满）",
+    'split': "重叠时段平分（两个任务同时计时 1 小时各记 30 分钟）",
+}
+
+# 计时记录类型：普通计时、番茄专注、番茄休息（休息不计入任务用时）
+SESSION_NORMAL = 0
+SESSION_WORK = 1
+SESSION_BREAK = 2
+
+
+def active_spans(start, end, pauses):
+    """计时区间 [start, end] 去掉暂停后的有效区间（时间戳秒），pauses 为 [(暂停, 恢复或 None)]"""
+    spans = []
+    position = start
+    for paused_at, resumed_at in sorted(pauses):
+        if paused_at > position:
+            spans.append((position, min(paused_at, end)))
+        position = max(position, end if resumed_at is None else resumed_at)
+        if position >= end:
+            break
+    if position < end:
+        spans.append((position, end))
+    return [(a, b) for a, b in spans if b > a]
+
+
+def split_overlap(spans, others):
+    """重叠时段平分时 spans 应计的秒数：每一时刻除以同时在计时的记录数（含自身），others 为其他记录的有效区间列表"""
+    events = sorted((t, delta) for other in others for a, b in other for t, delta in ((a, 1), (b, -1)))
+    total = 0.0
+    concurrent = 0
+    i = 0
+    for start, end in sorted(spans):
+        while i < len(events) and events[i][0] <= start:
+            concurrent += events[i][1]
+            i += 1
+        position = start
+        while i < len(events) and events[i][0] < end:
+            moment, delta = events[i]
+            total += (moment - position) / (1 + concurrent)
+            position = moment
+            concurrent += delta
+            i += 1
+        total += (end - position) / (1 + concurrent)
+    return total
+
+
+def current_rss_kb():
+    """当前进程的常驻内存（KB）；无法读取时退回峰值，仍不可用时返回 0"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                        'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                     ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize // 1024
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    except ImportError:
+        return 0
+
+
+def parse_clock(text):
+    """把 "9:30" / "09:30" 解析为当天的秒数，格式不对时抛出 ValueError"""
+    match = re.match(r'^\s*(\d{1,2})[:：](\d{2})\s*$', text or '')
+    if not match or int(match.group(1)) > 24 or int(match.group(2)) > 59:
+        raise ValueError(f'时间格式应为 HH:MM: {text}')
+    return min(int(match.group(1)) * 3600 + int(match.group(2)) * 60, 24 * 3600)
+
+
+def format_clock(seconds):
+    """当天的秒数格式化为 HH:MM"""
+    return f"{int(seconds) // 3600:02d}:{int(seconds) % 3600 // 60:02d}"
+
+
+def parse_tags(text):
+    """把 "工作, 学习 #读书" 之类的输入拆成去重后的标签列表（保持输入顺序）"""
+    names = []
+    for name in re.split(r'[,，;；#\s]+', text or ''):
+        if name and name.lower() not in (n.lower() for n in names):
+            names.append(name)
+    return names
+
+
+def format_duration(seconds):
+    """格式化时长显示"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+
+    if hours > 0:
+        return f"{hours}小时{minutes}分"
+    elif minutes > 0:
+        return f"{minutes}分钟"
+    else:
+        return f"{secs}秒"
+
+
+class Todo:
+    """待办任务记录
+
+    total_duration 之后是查询时汇总的字段：本任务已计时长、在树中的层级、
+    含子任务（包括已完成的子任务）的总时长、子任务总数和已完成数、标签（空格分隔）、
+    还没完成的前置任务数
+    """
+    __slots__ = ('id', 'title', 'description', 'task_date', 'estimated_duration', 'priority', 'status',
+                 'repeat_type', 'repeat_template_id', 'created_at', 'notified', 'sort_key', 'parent_id',
+                 'total_duration', 'depth', 'rollup_duration', 'subtask_total', 'subtask_done', 'tags', 'blocked')
+    COMPUTED_FIELDS = ('total_duration', 'depth', 'rollup_duration', 'subtask_total', 'subtask_done', 'tags',
+                       'blocked')
+
+    def __init__(self, id, title, description, task_date, estimated_duration, priority, status,
+                 repeat_type, repeat_template_id, created_at, notified, sort_key, parent_id=None,
+                 total_duration=0, depth=0, rollup_duration=None, subtask_total=0, subtask_done=0, tags='',
+                 blocked=0):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.task_date = task_date
+        self.estimated_duration = estimated_duration or 0
+        self.priority = priority or 0
+        self.status = status or 0
+        self.repeat_type = repeat_type or 0
+        self.repeat_template_id = repeat_template_id
+        self.created_at = created_at
+        self.notified = notified
+        self.sort_key = sort_key
+        self.parent_id = parent_id
+        self.total_duration = total_duration or 0
+        self.depth = depth or 0
+        self.rollup_duration = self.total_duration if rollup_duration is None else rollup_duration
+        self.subtask_total = subtask_total or 0
+        self.subtask_done = subtask_done or 0
+        self.tags = tags or ''
+        self.blocked = blocked or 0
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """用作 sqlite3 的 row_factory"""
+        return cls(*row)
+
+    @property
+    def progress(self):
+        """子任务完成比例，没有子任务时为 None"""
+        if not self.subtask_total:
+            return None
+        return self.subtask_done / self.subtask_total
+
+    def __repr__(self):
+        return f'Todo(id={self.id!r}, title={self.title!r}, task_date={self.task_date!r})'
+
+
+class Session:
+    """计时记录"""
+    __slots__ = ('id', 'todo_id', 'start_time', 'end_time', 'duration', 'summary', 'completed_task_id',
+                 'session_type')
+
+    def __init__(self, id, todo_id, start_time, end_time, duration, summary, completed_task_id, session_type):
+        self.id = id
+        self.todo_id = todo_id
+        self.start_time = start_time
+        self.end_time = end_time
+        self.duration = duration or 0
+        self.summary = summary
+        self.completed_task_id = completed_task_id
+        self.session_type = session_type or SESSION_NORMAL
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """用作 sqlite3 的 row_factory"""
+        return cls(*row)
+
+    def __repr__(self):
+        return f'Session(id={self.id!r}, todo_id={self.todo_id!r}, start_time={self.start_time!r})'
+
+
+class CompletedTask:
+    """已完成任务记录"""
+    __slots__ = ('id', 'title', 'description', 'task_date', 'completed_at', 'total_duration', 'priority',
+                 'summary', 'estimated_duration', 'repeat_template_id', 'todo_id', 'parent_id')
+
+    def __init__(self, id, title, description, task_date, completed_at, total_duration, priority,
+                 summary, estimated_duration, repeat_template_id, todo_id, parent_id):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.task_date = task_date
+        self.completed_at = completed_at
+        self.total_duration = total_duration or 0
+        self.priority = priority or 0
+        self.summary = summary
+        self.estimated_duration = estimated_duration or 0
+        self.repeat_template_id = repeat_template_id
+        self.todo_id = todo_id
+        self.parent_id = parent_id
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """用作 sqlite3 的 row_factory"""
+        return cls(*row)
+
+    def __repr__(self):
+        return f'CompletedTask(id={self.id!r}, title={self.title!r}, task_date={self.task_date!r})'
+
+
+# 各表查询时使用的显式列（与记录类字段顺序一致，主库和归档库共用）
+TODO_COLUMNS = ', '.join(name for name in Todo.__slots__ if name not in Todo.COMPUTED_FIELDS)
+DAY_COLUMNS = ', '.join('day.' + name for name in Todo.__slots__ if name not in Todo.COMPUTED_FIELDS)
+SESSION_COLUMNS = ', '.join(Session.__slots__)
+COMPLETED_TASK_COLUMNS = ', '.join(CompletedTask.__slots__)
+
+# 重复任务在某天的虚拟实例：不写入 todos 表，查询时由模板 t 生成（id 为模板 id 的相反数），
+# 开始计时、编辑、完成或删除时才写入（见 Database.materialize）。排在当天已有任务之后
+OCCURRENCE_FIELDS = {
+    'id': '-t.id',
+    'task_date': ':today',
+    'status': '0',
+    'repeat_template_id': 't.id',
+    'created_at': 'CURRENT_TIMESTAMP',
+    'notified': '0',
+    'sort_key': '(SELECT COALESCE(MAX(sort_key), 0) + 1 FROM todos WHERE task_date = :today AND deleted_at IS NULL)',
+    'parent_id': 'NULL',
+}
+OCCURRENCE_COLUMNS = ', '.join(OCCURRENCE_FIELDS.get(name, 't.' + name) for name in TODO_COLUMNS.split(', '))
+# 模板 t 在 :today 有虚拟实例：按重复类型当天要做，且当天还没有它的任务（包括删除后可撤销的）或完成记录
+OCCURRENCE_FILTER = '''
+    t.deleted_at IS NULL
+    AND (t.repeat_type = 1 OR (t.repeat_type = 2 AND strftime('%w', :today) NOT IN ('0', '6')))
+    AND NOT EXISTS (SELECT 1 FROM todos m WHERE m.repeat_template_id = t.id AND m.task_date = :today)
+    AND NOT EXISTS (SELECT 1 FROM completed_tasks c WHERE c.repeat_template_id = t.id AND c.task_date = :today)
+'''
+
+
+class Event:
+    """事件总线上的一条事件"""
+    __slots__ = ('type', 'data', 'time')
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+        self.time = time.time()
+
+    def __repr__(self):
+        return f'Event(type={self.type!r}, data={self.data!r})'
+
+
+class EventSubscription:
+    """一个订阅者：同步订阅在发布线程中直接调用，异步订阅经有界队列交给自己的后台线程"""
+
+    def __init__(self, callback, event_types=None, maxsize=None):
+        self.callback = callback
+        self.event_types = event_types
+        # 队列满、等待超时后丢弃的事件数；丢弃后直到队列清空前不再等待，卡住的订阅者每次最多拖慢发布方一次
+        self.dropped = 0
+        self.saturated = False
+        self.queue = None
+        self.worker = None
+        if maxsize:
+            self.queue = queue.Queue(maxsize)
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+
+    def accepts(self, event_type):
+        return self.event_types is None or event_type in self.event_types
+
+    def deliver(self, event):
+        if self.queue is None:
+            self.callback(event)
+            return
+        try:
+            self.queue.put(event, block=not self.saturated, timeout=EVENT_PUT_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+            self.saturated = True
+
+    def close(self, timeout=None):
+        """处理完已入队的事件后停止后台线程"""
+        if self.worker is not None and self.worker.is_alive():
+            self.queue.put(None)
+            self.worker.join(timeout)
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            if self.queue.empty():
+                self.saturated = False
+            try:
+                self.callback(event)
+            except Exception as e:
+                print(f"警告：处理事件 {event.type} 失败: {e}")
+
+
+class EventBus:
+    """任务生命周期事件总线：Database（含计时记录）发布事件，界面、通知、统计和插件订阅
+
+    同步订阅者在发布事件的线程中按订阅顺序调用，用于必须与数据库保持一致的内存状态；
+    异步订阅者各有一个后台线程和有界队列，队列满时发布方最多等待 EVENT_PUT_TIMEOUT 秒（背压），
+    仍然满就丢弃这条事件并计数，慢订阅者既不会拖住界面，也不会无限占用内存
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, callback, event_types=None, threaded=False, maxsize=EVENT_QUEUE_SIZE):
+        """订阅事件（event_types 为 None 时订阅全部），callback(event)；返回订阅对象，用于取消订阅"""
+        if event_types is not None:
+            unknown = set(event_types) - set(EVENT_FIELDS)
+            if unknown:
+                raise ValueError(f"未知的事件类型: {', '.join(sorted(unknown))}")
+            event_types = frozenset(event_types)
+        subscription = EventSubscription(callback, event_types, maxsize if threaded else None)
+        self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        subscription.close()
+
+    def publish(self, event_type, **data):
+        """发布事件，字段与 EVENT_FIELDS 中的声明不一致时抛出 ValueError"""
+        fields = EVENT_FIELDS.get(event_type)
+        if fields is None:
+            raise ValueError(f"未知的事件类型: {event_type}")
+        if set(data) != set(fields):
+            raise ValueError(f"事件 {event_type} 的字段应为 {', '.join(fields)}")
+        event = Event(event_type, data)
+        # 订阅列表只整体替换，发布过程中增删订阅不影响本次分发
+        for subscription in self.subscriptions:
+            if subscription.accepts(event_type):
+                subscription.deliver(event)
+        return event
+
+    def close(self, timeout=None):
+        """停止所有异步订阅者的后台线程"""
+        for subscription in self.subscriptions:
+            subscription.close(timeout)
+
 
 class Database:
     """数据库操作类"""
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, retention_days=ARCHIVE_RETENTION_DAYS):
         self.db_path = db_path
+        # 归档库与主库放在同一目录，例如 todo_reminder_v2_archive.db
+        self.archive_path = os.path.splitext(db_path)[0] + '_archive.db'
+        self.retention_days = retention_days
+        # 历史数据版本号，完成任务或结束计时后递增，用于让分析缓存失效
+        self.history_version = 0
+        # 任务生命周期事件（界面、通知、统计缓存和插件通过 events.subscribe 订阅）
+        self.events = EventBus()
+        self.events.subscribe(self._on_history_changed, ('task_stopped', 'task_completed'))
+        # 任务依赖图（首次使用时载入，之后随依赖、完成和删除增量维护）
+        self.dependency_graph = None
+        # 最近一次检查换天时的日期（见 roll_over_day）
+        self.active_date = None
         self.init_db()
 
+    def _notify(self, event_type, **data):
+        """发布事件（在提交事务之后调用）"""
+        self.events.publish(event_type, **data)
+
+    def _on_history_changed(self, event):
+        """结束计时或完成任务后历史数据版本号递增"""
+        self.history_version += 1
+
     def init_db(self):
         """初始化数据库"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
+        # 新建的数据库启用增量清理（旧数据库在建表后转换）
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
         # 待办任务表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS todos (
@@ -41,7 +585,7 @@ class Database:
                 priority INTEGER DEFAULT 0,
                 status INTEGER DEFAULT 0,
                 repeat_type INTEGER DEFAULT 0,
-                repeat_template_id INTEGER,
+                repeat_template_id INTEGER REFERENCES repeat_templates(id) ON DELETE SET NULL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 notified INTEGER DEFAULT 0
             )
@@ -77,7 +621,7 @@ class Database:
                 end_time DATETIME,
                 duration INTEGER DEFAULT 0,
                 summary TEXT,
-                FOREIGN KEY (todo_id) REFERENCES todos(id)
+                FOREIGN KEY (todo_id) REFERENCES todos(id) ON DELETE CASCADE
             )
         ''')
 
@@ -95,23 +639,776 @@ class Database:
             )
         ''')
 
+        # 完成历史记录预估时长，计时记录在任务完成后保留并关联到完成历史
+        self._add_column_if_missing(cursor, 'completed_tasks', 'estimated_duration', 'INTEGER DEFAULT 0')
+        self._add_column_if_missing(cursor, 'task_sessions', 'completed_task_id',
+                                    'INTEGER REFERENCES completed_tasks(id) ON DELETE CASCADE')
+        # 完成历史记录来源的重复模板，用于按模板学习用时
+        self._add_column_if_missing(cursor, 'completed_tasks', 'repeat_template_id', 'INTEGER')
+        # 计时记录类型（番茄钟的专注/休息）
+        self._add_column_if_missing(cursor, 'task_sessions', 'session_type', 'INTEGER DEFAULT 0')
+        # 子任务：父任务id；完成历史记录原任务id和父任务id，用于汇总父任务的进度
+        self._add_column_if_missing(cursor, 'todos', 'parent_id', 'INTEGER REFERENCES todos(id) ON DELETE SET NULL')
+        self._add_column_if_missing(cursor, 'completed_tasks', 'todo_id', 'INTEGER')
+        self._add_column_if_missing(cursor, 'completed_tasks', 'parent_id', 'INTEGER')
+
+        # 标签：任务、重复模板、完成历史与标签多对多关联
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE COLLATE NOCASE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS todo_tags (
+                todo_id INTEGER NOT NULL REFERENCES todos(id) ON DELETE CASCADE,
+                tag_id INTEGER NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
+                PRIMARY KEY (todo_id, tag_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS template_tags (
+                template_id INTEGER NOT NULL REFERENCES repeat_templates(id) ON DELETE CASCADE,
+                tag_id INTEGER NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
+                PRIMARY KEY (template_id, tag_id)
+            ) WITHOUT ROWID
+        ''')
+        self._create_completed_task_tags(cursor, 'main')
+
+        # 撤销/重做日志：每条记录保存一次新建/编辑/删除前后的任务状态（JSON），undone=1 表示已撤销、可重做
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS undo_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                action TEXT NOT NULL,
+                todo_id INTEGER NOT NULL REFERENCES todos(id) ON DELETE CASCADE,
+                before_state TEXT NOT NULL,
+                after_state TEXT NOT NULL,
+                children TEXT,
+                created_at DATETIME,
+                undone INTEGER DEFAULT 0
+            )
+        ''')
+
+        # 任务依赖：todo_id 要等 blocker_id 完成后才能开始（完成的任务连同依赖一起删除）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS todo_dependencies (
+                todo_id INTEGER NOT NULL REFERENCES todos(id) ON DELETE CASCADE,
+                blocker_id INTEGER NOT NULL REFERENCES todos(id) ON DELETE CASCADE,
+                PRIMARY KEY (todo_id, blocker_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todo_dependencies_blocker ON todo_dependencies(blocker_id)')
+        # 可以开始的任务：没有未完成（且未删除）的前置任务
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS ready_todos AS
+            SELECT id, title, task_date, priority, parent_id, sort_key FROM todos
+            WHERE deleted_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM todo_dependencies d JOIN todos blocker ON blocker.id = d.blocker_id
+                WHERE d.todo_id = todos.id AND blocker.deleted_at IS NULL
+            )
+        ''')
+
+        # 固定日程（会议等），安排任务时避开
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS appointments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                appt_date DATE NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appt_date, start_time)')
+
+        # 计时暂停区间（resumed_at 为空表示仍在暂停），用于结束时扣除暂停时长和重启后恢复计时器
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS timer_pauses (
+                session_id INTEGER NOT NULL REFERENCES task_sessions(id) ON DELETE CASCADE,
+                paused_at DATETIME NOT NULL,
+                resumed_at DATETIME
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_pauses_session ON timer_pauses(session_id)')
+
+        # 设置表（界面中可修改的选项）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        # 手动排序键：旧数据按原来的优先级顺序编号
+        self._add_column_if_missing(cursor, 'todos', 'sort_key', 'REAL')
+        cursor.execute('SELECT id, task_date FROM todos WHERE sort_key IS NULL ORDER BY task_date, priority DESC, id')
+        unsorted = cursor.fetchall()
+        if unsorted:
+            cursor.execute('SELECT task_date, MAX(sort_key) FROM todos WHERE sort_key IS NOT NULL GROUP BY task_date')
+            next_keys = {task_date: max_key + 1 for task_date, max_key in cursor.fetchall()}
+            updates = []
+            for todo_id, task_date in unsorted:
+                key = next_keys.get(task_date, 1.0)
+                next_keys[task_date] = key + 1
+                updates.append((key, todo_id))
+            cursor.executemany('UPDATE todos SET sort_key=? WHERE id=?', updates)
+
+        # 删除标记（墓碑）：删除的任务、计时记录和模板先保留，可以撤销
+        self._add_column_if_missing(cursor, 'todos', 'deleted_at', 'DATETIME')
+        self._add_column_if_missing(cursor, 'task_sessions', 'deleted_at', 'DATETIME')
+        self._add_column_if_missing(cursor, 'repeat_templates', 'deleted_at', 'DATETIME')
+
+        # 从日历导入的任务和模板记录原 UID，重复导入时跳过
+        self._add_column_if_missing(cursor, 'todos', 'ical_uid', 'TEXT')
+        self._add_column_if_missing(cursor, 'repeat_templates', 'ical_uid', 'TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_ical_uid ON todos(ical_uid) WHERE ical_uid IS NOT NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_repeat_templates_ical_uid '
+                       'ON repeat_templates(ical_uid) WHERE ical_uid IS NOT NULL')
+        # 导入时按原任务 id 查找已完成的 todo-N 条目
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_completed_tasks_todo ON completed_tasks(todo_id) '
+                       'WHERE todo_id IS NOT NULL')
+
+        # 历史和统计查询都按日期过滤，统计所需的列直接从索引读取
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_completed_tasks_date ON completed_tasks(task_date, priority, total_duration)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_sessions_todo ON task_sessions(todo_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_sessions_completed ON task_sessions(completed_task_id)')
+        # 未结束的计时记录（重启后恢复）和与之重叠的记录（重叠时段平分）按结束时间查找
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_sessions_end ON task_sessions(end_time)')
+        cursor.execute('DROP INDEX IF EXISTS idx_task_sessions_start')
+        # 日常查询只看未删除的行，走部分索引；墓碑另建小索引供清理使用
+        cursor.execute('DROP INDEX IF EXISTS idx_task_sessions_stats')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_sessions_live_stats '
+                       'ON task_sessions(start_time, duration, session_type) WHERE deleted_at IS NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_sessions_tombstones '
+                       'ON task_sessions(deleted_at) WHERE deleted_at IS NOT NULL')
+        cursor.execute('DROP INDEX IF EXISTS idx_todos_date_sort')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_live_date_sort '
+                       'ON todos(task_date, sort_key) WHERE deleted_at IS NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_tombstones '
+                       'ON todos(deleted_at, task_date) WHERE deleted_at IS NOT NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_parent ON todos(parent_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todo_tags_tag ON todo_tags(tag_id, todo_id)')
+        # 删除任务和模板时按外键查找引用它们的行
+        cursor.execute('DROP INDEX IF EXISTS idx_todos_repeat_template')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_template_date ON todos(repeat_template_id, task_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_undo_journal_todo ON undo_journal(todo_id)')
+
+        self._migrate_foreign_keys(cursor)
         conn.commit()
+
+        # 旧数据库未启用增量清理，需要完整 VACUUM 一次才能生效。VACUUM 会长时间持有排他锁，
+        # 所以放在启动时（界面打开之前）做，不放进后台维护；被其他连接占用时下次启动再试
+        cursor.execute('PRAGMA auto_vacuum')
+        if cursor.fetchone()[0] != 2:
+            try:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+            except sqlite3.OperationalError as e:
+                print(f"警告：转换为增量清理失败: {e}")
         conn.close()
 
-    def get_today_todos(self):
-        """获取今天的待办任务"""
+    def _connect(self):
+        """打开主库连接（SQLite 的外键约束按连接启用，每个连接都要打开）"""
         conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def _migrate_foreign_keys(self, cursor):
+        """旧数据库升级：外键与 FOREIGN_KEYS 不一致的表先修复孤立记录，再按 SQLite 推荐的步骤重建
+
+        新建表、复制数据、删除旧表、改名，然后恢复索引和视图。
+        连接未启用外键约束，删除旧表不会触发级联。返回重建的表名
+        """
+        expected = {}
+        for (table, column), reference in FOREIGN_KEYS.items():
+            expected.setdefault(table, {})[column] = reference
+        rebuild = []
+        for table, references in expected.items():
+            cursor.execute(f'PRAGMA foreign_key_list({table})')
+            if {row[3]: (row[2], row[6]) for row in cursor.fetchall()} != references:
+                rebuild.append(table)
+        if not rebuild:
+            return rebuild
+
+        repaired = self._repair_references(cursor)
+        if repaired:
+            print(f"警告：升级外键约束时修复了 {sum(repaired.values())} 条孤立记录")
+
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='view' AND sql IS NOT NULL")
+        views = cursor.fetchall()
+        for name, _ in views:
+            cursor.execute(f'DROP VIEW {name}')
+        clause = re.compile(r'(,\s*FOREIGN KEY\s*\(\s*\w+\s*\))?\s*REFERENCES\s+\w+\s*\(\s*\w+\s*\)'
+                            r'(\s+ON\s+(DELETE|UPDATE)\s+(SET\s+NULL|SET\s+DEFAULT|CASCADE|RESTRICT|NO\s+ACTION))*',
+                            re.IGNORECASE)
+        for table in rebuild:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            sql = clause.sub('', cursor.fetchone()[0])
+            end = sql.rindex(')')
+            constraints = ''.join(f', FOREIGN KEY ({column}) REFERENCES {parent}(id) ON DELETE {action}'
+                                  for column, (parent, action) in expected[table].items())
+            sql = re.sub(rf'^CREATE TABLE "?{table}"?', f'CREATE TABLE {table}_new',
+                         sql[:end].rstrip() + constraints + sql[end:])
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                           (table,))
+            indexes = [row[0] for row in cursor.fetchall()]
+            # 自增表保留序号，已删除任务的 id 不会被新任务复用
+            sequence = None
+            if 'AUTOINCREMENT' in sql.upper():
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name=?', (table,))
+                row = cursor.fetchone()
+                sequence = row[0] if row else None
+
+            cursor.execute(sql)
+            cursor.execute(f'INSERT INTO {table}_new SELECT * FROM {table}')
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+            for index_sql in indexes:
+                cursor.execute(index_sql)
+            if sequence is not None:
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name=?', (table,))
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence))
+        for _, view_sql in views:
+            cursor.execute(view_sql)
+
+        cursor.execute('PRAGMA foreign_key_check')
+        if cursor.fetchone() is not None:
+            raise sqlite3.IntegrityError('升级外键约束后仍有孤立记录')
+        return rebuild
+
+    def _orphan_filter(self, column, parent):
+        """引用了不存在的行的条件"""
+        return f'{column} IS NOT NULL AND {column} NOT IN (SELECT id FROM {parent})'
+
+    def _repair_references(self, cursor):
+        """按外键的删除动作删除或置空孤立记录，返回 {(表, 列): 修复的条数}
+
+        未启用外键约束时删除不会级联，删除后可能产生新的孤立记录，所以重复到没有变化为止
+        """
+        repaired = {}
+        changed = True
+        while changed:
+            changed = False
+            for (table, column), (parent, action) in FOREIGN_KEYS.items():
+                condition = self._orphan_filter(column, parent)
+                if action == 'CASCADE':
+                    cursor.execute(f'DELETE FROM {table} WHERE {condition}')
+                else:
+                    cursor.execute(f'UPDATE {table} SET {column}=NULL WHERE {condition}')
+                if cursor.rowcount > 0:
+                    repaired[(table, column)] = repaired.get((table, column), 0) + cursor.rowcount
+                    changed = True
+        return repaired
+
+    def check_integrity(self):
+        """检查数据库：PRAGMA integrity_check 的结果和各外键上的孤立记录，返回问题列表（空列表表示正常）"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA integrity_check')
+        problems = [row[0] for row in cursor.fetchall() if row[0] != 'ok']
+        for (table, column), (parent, action) in FOREIGN_KEYS.items():
+            cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE {self._orphan_filter(column, parent)}')
+            count = cursor.fetchone()[0]
+            if count:
+                problems.append(f'{table}.{column}: {count} 条记录引用了不存在的 {parent}')
+        conn.close()
+        return problems
+
+    def repair_integrity(self):
+        """修复孤立记录（例如外键约束启用之前或其他工具写入的），返回 {(表, 列): 修复的条数}"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        repaired = self._repair_references(cursor)
+        conn.commit()
+        conn.close()
+        return repaired
+
+    def _create_completed_task_tags(self, cursor, schema):
+        """完成历史的标签关联表（主库和归档库共用）
+
+        冗余保存日期和用时：主键 (tag_id, task_date) 用于按标签筛选日期范围，
+        (task_date, tag_id, total_duration) 索引用于按标签统计用时，都不需要回表
+        """
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.completed_task_tags (
+                tag_id INTEGER NOT NULL,
+                task_date TEXT NOT NULL,
+                completed_task_id INTEGER NOT NULL REFERENCES completed_tasks(id) ON DELETE CASCADE,
+                total_duration INTEGER DEFAULT 0,
+                PRIMARY KEY (tag_id, task_date, completed_task_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_completed_task_tags_date '
+                       'ON completed_task_tags(task_date, tag_id, total_duration)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_completed_task_tags_task '
+                       'ON completed_task_tags(completed_task_id)')
+
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        """旧数据库升级：字段不存在时添加"""
+        try:
+            cursor.execute(f"SELECT {column} FROM {table} LIMIT 1")
+        except sqlite3.OperationalError:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connect_history(self, since_date=None):
+        """打开连接，历史查询统一通过临时视图 all_completed_tasks / all_task_sessions
+
+        all_completed_stats 只包含统计用的列，可以走覆盖索引。
+        只有查询范围早于保留期时才挂载归档库，近期查询不受归档影响。
+        已删除任务的计时记录只在主库中，视图把它们排除
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        hot_since = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        needs_archive = since_date is None or since_date < hot_since
+        if needs_archive and os.path.exists(self.archive_path):
+            cursor.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            self._init_archive(cursor)
+            sources = ['main', 'archive']
+        else:
+            sources = ['main']
+
+        live = ' WHERE deleted_at IS NULL'
+        for view, table, columns, main_filter in (
+                ('all_completed_tasks', 'completed_tasks', COMPLETED_TASK_COLUMNS, ''),
+                ('all_completed_stats', 'completed_tasks', 'task_date, priority, total_duration', ''),
+                ('all_task_sessions', 'task_sessions', SESSION_COLUMNS, live),
+                ('all_session_stats', 'task_sessions', 'start_time, duration, session_type', live),
+                ('all_completed_task_tags', 'completed_task_tags',
+                 'tag_id, task_date, completed_task_id, total_duration', '')):
+            selects = [f'SELECT {columns} FROM {source}.{table}' + (main_filter if source == 'main' else '')
+                       for source in sources]
+            cursor.execute(f'CREATE TEMP VIEW {view} AS ' + ' UNION ALL '.join(selects))
+        return conn
+
+    def _init_archive(self, cursor):
+        """初始化归档库表结构（需先挂载为 archive）"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.completed_tasks (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT,
+                task_date TEXT NOT NULL,
+                completed_at DATETIME,
+                total_duration INTEGER DEFAULT 0,
+                priority INTEGER DEFAULT 0,
+                summary TEXT
+            )
+        ''')
+        self._add_column_if_missing(cursor, 'archive.completed_tasks', 'estimated_duration', 'INTEGER DEFAULT 0')
+        self._add_column_if_missing(cursor, 'archive.completed_tasks', 'repeat_template_id', 'INTEGER')
+        self._add_column_if_missing(cursor, 'archive.completed_tasks', 'todo_id', 'INTEGER')
+        self._add_column_if_missing(cursor, 'archive.completed_tasks', 'parent_id', 'INTEGER')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.task_sessions (
+                id INTEGER PRIMARY KEY,
+                todo_id INTEGER,
+                start_time DATETIME,
+                end_time DATETIME,
+                duration INTEGER DEFAULT 0,
+                summary TEXT,
+                completed_task_id INTEGER
+            )
+        ''')
+        self._add_column_if_missing(cursor, 'archive.task_sessions', 'session_type', 'INTEGER DEFAULT 0')
+        self._create_completed_task_tags(cursor, 'archive')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_completed_tasks_date ON completed_tasks(task_date, priority, total_duration)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_completed_tasks_todo ON completed_tasks(todo_id) '
+                       'WHERE todo_id IS NOT NULL')
+        cursor.execute('DROP INDEX IF EXISTS archive.idx_task_sessions_start')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_task_sessions_stats ON task_sessions(start_time, duration, session_type)')
+
+    def archive_completed_tasks(self, retention_days=None):
+        """将超过保留期的已完成任务移入归档库，返回移动的条数"""
+        if retention_days is None:
+            retention_days = self.retention_days
+        cutoff_date = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM completed_tasks WHERE task_date < ?', (cutoff_date,))
+        if cursor.fetchone()[0] == 0:
+            conn.close()
+            return 0
+
+        cursor.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        self._init_archive(cursor)
+
+        # 复制和删除在同一事务中完成，保留原id，主库自增id不会复用。
+        # 先复制完成历史（归档库的标签关联引用它），主库中的计时记录和标签关联随完成历史级联删除
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.completed_tasks ({COMPLETED_TASK_COLUMNS})
+            SELECT {COMPLETED_TASK_COLUMNS} FROM main.completed_tasks WHERE task_date < ?
+        ''', (cutoff_date,))
+        moved = cursor.rowcount
+        cursor.execute('''
+            INSERT OR REPLACE INTO archive.completed_task_tags (tag_id, task_date, completed_task_id, total_duration)
+            SELECT tag_id, task_date, completed_task_id, total_duration FROM main.completed_task_tags
+            WHERE task_date < ?
+        ''', (cutoff_date,))
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.task_sessions ({SESSION_COLUMNS})
+            SELECT {SESSION_COLUMNS} FROM main.task_sessions
+            WHERE completed_task_id IN (SELECT id FROM main.completed_tasks WHERE task_date < ?)
+        ''', (cutoff_date,))
+        cursor.execute('DELETE FROM main.completed_tasks WHERE task_date < ?', (cutoff_date,))
+        conn.commit()
+        conn.close()
+        return moved
+
+    def purge_tombstones(self, retention_days=TOMBSTONE_RETENTION_DAYS):
+        """清除删除超过保留期的任务、计时记录和模板，以及过期的撤销日志，返回清除的任务数
+
+        日志只引用写入之后才删除的任务，所以先按同一时间点清掉日志，剩下的日志都能撤销。
+        计时记录、标签、依赖和撤销日志随任务级联删除，模板的标签随模板级联删除
+        """
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM undo_journal WHERE created_at < ?', (cutoff,))
+        cursor.execute('DELETE FROM undo_journal WHERE id <= (SELECT MAX(id) FROM undo_journal) - ?',
+                       (UNDO_JOURNAL_MAX,))
+        cursor.execute('DELETE FROM todos WHERE deleted_at < ?', (cutoff,))
+        purged = cursor.rowcount
+        # 还有任务（包括未清除的墓碑）引用的模板保留，撤销时还能恢复
+        cursor.execute('''
+            DELETE FROM repeat_templates WHERE deleted_at < ?
+            AND id NOT IN (SELECT repeat_template_id FROM todos WHERE repeat_template_id IS NOT NULL)
+        ''', (cutoff,))
+        conn.commit()
+        conn.close()
+        return purged
+
+    def get_storage_info(self):
+        """获取主库和归档库的大小信息"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA page_size')
+        page_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_count')
+        page_count = cursor.fetchone()[0]
+        cursor.execute('PRAGMA freelist_count')
+        freelist_count = cursor.fetchone()[0]
+        conn.close()
+
+        archive_size = os.path.getsize(self.archive_path) if os.path.exists(self.archive_path) else 0
+        return {
+            'db_size': page_size * page_count,
+            'free_size': page_size * freelist_count,
+            'archive_size': archive_size
+        }
+
+    def run_maintenance(self):
+        """后台维护：归档旧记录、清理孤立记录、增量回收空间并更新统计信息
+
+        启用外键约束后不会再产生孤立记录，这里修复的是旧版本（未启用约束）打开数据库时写入的
+        """
+        archived = self.archive_completed_tasks()
+        tombstones = self.purge_tombstones() + self.purge_stale_occurrences()
+        repaired = sum(self.repair_integrity().values())
+        rebalanced = self.rebalance_sort_keys()
+
+        conn = self._connect()
+        conn.isolation_level = None
+        cursor = conn.cursor()
+
+        # 只做增量回收（未启用增量清理的旧数据库在 init_db 中转换，转换前此语句不起作用）；
+        # executescript 会把语句执行完，execute 每次只回收一页
+        conn.executescript(f'PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES});')
+
+        # 有数据变动时才重新收集查询统计信息
+        if archived or repaired or tombstones:
+            cursor.execute('ANALYZE')
+        else:
+            cursor.execute('PRAGMA optimize')
+        conn.close()
+
+        return {'archived': archived, 'purged_tombstones': tombstones, 'repaired': repaired,
+                'rebalanced_days': rebalanced}
+
+    def get_today_todos(self, tag_ids=None, ready_only=False):
+        """获取今天的待办任务，按树形顺序排列（子任务紧跟在父任务之后），再按依赖调整
+
+        已计时长、层级、含子任务的汇总时长和完成进度都由递归 CTE 在一次查询中算出，
+        今天已完成的子任务（在 completed_tasks 中）也计入父任务的汇总。
+        重复任务还没写入的今天的实例由模板合并进来（id 为负，见 OCCURRENCE_FIELDS）。
+        指定 tag_ids 时只返回带有全部这些标签的任务，ready_only 时只返回可以开始的任务
+        """
+        conn = self._connect()
+        conn.row_factory = Todo.from_row
         cursor = conn.cursor()
         today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT * FROM todos WHERE task_date = ? ORDER BY priority DESC, id', (today,))
+        params = {'today': today}
+        tag_filter = template_filter = ''
+        if tag_ids:
+            tag_filter = f'AND id IN ({self._tag_match_sql("todo_tags", "todo_id", tag_ids, params)})'
+            template_filter = f'AND t.id IN ({self._tag_match_sql("template_tags", "template_id", tag_ids, params)})'
+        if ready_only:
+            tag_filter += ' AND id IN (SELECT id FROM ready_todos)'
+        cursor.execute(f'''
+            WITH RECURSIVE
+            day AS (
+                SELECT {TODO_COLUMNS},
+                       (SELECT COALESCE(SUM(s.duration), 0) FROM task_sessions s
+                        WHERE s.todo_id = todos.id AND s.session_type != 2) AS duration
+                FROM todos WHERE task_date = :today AND deleted_at IS NULL {tag_filter}
+                UNION ALL
+                SELECT {OCCURRENCE_COLUMNS}, 0 FROM repeat_templates t
+                WHERE {OCCURRENCE_FILTER} {template_filter}
+            ),
+            nodes(id, parent_id, duration, done) AS (
+                SELECT id, parent_id, duration, 0 FROM day
+                UNION ALL
+                SELECT todo_id, parent_id, total_duration, 1 FROM completed_tasks
+                WHERE task_date = :today AND parent_id IS NOT NULL
+            ),
+            -- 每个今日任务与它的所有后代（UNION 去重，数据异常出现环时也能结束）
+            closure(ancestor, id) AS (
+                SELECT id, id FROM day
+                UNION
+                SELECT closure.ancestor, nodes.id FROM closure JOIN nodes ON nodes.parent_id = closure.id
+            ),
+            rollup(id, rollup_duration, subtask_total, subtask_done) AS (
+                SELECT closure.ancestor, SUM(nodes.duration), COUNT(*) - 1, SUM(nodes.done)
+                FROM closure JOIN nodes ON nodes.id = closure.id
+                GROUP BY closure.ancestor
+            ),
+            -- 排序键（可能为负的小数）加偏移后格式化为定长文本，逐级拼成路径用于树形排序
+            tree(id, depth, path) AS (
+                SELECT id, 0, printf('%022.10f:%010d', sort_key + 1e6, id) FROM day
+                WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM day)
+                UNION ALL
+                SELECT day.id, tree.depth + 1, tree.path || printf('/%022.10f:%010d', day.sort_key + 1e6, day.id)
+                FROM tree JOIN day ON day.parent_id = tree.id
+                WHERE tree.depth < 32
+            )
+            SELECT {DAY_COLUMNS},
+                   day.duration, tree.depth, rollup.rollup_duration, rollup.subtask_total, rollup.subtask_done,
+                   CASE WHEN day.id > 0
+                        THEN (SELECT group_concat(tags.name, ' ') FROM todo_tags JOIN tags ON tags.id = todo_tags.tag_id
+                              WHERE todo_tags.todo_id = day.id)
+                        ELSE (SELECT group_concat(tags.name, ' ') FROM template_tags JOIN tags ON tags.id = template_tags.tag_id
+                              WHERE template_tags.template_id = -day.id)
+                   END
+            FROM tree
+            JOIN day ON day.id = tree.id
+            JOIN rollup ON rollup.id = tree.id
+            ORDER BY tree.path
+        ''', params)
         todos = cursor.fetchall()
         conn.close()
-        return todos
+        return self._order_by_dependencies(todos)
+
+    def _order_by_dependencies(self, todos):
+        """在树形顺序的基础上让任务排在它的前置任务之后，并填写每个任务未完成的前置任务数
+
+        只在同级之间调整（子树整体移动）：不同子树之间的依赖提升为两棵子树的根在共同父级下的依赖
+        """
+        graph = self.get_dependency_graph()
+        by_id = {todo.id: todo for todo in todos}
+        group_edges = {}
+        chains = {}
+
+        def chain(todo_id):
+            """从今天的顶层任务到 todo_id 的路径"""
+            if todo_id not in chains:
+                parent_id = by_id[todo_id].parent_id
+                chains[todo_id] = (chain(parent_id) if parent_id in by_id else ()) + (todo_id,)
+            return chains[todo_id]
+
+        for todo in todos:
+            blockers = graph.predecessors.get(todo.id)
+            if not blockers:
+                continue
+            todo.blocked = len(blockers)
+            for blocker_id in blockers:
+                if blocker_id not in by_id:
+                    continue
+                before, after = chain(blocker_id), chain(todo.id)
+                level = 0
+                while level < len(before) and level < len(after) and before[level] == after[level]:
+                    level += 1
+                # 祖先与后代之间的依赖不影响顺序
+                if level < len(before) and level < len(after):
+                    parent_key = before[level - 1] if level else None
+                    group_edges.setdefault(parent_key, []).append((before[level], after[level]))
+        if not group_edges:
+            return todos
+
+        children = {}
+        for todo in todos:
+            parent_key = todo.parent_id if todo.parent_id in by_id else None
+            children.setdefault(parent_key, []).append(todo.id)
+        ordered = []
+
+        def walk(parent_key):
+            group = children.get(parent_key, [])
+            if parent_key in group_edges:
+                group = DependencyGraph.linearize(group, group_edges[parent_key], lambda item: by_id[item].priority)
+            for todo_id in group:
+                ordered.append(by_id[todo_id])
+                walk(todo_id)
+
+        walk(None)
+        return ordered
+
+    def get_dependency_graph(self):
+        """任务依赖图（只含未删除的任务），首次使用时载入"""
+        if self.dependency_graph is None:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT d.blocker_id, d.todo_id
+                FROM todo_dependencies d
+                JOIN todos ON todos.id = d.todo_id AND todos.deleted_at IS NULL
+                JOIN todos blocker ON blocker.id = d.blocker_id AND blocker.deleted_at IS NULL
+            ''')
+            graph = DependencyGraph()
+            rejected = graph.load(cursor.fetchall())
+            if rejected:
+                # 撤销删除后可能与期间新加的依赖形成环，去掉形成环的依赖
+                cursor.executemany('DELETE FROM todo_dependencies WHERE blocker_id=? AND todo_id=?', rejected)
+                conn.commit()
+            conn.close()
+            self.dependency_graph = graph
+        return self.dependency_graph
+
+    def get_blockers(self, todo_id):
+        """任务还没完成的前置任务 id"""
+        return set(self.get_dependency_graph().predecessors.get(todo_id, ()))
+
+    def set_dependencies(self, todo_id, blocker_ids):
+        """把任务的前置任务设为 blocker_ids，会形成循环依赖时抛出 ValueError 且不做任何修改"""
+        todo_id = self.materialize(todo_id)
+        blocker_ids = [self.materialize(blocker_id) for blocker_id in blocker_ids]
+        graph = self.get_dependency_graph()
+        current = set(graph.predecessors.get(todo_id, ()))
+        blocker_ids = set(blocker_ids)
+        added = blocker_ids - current
+        removed = current - blocker_ids
+
+        for blocker_id in removed:
+            graph.remove_edge(blocker_id, todo_id)
+        applied = []
+        try:
+            for blocker_id in sorted(added):
+                graph.add_edge(blocker_id, todo_id)
+                applied.append(blocker_id)
+        except ValueError as e:
+            for blocker_id in applied:
+                graph.remove_edge(blocker_id, todo_id)
+            for blocker_id in removed:
+                graph.add_edge(blocker_id, todo_id)
+            raise ValueError(f"会形成循环依赖：{self._describe_cycle(e.args[0])}") from None
+
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM todo_dependencies WHERE todo_id=? AND blocker_id=?',
+                           [(todo_id, blocker_id) for blocker_id in removed])
+        cursor.executemany('INSERT OR IGNORE INTO todo_dependencies (todo_id, blocker_id) VALUES (?, ?)',
+                           [(todo_id, blocker_id) for blocker_id in added])
+        conn.commit()
+        conn.close()
+        if added or removed:
+            self._notify('dependencies_changed', todo_id=todo_id)
 
-    def add_todo(self, title, description='', task_date='', estimated_duration=0, priority=0, repeat_type=0):
-        """添加待办任务"""
-        conn = sqlite3.connect(self.db_path)
+    def _describe_cycle(self, path):
+        """把环上的任务 id 列表格式化为 A → B → A 的形式"""
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.execute(f'SELECT id, title FROM todos WHERE id IN ({",".join("?" * len(path))})', path)
+        titles = dict(cursor.fetchall())
+        conn.close()
+        return ' → '.join(titles.get(todo_id, str(todo_id)) for todo_id in path)
+
+    def materialize(self, todo_id):
+        """把重复任务的虚拟实例（id 为负）写入 todos 表并返回真实 id，真实任务的 id 原样返回
+
+        修改任务的方法都会先调用；界面在需要保存 id 的地方（计时器）也直接调用。
+        今天已有该模板的任务时返回已有的，模板已删除或今天不用做时抛出 ValueError
+        """
+        if todo_id is None or todo_id > 0:
+            return todo_id
+        template_id = -todo_id
+        params = {'today': datetime.now().strftime('%Y-%m-%d'), 'template_id': template_id}
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM todos WHERE repeat_template_id = :template_id AND task_date = :today '
+                       'AND deleted_at IS NULL', params)
+        row = cursor.fetchone()
+        if row:
+            conn.close()
+            return row[0]
+
+        columns = [name for name in TODO_COLUMNS.split(', ') if name not in ('id', 'created_at')]
+        cursor.execute(f'''
+            INSERT INTO todos ({', '.join(columns)})
+            SELECT {', '.join(OCCURRENCE_FIELDS.get(name, 't.' + name) for name in columns)}
+            FROM repeat_templates t WHERE t.id = :template_id AND {OCCURRENCE_FILTER}
+        ''', params)
+        if cursor.rowcount == 0:
+            conn.close()
+            raise ValueError("这个重复任务今天没有待办的实例")
+        new_id = cursor.lastrowid
+        cursor.execute('INSERT INTO todo_tags (todo_id, tag_id) SELECT ?, tag_id FROM template_tags WHERE template_id=?',
+                       (new_id, template_id))
+        cursor.execute('SELECT title FROM todos WHERE id=?', (new_id,))
+        title = cursor.fetchone()[0]
+        conn.commit()
+        conn.close()
+        self._notify('task_added', todo_id=new_id, title=title, task_date=params['today'])
+        return new_id
+
+    def count_occurrences(self, task_date):
+        """某天还没写入的重复任务实例数"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT COUNT(*) FROM repeat_templates t WHERE {OCCURRENCE_FILTER}', {'today': task_date})
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def purge_stale_occurrences(self):
+        """删除以前自动生成、之后从未动过的往日重复任务（与模板一致，没有计时、子任务、依赖和撤销记录），返回删除的条数
+
+        重复任务改为虚拟实例之前每天都会写入一行，没做的留在表里；现在不再生成，这里清理留下的旧行
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM todos WHERE id IN (
+                SELECT todos.id FROM todos JOIN repeat_templates t ON t.id = todos.repeat_template_id
+                WHERE todos.task_date < ? AND todos.deleted_at IS NULL AND todos.status = 0
+                  AND todos.title = t.title AND todos.description IS t.description
+                  AND todos.estimated_duration IS t.estimated_duration AND todos.priority IS t.priority
+                  AND NOT EXISTS (SELECT 1 FROM task_sessions s WHERE s.todo_id = todos.id)
+                  AND NOT EXISTS (SELECT 1 FROM todos child WHERE child.parent_id = todos.id)
+                  AND NOT EXISTS (SELECT 1 FROM todo_dependencies d
+                                  WHERE d.todo_id = todos.id OR d.blocker_id = todos.id)
+                  AND NOT EXISTS (SELECT 1 FROM undo_journal j WHERE j.todo_id = todos.id)
+                  AND NOT EXISTS (SELECT tag_id FROM todo_tags WHERE todo_id = todos.id
+                                  EXCEPT SELECT tag_id FROM template_tags WHERE template_id = t.id)
+                  AND NOT EXISTS (SELECT tag_id FROM template_tags WHERE template_id = t.id
+                                  EXCEPT SELECT tag_id FROM todo_tags WHERE todo_id = todos.id))
+        ''', (datetime.now().strftime('%Y-%m-%d'),))
+        purged = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return purged
+
+    def add_todo(self, title, description='', task_date='', estimated_duration=0, priority=0, repeat_type=0,
+                 parent_id=None, tags=None):
+        """添加待办任务（指定 parent_id 时作为子任务，日期与父任务相同；tags 为标签名列表）"""
+        parent_id = self.materialize(parent_id)
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        if parent_id:
+            cursor.execute('SELECT task_date FROM todos WHERE id=? AND deleted_at IS NULL', (parent_id,))
+            result = cursor.fetchone()
+            if result:
+                task_date = result[0]
+            else:
+                parent_id = None
 
         # 如果是重复任务，先创建模板
         template_id = None
@@ -123,24 +1420,106 @@ class Database:
             template_id = cursor.lastrowid
             conn.commit()
 
+        # 新任务排在当天列表末尾
         cursor.execute('''
-            INSERT INTO todos (title, description, task_date, estimated_duration, priority, repeat_type, repeat_template_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (title, description, task_date, estimated_duration, priority, repeat_type, template_id))
-        conn.commit()
+            INSERT INTO todos (title, description, task_date, estimated_duration, priority, repeat_type, repeat_template_id,
+                               sort_key, parent_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?,
+                    (SELECT COALESCE(MAX(sort_key), 0) + 1 FROM todos WHERE task_date = ? AND deleted_at IS NULL), ?)
+        ''', (title, description, task_date, estimated_duration, priority, repeat_type, template_id, task_date, parent_id))
         todo_id = cursor.lastrowid
+        if tags:
+            self._set_tags(cursor, 'todo_tags', 'todo_id', todo_id, tags)
+            if template_id:
+                self._set_tags(cursor, 'template_tags', 'template_id', template_id, tags)
+        after = self._todo_state(cursor, todo_id)
+        self._journal(cursor, 'add', todo_id, dict(after, deleted=True), after)
+        conn.commit()
         conn.close()
+
+        if template_id:
+            self._notify('template_saved', template_id=template_id, title=title)
+        self._notify('task_added', todo_id=todo_id, title=title, task_date=task_date)
         return todo_id
 
-    def update_todo(self, todo_id, title, description='', estimated_duration=0, priority=0, repeat_type=0):
-        """更新待办任务"""
-        conn = sqlite3.connect(self.db_path)
+    def move_todo(self, todo_id, prev_id=None, next_id=None):
+        """把任务移动到 prev_id 和 next_id 之间，只更新被移动的一行（虚拟的重复任务实例先写入）"""
+        todo_id, prev_id, next_id = self.materialize(todo_id), self.materialize(prev_id), self.materialize(next_id)
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        def get_sort_key(neighbor_id):
+            if neighbor_id is None:
+                return None
+            cursor.execute('SELECT sort_key FROM todos WHERE id=?', (neighbor_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+        prev_key = get_sort_key(prev_id)
+        next_key = get_sort_key(next_id)
+        new_key = self._sort_key_between(prev_key, next_key)
+
+        # 间距耗尽时先把当天重新编号，再计算一次
+        if new_key is None:
+            cursor.execute('SELECT task_date FROM todos WHERE id=?', (todo_id,))
+            result = cursor.fetchone()
+            if result:
+                self._renumber_sort_keys(cursor, result[0])
+            new_key = self._sort_key_between(get_sort_key(prev_id), get_sort_key(next_id))
+
+        cursor.execute('UPDATE todos SET sort_key=? WHERE id=?', (new_key, todo_id))
+        conn.commit()
+        conn.close()
+        return new_key
+
+    def _sort_key_between(self, prev_key, next_key):
+        """计算位于两个排序键之间的新键，间距不足时返回 None"""
+        if prev_key is None and next_key is None:
+            return 1.0
+        if prev_key is None:
+            return next_key - 1
+        if next_key is None:
+            return prev_key + 1
+        if next_key - prev_key < SORT_KEY_MIN_GAP:
+            return None
+        return (prev_key + next_key) / 2
+
+    def _renumber_sort_keys(self, cursor, task_date):
+        """按当前顺序把某天的排序键重新编号为 1, 2, 3..."""
+        cursor.execute('SELECT id FROM todos WHERE task_date=? AND deleted_at IS NULL ORDER BY sort_key, id', (task_date,))
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany('UPDATE todos SET sort_key=? WHERE id=?',
+                           [(float(index + 1), todo_id) for index, todo_id in enumerate(ids)])
+
+    def rebalance_sort_keys(self):
+        """把今天及以后、因拖动产生小数排序键的日期重新编号，返回处理的天数"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        today = datetime.now().strftime('%Y-%m-%d')
+        cursor.execute('''
+            SELECT DISTINCT task_date FROM todos
+            WHERE task_date >= ? AND deleted_at IS NULL AND sort_key != CAST(sort_key AS INTEGER)
+        ''', (today,))
+        dates = [row[0] for row in cursor.fetchall()]
+        for task_date in dates:
+            self._renumber_sort_keys(cursor, task_date)
+        conn.commit()
+        conn.close()
+        return len(dates)
+
+    def update_todo(self, todo_id, title, description='', estimated_duration=0, priority=0, repeat_type=0,
+                    tags=None):
+        """更新待办任务（tags 为 None 时不修改标签）"""
+        todo_id = self.materialize(todo_id)
+        conn = self._connect()
         cursor = conn.cursor()
 
         # 获取原任务信息
-        cursor.execute('SELECT repeat_template_id FROM todos WHERE id=?', (todo_id,))
-        result = cursor.fetchone()
-        old_template_id = result[0] if result else None
+        before = self._todo_state(cursor, todo_id)
+        if before is None:
+            conn.close()
+            return
+        old_template_id = before['repeat_template_id']
 
         # 如果重复类型改变，需要更新或创建模板
         template_id = old_template_id
@@ -160,74 +1539,305 @@ class Database:
                 ''', (title, description, estimated_duration, priority, repeat_type))
                 template_id = cursor.lastrowid
         elif old_template_id and repeat_type == 0:
-            # 从重复任务改为一次性任务，删除模板
-            cursor.execute('DELETE FROM repeat_templates WHERE id=?', (old_template_id,))
+            # 从重复任务改为一次性任务，模板在任务更新后标记删除
             template_id = None
 
+        if tags is not None:
+            self._set_tags(cursor, 'todo_tags', 'todo_id', todo_id, tags)
+            if template_id:
+                self._set_tags(cursor, 'template_tags', 'template_id', template_id, tags)
+
         cursor.execute('''
             UPDATE todos
             SET title=?, description=?, estimated_duration=?, priority=?, repeat_type=?, repeat_template_id=?
             WHERE id=?
         ''', (title, description, estimated_duration, priority, repeat_type, template_id, todo_id))
+        old_template_deleted = bool(old_template_id and not template_id and
+                                    not self._sync_template(cursor, old_template_id))
+        after = self._todo_state(cursor, todo_id)
+        self._journal(cursor, 'update', todo_id, before, after)
         conn.commit()
         conn.close()
 
+        if old_template_deleted:
+            self._notify('template_deleted', template_id=old_template_id)
+        if template_id:
+            self._notify('template_saved', template_id=template_id, title=title)
+        self._notify('task_updated', todo_id=todo_id, title=title, task_date=after['task_date'])
+
     def delete_todo(self, todo_id):
-        """删除待办任务"""
-        conn = sqlite3.connect(self.db_path)
+        """删除待办任务（标记为墓碑，可以撤销；子任务上移一级，挂到被删除任务的父任务下）
+
+        虚拟的重复任务实例先写入再标记删除，墓碑让它今天不再出现
+        """
+        todo_id = self.materialize(todo_id)
+        conn = self._connect()
         cursor = conn.cursor()
+        before = self._todo_state(cursor, todo_id)
+        if before is None or before['deleted']:
+            conn.close()
+            return
 
-        # 获取任务的repeat_template_id
-        cursor.execute('SELECT repeat_template_id FROM todos WHERE id=?', (todo_id,))
-        result = cursor.fetchone()
-        template_id = result[0] if result else None
+        cursor.execute('SELECT id FROM todos WHERE parent_id=? AND deleted_at IS NULL', (todo_id,))
+        children = [row[0] for row in cursor.fetchall()]
+        after = dict(before, deleted=True)
+        templates = self._apply_todo_state(cursor, todo_id, after, before, children)
+        self._journal(cursor, 'delete', todo_id, before, after, children)
+        conn.commit()
+        conn.close()
+        self._notify_state_change(todo_id, after, before, templates)
+
+    def _todo_state(self, cursor, todo_id):
+        """读取任务可撤销的状态（字段、标签、是否已删除），任务不存在时返回 None"""
+        cursor.execute('''
+            SELECT title, description, task_date, estimated_duration, priority, repeat_type, repeat_template_id,
+                   parent_id, deleted_at IS NOT NULL
+            FROM todos WHERE id=?
+        ''', (todo_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        state = dict(zip(('title', 'description', 'task_date', 'estimated_duration', 'priority', 'repeat_type',
+                          'repeat_template_id', 'parent_id', 'deleted'), row))
+        state['deleted'] = bool(state['deleted'])
+        cursor.execute('''
+            SELECT tags.name FROM todo_tags JOIN tags ON tags.id = todo_tags.tag_id WHERE todo_tags.todo_id=?
+        ''', (todo_id,))
+        state['tags'] = [name for (name,) in cursor.fetchall()]
+        return state
 
-        # 删除任务会话记录
-        cursor.execute('DELETE FROM task_sessions WHERE todo_id=?', (todo_id,))
-        # 删除任务
-        cursor.execute('DELETE FROM todos WHERE id=?', (todo_id,))
+    def _apply_todo_state(self, cursor, todo_id, state, other, children=()):
+        """把任务改回 state（删除、撤销和重做共用），只更新字段和墓碑标记，不重新插入行
 
-        # 如果是重复任务,询问是否删除模板
-        if template_id:
-            # 检查是否还有其他关联的任务
-            cursor.execute('SELECT COUNT(*) FROM todos WHERE repeat_template_id=?', (template_id,))
-            other_tasks = cursor.fetchone()[0]
+        other 是修改另一侧的状态，用来找出涉及的重复模板；children 是删除时上移一级的子任务。
+        返回模板变化 [(template_id, 是否可用)]
+        """
+        deleted_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S') if state['deleted'] else None
+        cursor.execute('''
+            UPDATE todos
+            SET title=?, description=?, estimated_duration=?, priority=?, repeat_type=?, repeat_template_id=?,
+                deleted_at=?
+            WHERE id=?
+        ''', (state['title'], state['description'], state['estimated_duration'], state['priority'],
+              state['repeat_type'], state['repeat_template_id'], deleted_at, todo_id))
+        self._set_tags(cursor, 'todo_tags', 'todo_id', todo_id, state['tags'])
+        if state['deleted'] != other['deleted']:
+            cursor.execute('UPDATE task_sessions SET deleted_at=? WHERE todo_id=?', (deleted_at, todo_id))
+            new_parent_id = state['parent_id'] if state['deleted'] else todo_id
+            cursor.executemany('UPDATE todos SET parent_id=? WHERE id=?',
+                               [(new_parent_id, child_id) for child_id in children])
+
+        templates = []
+        for template_id in {state['repeat_template_id'], other['repeat_template_id']} - {None}:
+            owner = state if template_id == state['repeat_template_id'] and not state['deleted'] else None
+            live = self._sync_template(cursor, template_id, owner)
+            if owner or not live:
+                templates.append((template_id, live))
+        return templates
+
+    def _sync_template(self, cursor, template_id, state=None):
+        """没有未删除的任务使用的模板标记删除，否则恢复（传入 state 时同步模板字段），返回模板是否可用"""
+        cursor.execute('SELECT 1 FROM todos WHERE repeat_template_id=? AND deleted_at IS NULL LIMIT 1', (template_id,))
+        if cursor.fetchone() is None:
+            cursor.execute('UPDATE repeat_templates SET deleted_at=? WHERE id=? AND deleted_at IS NULL',
+                           (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), template_id))
+            return False
+        cursor.execute('UPDATE repeat_templates SET deleted_at=NULL WHERE id=?', (template_id,))
+        if state:
+            cursor.execute('''
+                UPDATE repeat_templates
+                SET title=?, description=?, estimated_duration=?, priority=?, repeat_type=?
+                WHERE id=?
+            ''', (state['title'], state['description'], state['estimated_duration'], state['priority'],
+                  state['repeat_type'], template_id))
+            self._set_tags(cursor, 'template_tags', 'template_id', template_id, state['tags'])
+        return True
+
+    def _notify_state_change(self, todo_id, state, previous, templates):
+        """按状态变化通知监听器：删除、恢复或更新，以及涉及的模板"""
+        if self.dependency_graph is not None and state['deleted'] != previous['deleted']:
+            if state['deleted']:
+                self.dependency_graph.remove_node(todo_id)
+            else:
+                # 恢复的任务连同依赖重新载入（期间可能新加了会与它形成环的依赖）
+                self.dependency_graph = None
+        if state['deleted']:
+            if not previous['deleted']:
+                self._notify('task_deleted', todo_id=todo_id)
+        else:
+            event_type = 'task_added' if previous['deleted'] else 'task_updated'
+            self._notify(event_type, todo_id=todo_id, title=state['title'], task_date=state['task_date'])
+        for template_id, live in templates:
+            if live:
+                self._notify('template_saved', template_id=template_id, title=state['title'])
+            else:
+                self._notify('template_deleted', template_id=template_id)
 
-            # 如果没有其他任务使用这个模板,删除模板
-            if other_tasks == 0:
-                cursor.execute('DELETE FROM repeat_templates WHERE id=?', (template_id,))
+    def _journal(self, cursor, action, todo_id, before, after, children=()):
+        """记录一次可撤销的修改（在调用方的事务中执行），新的修改使已撤销的记录不能再重做"""
+        cursor.execute('DELETE FROM undo_journal WHERE undone=1')
+        cursor.execute('''
+            INSERT INTO undo_journal (action, todo_id, before_state, after_state, children, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (action, todo_id, json.dumps(before, ensure_ascii=False), json.dumps(after, ensure_ascii=False),
+              json.dumps(list(children)), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def undo(self):
+        """撤销最近一次新建/编辑/删除，返回 (动作, 任务标题)，没有可撤销的修改时返回 None"""
+        return self._step_journal(undo=True)
+
+    def redo(self):
+        """重做最近一次撤销的修改，返回 (动作, 任务标题)，没有可重做的修改时返回 None"""
+        return self._step_journal(undo=False)
+
+    def _step_journal(self, undo):
+        """撤销或重做日志中的一条记录"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        # 已撤销的记录总是日志末尾的一段：撤销从未撤销的最后一条往前，重做从已撤销的第一条往后
+        if undo:
+            query = 'SELECT id, action, todo_id, before_state, after_state, children FROM undo_journal ' \
+                    'WHERE undone=0 ORDER BY id DESC LIMIT 1'
+        else:
+            query = 'SELECT id, action, todo_id, before_state, after_state, children FROM undo_journal ' \
+                    'WHERE undone=1 ORDER BY id LIMIT 1'
+        cursor.execute(query)
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            return None
 
+        entry_id, action, todo_id, before, after, children = row
+        before, after = json.loads(before), json.loads(after)
+        state, other = (before, after) if undo else (after, before)
+        templates = self._apply_todo_state(cursor, todo_id, state, other, json.loads(children or '[]'))
+        cursor.execute('UPDATE undo_journal SET undone=? WHERE id=?', (1 if undo else 0, entry_id))
         conn.commit()
         conn.close()
+        self._notify_state_change(todo_id, state, other, templates)
+        return action, state['title']
 
-    def start_task_session(self, todo_id):
+    def start_task_session(self, todo_id, session_type=SESSION_NORMAL):
         """开始任务计时"""
-        conn = sqlite3.connect(self.db_path)
+        todo_id = self.materialize(todo_id)
+        conn = self._connect()
         cursor = conn.cursor()
         start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         cursor.execute('''
-            INSERT INTO task_sessions (todo_id, start_time)
-            VALUES (?, ?)
-        ''', (todo_id, start_time))
+            INSERT INTO task_sessions (todo_id, start_time, session_type)
+            VALUES (?, ?, ?)
+        ''', (todo_id, start_time, session_type))
         conn.commit()
         session_id = cursor.lastrowid
         conn.close()
+        self._notify('task_started', todo_id=todo_id, session_id=session_id, session_type=session_type)
         return session_id
 
-    def stop_task_session(self, session_id, summary=''):
-        """停止任务计时"""
-        conn = sqlite3.connect(self.db_path)
+    def pause_task_session(self, session_id, paused_at=None):
+        """记录计时暂停"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO timer_pauses (session_id, paused_at) VALUES (?, ?)',
+                       (session_id, (paused_at or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+        todo_id = self._session_todo_id(cursor, session_id)
+        conn.close()
+        self._notify('task_paused', todo_id=todo_id, session_id=session_id)
+
+    def resume_task_session(self, session_id, resumed_at=None):
+        """记录计时恢复（结束未结束的暂停）"""
+        conn = self._connect()
         cursor = conn.cursor()
-        end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('UPDATE timer_pauses SET resumed_at=? WHERE session_id=? AND resumed_at IS NULL',
+                       ((resumed_at or datetime.now()).strftime('%Y-%m-%d %H:%M:%S'), session_id))
+        conn.commit()
+        todo_id = self._session_todo_id(cursor, session_id)
+        conn.close()
+        self._notify('task_resumed', todo_id=todo_id, session_id=session_id)
+
+    def _session_todo_id(self, cursor, session_id):
+        cursor.execute('SELECT todo_id FROM task_sessions WHERE id=?', (session_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_open_sessions(self):
+        """未结束的计时记录 [(Session, 任务标题, [(暂停, 恢复或 None)])]，按开始时间排序；任务已删除或已完成时标题为 None"""
+        columns = ', '.join('s.' + name for name in Session.__slots__)
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {columns}, t.title
+            FROM task_sessions s LEFT JOIN todos t ON t.id = s.todo_id AND t.deleted_at IS NULL
+            WHERE s.end_time IS NULL AND s.deleted_at IS NULL
+            ORDER BY s.start_time, s.id
+        ''')
+        rows = cursor.fetchall()
+        pauses = self._session_pauses(cursor, [row[0] for row in rows])
+        conn.close()
+        return [(Session(*row[:-1]), row[-1], pauses.get(row[0], [])) for row in rows]
+
+    def _session_pauses(self, cursor, session_ids):
+        """{计时记录 id: [(暂停, 恢复或 None)]}（datetime）"""
+        pauses = {}
+        for start in range(0, len(session_ids), 500):
+            chunk = session_ids[start:start + 500]
+            cursor.execute(f'''
+                SELECT session_id, paused_at, resumed_at FROM timer_pauses
+                WHERE session_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk)
+            for session_id, paused_at, resumed_at in cursor.fetchall():
+                pauses.setdefault(session_id, []).append(
+                    (datetime.strptime(paused_at, '%Y-%m-%d %H:%M:%S'),
+                     datetime.strptime(resumed_at, '%Y-%m-%d %H:%M:%S') if resumed_at else None))
+        return pauses
+
+    def _session_spans(self, cursor, sessions):
+        """计时记录 [(id, 开始, 结束)] 去掉暂停后的有效区间 {id: [(开始, 结束)]}（时间戳秒）"""
+        pauses = self._session_pauses(cursor, [session[0] for session in sessions])
+        spans = {}
+        for session_id, start_time, end_time in sessions:
+            start = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S').timestamp()
+            end = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S').timestamp()
+            spans[session_id] = active_spans(start, end, [
+                (paused_at.timestamp(), resumed_at.timestamp() if resumed_at else None)
+                for paused_at, resumed_at in pauses.get(session_id, [])])
+        return spans
+
+    def _overlapping_sessions(self, cursor, session_id, start_time, end_time):
+        """与 [start_time, end_time] 重叠的其他计时记录（不含休息）[(id, 开始, 结束)]，未结束的记录算到 end_time"""
+        # +start_time 让查询走结束时间索引（只有最近结束的几条），而不是按开始时间扫描全部历史
+        cursor.execute('''
+            SELECT id, start_time, end_time FROM task_sessions
+            WHERE end_time > :start AND +start_time < :end
+              AND id != :id AND session_type != 2 AND deleted_at IS NULL
+            UNION ALL
+            SELECT id, start_time, :end FROM task_sessions
+            WHERE end_time IS NULL AND +start_time < :end
+              AND id != :id AND session_type != 2 AND deleted_at IS NULL
+        ''', {'id': session_id, 'start': start_time, 'end': end_time})
+        return cursor.fetchall()
+
+    def stop_task_session(self, session_id, summary='', end_time=None):
+        """停止任务计时：用时扣除暂停，其他任务同时在计时的时段按设置计全部或平分"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        end_time = end_time or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         # 获取开始时间
-        cursor.execute('SELECT todo_id, start_time FROM task_sessions WHERE id=?', (session_id,))
+        cursor.execute('SELECT todo_id, start_time, session_type FROM task_sessions WHERE id=?', (session_id,))
         result = cursor.fetchone()
         if result:
-            todo_id, start_time_str = result
-            start_time = datetime.strptime(start_time_str, '%Y-%m-%d %H:%M:%S')
-            end_time_dt = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
-            duration = int((end_time_dt - start_time).total_seconds())
+            todo_id, start_time_str, session_type = result
+            end_time = max(end_time, start_time_str)
+            cursor.execute('UPDATE timer_pauses SET resumed_at=? WHERE session_id=? AND resumed_at IS NULL',
+                           (end_time, session_id))
+            spans = self._session_spans(cursor, [(session_id, start_time_str, end_time)])[session_id]
+            attribution = self.get_settings(TIMER_DEFAULTS)['timer_overlap_attribution']
+            if attribution == 'split' and session_type != SESSION_BREAK:
+                others = self._overlapping_sessions(cursor, session_id, start_time_str, end_time)
+                duration = int(round(split_overlap(spans, self._session_spans(cursor, others).values())))
+            else:
+                duration = int(sum(end - start for start, end in spans))
 
             cursor.execute('''
                 UPDATE task_sessions
@@ -235,18 +1845,23 @@ class Database:
                 WHERE id=?
             ''', (end_time, duration, summary, session_id))
 
-            # 更新任务状态
-            cursor.execute('UPDATE todos SET status=1 WHERE id=?', (todo_id,))
+            # 更新任务状态（休息不算做过这个任务）
+            if session_type != SESSION_BREAK:
+                cursor.execute('UPDATE todos SET status=1 WHERE id=?', (todo_id,))
             conn.commit()
+            conn.close()
+            self._notify('task_stopped', todo_id=todo_id, session_id=session_id, duration=duration)
+            return
 
         conn.close()
 
     def get_active_session(self, todo_id):
         """获取活动的计时会话"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
+        conn.row_factory = Session.from_row
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, start_time FROM task_sessions
+        cursor.execute(f'''
+            SELECT {SESSION_COLUMNS} FROM task_sessions
             WHERE todo_id=? AND end_time IS NULL
             ORDER BY start_time DESC LIMIT 1
         ''', (todo_id,))
@@ -256,155 +1871,2136 @@ class Database:
 
     def get_task_total_duration(self, todo_id):
         """获取任务总时长"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
-        cursor.execute('SELECT SUM(duration) FROM task_sessions WHERE todo_id=? AND duration IS NOT NULL', (todo_id,))
+        cursor.execute('''
+            SELECT SUM(duration) FROM task_sessions
+            WHERE todo_id=? AND duration IS NOT NULL AND session_type != 2
+        ''', (todo_id,))
         result = cursor.fetchone()
         conn.close()
-        return result[0] or 0 if result[0] else 0
+        return result[0] or 0
 
     def complete_task(self, todo_id, summary=''):
         """完成任务并保存到历史"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.complete_tasks([todo_id], summary) > 0
+
+    def complete_tasks(self, todo_ids, summary=''):
+        """批量完成任务并保存到历史（同一事务，子任务随父任务一起完成），返回完成的任务数
 
-        # 获取任务信息
-        cursor.execute('SELECT * FROM todos WHERE id=?', (todo_id,))
-        todo = cursor.fetchone()
+        总结只记在指定的任务上，随父任务一起完成的子任务总结为空
+        """
+        todo_ids = [self.materialize(todo_id) for todo_id in todo_ids]
+        requested = set(todo_ids)
+        conn = self._connect()
+        cursor = conn.cursor()
+        completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        completed = []
 
-        if todo:
-            todo_id, title, description, task_date, estimated_duration, priority, status, created_at, notified = todo
-            total_duration = self.get_task_total_duration(todo_id)
-            completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 展开为整棵子树（父任务在前）
+        subtree_ids = []
+        seen = set()
+        for todo_id in todo_ids:
+            cursor.execute('''
+                WITH RECURSIVE subtree(id, depth) AS (
+                    SELECT ?, 0
+                    UNION
+                    SELECT todos.id, subtree.depth + 1 FROM todos JOIN subtree ON todos.parent_id = subtree.id
+                    WHERE todos.deleted_at IS NULL
+                )
+                SELECT id FROM subtree ORDER BY depth
+            ''', (todo_id,))
+            for (subtree_id,) in cursor.fetchall():
+                if subtree_id not in seen:
+                    seen.add(subtree_id)
+                    subtree_ids.append(subtree_id)
+
+        for todo_id in subtree_ids:
+            # 按列名复制任务，总时长由子查询汇总，不依赖表的列顺序
+            cursor.execute('''
+                INSERT INTO completed_tasks (title, description, task_date, completed_at, total_duration,
+                                             priority, summary, estimated_duration, repeat_template_id,
+                                             todo_id, parent_id)
+                SELECT t.title, t.description, t.task_date, ?,
+                       (SELECT COALESCE(SUM(s.duration), 0) FROM task_sessions s
+                        WHERE s.todo_id = t.id AND s.session_type != 2),
+                       t.priority, ?, t.estimated_duration, t.repeat_template_id, t.id, t.parent_id
+                FROM todos t
+                WHERE t.id = ? AND t.deleted_at IS NULL
+            ''', (completed_at, summary if todo_id in requested else '', todo_id))
+            if cursor.rowcount == 0:
+                continue
+            completed_task_id = cursor.lastrowid
+            cursor.execute('''
+                SELECT title, task_date, total_duration, estimated_duration, priority, repeat_template_id
+                FROM completed_tasks WHERE id=?
+            ''', (completed_task_id,))
+            row = cursor.fetchone()
+            completed.append((todo_id, completed_task_id) + row)
 
-            # 保存到完成历史
+            # 标签转到完成历史（冗余保存日期和用时，供筛选和统计使用）
             cursor.execute('''
-                INSERT INTO completed_tasks (title, description, task_date, completed_at, total_duration, priority, summary)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (title, description, task_date, completed_at, total_duration, priority, summary))
+                INSERT INTO completed_task_tags (tag_id, task_date, completed_task_id, total_duration)
+                SELECT tag_id, ?, ?, ? FROM todo_tags WHERE todo_id=?
+            ''', (row[1], completed_task_id, row[2], todo_id))
 
-            # 删除原任务和相关记录
-            cursor.execute('DELETE FROM task_sessions WHERE todo_id=?', (todo_id,))
-            cursor.execute('DELETE FROM todos WHERE id=?', (todo_id,))
-            conn.commit()
+            # 计时记录转交给完成历史（供效率分析使用），不随原任务删除
+            cursor.execute('UPDATE task_sessions SET todo_id=NULL, completed_task_id=? WHERE todo_id=?',
+                           (completed_task_id, todo_id))
 
+        # 整棵子树都写入历史后再删除原任务（先删父任务会把子任务的 parent_id 置空）。
+        # 标签和依赖随任务级联删除；完成是从任务表移到历史，不能撤销，撤销记录也一并删除
+        cursor.executemany('DELETE FROM todos WHERE id=?', [(todo_id,) for todo_id, *_ in completed])
+        conn.commit()
         conn.close()
+        if self.dependency_graph is not None:
+            for todo_id, *_ in completed:
+                self.dependency_graph.remove_node(todo_id)
+        for (todo_id, completed_task_id, title, task_date, total_duration, estimated_duration, priority,
+             repeat_template_id) in completed:
+            self._notify('task_completed', todo_id=todo_id, completed_task_id=completed_task_id,
+                         title=title, task_date=task_date, total_duration=total_duration,
+                         estimated_duration=estimated_duration, priority=priority,
+                         repeat_template_id=repeat_template_id, requested=todo_id in requested)
+        return len(completed)
+
+    def get_completed_tasks(self, days=30, start_date=None, end_date=None, tag_ids=None):
+        """获取已完成任务历史（指定 start_date 时按日期范围查询，指定 tag_ids 时只返回带全部这些标签的）"""
+        if start_date is None:
+            start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        return list(self.iter_completed_tasks(start_date, end_date, tag_ids=tag_ids))
+
+    def iter_completed_tasks(self, start_date, end_date=None, batch_size=500, tag_ids=None):
+        """逐批读取已完成任务，大范围导出时不会一次性载入内存"""
+        conn = self._connect_history(start_date)
+        conn.row_factory = CompletedTask.from_row
+        try:
+            cursor = conn.cursor()
+            params = {'start': start_date, 'end': end_date or '9999-12-31'}
+            tag_filter = ''
+            if tag_ids:
+                # 先在标签关联表上按 (tag_id, task_date) 取出匹配的 id，再按主键取任务
+                matched = self._tag_match_sql('all_completed_task_tags', 'completed_task_id', tag_ids, params,
+                                              'AND task_date >= :start AND task_date <= :end')
+                tag_filter = f'AND id IN ({matched})'
+            cursor.execute(f'''
+                SELECT {COMPLETED_TASK_COLUMNS}
+                FROM all_completed_tasks
+                WHERE task_date >= :start AND task_date <= :end {tag_filter}
+                ORDER BY completed_at DESC
+            ''', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
 
-    def get_completed_tasks(self, days=30):
-        """获取已完成任务历史"""
-        conn = sqlite3.connect(self.db_path)
+    def iter_calendar_todos(self, batch_size=500):
+        """逐批读取未删除的待办任务（含标签，空格分隔），用于日历导出"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, title, description, task_date, estimated_duration, priority, status, parent_id, ical_uid,
+                       (SELECT group_concat(tags.name, ' ') FROM todo_tags JOIN tags ON tags.id = todo_tags.tag_id
+                        WHERE todo_tags.todo_id = todos.id)
+                FROM todos
+                WHERE deleted_at IS NULL
+                ORDER BY task_date, sort_key
+            ''')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def iter_calendar_templates(self):
+        """读取未删除的重复模板（含标签），用于日历导出"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, title, description, estimated_duration, priority, repeat_type, created_at, ical_uid,
+                       (SELECT group_concat(tags.name, ' ') FROM template_tags JOIN tags ON tags.id = template_tags.tag_id
+                        WHERE template_tags.template_id = repeat_templates.id)
+                FROM repeat_templates
+                WHERE deleted_at IS NULL
+                ORDER BY id
+            ''')
+            yield from cursor
+        finally:
+            conn.close()
+
+    def bulk_add_todos(self, items):
+        """批量添加任务（日历导入），全部写入在同一事务中完成，items 可以是生成器
+
+        每项为字典：title、description、task_date、estimated_duration、priority、repeat_type、tags、ical_uid。
+        重复任务只创建模板（每天的实例由模板虚拟生成）；ical_uid 已存在的跳过。
+        中途出错时整批回滚。返回 (新增任务数, 新增模板数, 跳过数)
+        """
+        database_id = self.get_database_id()
+        conn = self._connect()
         cursor = conn.cursor()
-        since_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        # 已导出的任务完成、归档后仍算已存在，归档库在写入前挂载（事务中不能 ATTACH）
+        history = ['main']
+        if os.path.exists(self.archive_path):
+            cursor.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            self._init_archive(cursor)
+            history.append('archive')
+        added = templates = skipped = 0
+        # 每个日期只查一次当前最大排序键，之后在内存中递增（逐条 MAX 会随当天任务数线性变慢）
+        next_sort_keys = {}
+        try:
+            for item in items:
+                uid = item.get('ical_uid')
+                if uid and self._calendar_uid_exists(cursor, uid, database_id, history):
+                    skipped += 1
+                    continue
+                values = (item['title'], item.get('description', ''), item.get('estimated_duration', 0),
+                          item.get('priority', 0), item.get('repeat_type', 0))
+                if item.get('repeat_type'):
+                    cursor.execute('''
+                        INSERT INTO repeat_templates (title, description, estimated_duration, priority, repeat_type,
+                                                      ical_uid)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', values + (uid,))
+                    owner_table, owner_column = 'template_tags', 'template_id'
+                    templates += 1
+                else:
+                    task_date = item['task_date']
+                    if task_date not in next_sort_keys:
+                        cursor.execute('SELECT COALESCE(MAX(sort_key), 0) FROM todos WHERE task_date=? AND deleted_at IS NULL',
+                                       (task_date,))
+                        next_sort_keys[task_date] = cursor.fetchone()[0]
+                    next_sort_keys[task_date] += 1
+                    cursor.execute('''
+                        INSERT INTO todos (title, description, estimated_duration, priority, repeat_type, ical_uid,
+                                           task_date, sort_key)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', values + (uid, task_date, next_sort_keys[task_date]))
+                    owner_table, owner_column = 'todo_tags', 'todo_id'
+                    added += 1
+                if item.get('tags'):
+                    self._set_tags(cursor, owner_table, owner_column, cursor.lastrowid, item['tags'])
+            conn.commit()
+        finally:
+            conn.close()
+
+        if added or templates:
+            self._notify('tasks_imported', todos=added, templates=templates)
+        return added, templates, skipped
+
+    def _calendar_uid_exists(self, cursor, uid, database_id, history=('main',)):
+        """日历条目是否已经在库中：本库导出的按 id 查找，其他来源的按导入时记录的 UID 查找
+
+        UID 中的库标识与 database_id 相同时才按 id 查找，其他库（或旧版本）导出的 id 与本库无关。
+        todo-N 完成后在完成历史中按原任务 id 查找，done-N 可能已移入归档库；
+        history 为要查找的完成历史所在的库（主库和已挂载的归档库）
+        """
+        match = re.match(r'(todo|template|done)-(\d+)\.([0-9a-f]+)@' + re.escape(ICAL_UID_DOMAIN) + '$', uid)
+        if match and match.group(3) == database_id:
+            kind = match.group(1)
+            if kind == 'template':
+                queries = ['SELECT 1 FROM repeat_templates WHERE id=?']
+            elif kind == 'todo':
+                queries = ['SELECT 1 FROM todos WHERE id=?'] + [
+                    f'SELECT 1 FROM {schema}.completed_tasks WHERE todo_id=?' for schema in history]
+            else:
+                queries = [f'SELECT 1 FROM {schema}.completed_tasks WHERE id=?' for schema in history]
+            cursor.execute(' UNION ALL '.join(queries) + ' LIMIT 1', (int(match.group(2)),) * len(queries))
+            if cursor.fetchone():
+                return True
         cursor.execute('''
-            SELECT * FROM completed_tasks
-            WHERE task_date >= ?
-            ORDER BY completed_at DESC
-        ''', (since_date,))
-        tasks = cursor.fetchall()
-        conn.close()
-        return tasks
-
-    def get_statistics(self, days=7):
-        """获取统计数据"""
-        conn = sqlite3.connect(self.db_path)
+            SELECT 1 FROM todos WHERE ical_uid=?
+            UNION ALL
+            SELECT 1 FROM repeat_templates WHERE ical_uid=?
+            LIMIT 1
+        ''', (uid, uid))
+        return cursor.fetchone() is not None
+
+    def get_statistics(self, days=7, start_date=None, end_date=None):
+        """获取统计数据（指定 start_date 时按日期范围统计）"""
+        if start_date is None:
+            start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        end_date = end_date or '9999-12-31'
+        conn = self._connect_history(start_date)
         cursor = conn.cursor()
-        since_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-
-        # 完成的任务数
-        cursor.execute('SELECT COUNT(*) FROM completed_tasks WHERE task_date >= ?', (since_date,))
-        total_completed = cursor.fetchone()[0]
-
-        # 总工作时长
-        cursor.execute('SELECT SUM(total_duration) FROM completed_tasks WHERE task_date >= ?', (since_date,))
-        total_duration = cursor.fetchone()[0] or 0
 
         # 按优先级统计
         cursor.execute('''
             SELECT priority, COUNT(*), SUM(total_duration)
-            FROM completed_tasks
-            WHERE task_date >= ?
+            FROM all_completed_stats
+            WHERE task_date >= ? AND task_date <= ?
             GROUP BY priority
-        ''', (since_date,))
+        ''', (start_date, end_date))
         priority_stats = cursor.fetchall()
 
         # 每日完成统计
         cursor.execute('''
             SELECT task_date, COUNT(*), SUM(total_duration)
-            FROM completed_tasks
-            WHERE task_date >= ?
+            FROM all_completed_stats
+            WHERE task_date >= ? AND task_date <= ?
             GROUP BY task_date
             ORDER BY task_date DESC
-        ''', (since_date,))
+        ''', (start_date, end_date))
         daily_stats = cursor.fetchall()
 
+        # 番茄钟：专注和休息的段数、时长
+        cursor.execute('''
+            SELECT session_type, COUNT(*), SUM(duration)
+            FROM all_session_stats
+            WHERE start_time >= ? AND start_time <= ? AND session_type IN (1, 2)
+            GROUP BY session_type
+        ''', (start_date, end_date + ' 23:59:59'))
+        cycles = {session_type: (count, duration or 0) for session_type, count, duration in cursor.fetchall()}
+
+        # 按标签统计（走 (task_date, tag_id, total_duration) 覆盖索引）
+        cursor.execute('''
+            SELECT tags.name, stats.count, stats.duration
+            FROM (SELECT tag_id, COUNT(*) AS count, SUM(total_duration) AS duration
+                  FROM all_completed_task_tags
+                  WHERE task_date >= ? AND task_date <= ?
+                  GROUP BY tag_id) stats
+            JOIN tags ON tags.id = stats.tag_id
+            ORDER BY stats.duration DESC
+        ''', (start_date, end_date))
+        tag_stats = cursor.fetchall()
+
         conn.close()
 
+        # 完成总数和总时长由每日统计汇总，避免再扫描一遍
+        total_completed = sum(count for _, count, _ in daily_stats)
+        total_duration = sum(duration or 0 for _, _, duration in daily_stats)
+        work_count, work_duration = cycles.get(SESSION_WORK, (0, 0))
+        break_count, break_duration = cycles.get(SESSION_BREAK, (0, 0))
+
         return {
             'total_completed': total_completed,
             'total_duration': total_duration,
             'priority_stats': priority_stats,
-            'daily_stats': daily_stats
+            'daily_stats': daily_stats,
+            'tag_stats': tag_stats,
+            'pomodoro_stats': {
+                'work_count': work_count,
+                'work_duration': work_duration,
+                'break_count': break_count,
+                'break_duration': break_duration
+            }
         }
 
-    def generate_repeat_tasks(self, target_date):
-        """为指定日期生成重复任务"""
-        conn = sqlite3.connect(self.db_path)
+    def get_analytics_aggregates(self, start_date, end_date):
+        """获取效率分析所需的聚合数据（日期均包含在内），全部在SQL中分组汇总"""
+        conn = self._connect_history(start_date)
         cursor = conn.cursor()
+        end_exclusive = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
 
-        target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-        weekday = target_dt.weekday()  # 0=周一, 6=周日
+        # 预估准确度：只统计填写了预估时长的任务，误差在20%以内算准确
+        cursor.execute('''
+            SELECT priority, COUNT(*), SUM(total_duration), SUM(estimated_duration),
+                   SUM(CASE WHEN ABS(total_duration - estimated_duration) <= estimated_duration * 0.2 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN total_duration > estimated_duration THEN 1 ELSE 0 END)
+            FROM all_completed_tasks
+            WHERE task_date >= ? AND task_date <= ? AND estimated_duration > 0
+            GROUP BY priority
+        ''', (start_date, end_date))
+        accuracy_stats = cursor.fetchall()
 
-        # 检查是否为工作日 (周一到周五)
-        is_weekday = weekday < 5
+        # 每日按优先级的完成数和时长
+        cursor.execute('''
+            SELECT task_date, priority, COUNT(*), SUM(total_duration)
+            FROM all_completed_stats
+            WHERE task_date >= ? AND task_date <= ?
+            GROUP BY task_date, priority
+        ''', (start_date, end_date))
+        daily_priority_stats = cursor.fetchall()
+
+        # 按星期和小时汇总计时（%w: 0=周日）
+        cursor.execute('''
+            SELECT CAST(strftime('%w', start_time) AS INTEGER), CAST(strftime('%H', start_time) AS INTEGER),
+                   COUNT(*), SUM(duration)
+            FROM all_session_stats
+            WHERE start_time >= ? AND start_time < ? AND duration > 0 AND session_type != 2
+            GROUP BY 1, 2
+        ''', (start_date, end_exclusive))
+        hourly_stats = cursor.fetchall()
 
-        # 获取所有重复任务模板
-        cursor.execute('SELECT * FROM repeat_templates')
-        templates = cursor.fetchall()
+        conn.close()
 
-        for template in templates:
-            template_id, title, description, estimated_duration, priority, repeat_type, created_at = template
+        return {
+            'accuracy_stats': accuracy_stats,
+            'daily_priority_stats': daily_priority_stats,
+            'hourly_stats': hourly_stats
+        }
 
-            # 检查今天是否已有该模板的任务
-            cursor.execute('''
-                SELECT COUNT(*) FROM todos
-                WHERE task_date=? AND repeat_template_id=?
-            ''', (target_date, template_id))
-            exists = cursor.fetchone()[0] > 0
-
-            if exists:
-                continue  # 已存在，跳过
-
-            # 根据重复类型决定是否生成
-            should_create = False
-            if repeat_type == 1:  # 每日重复
-                should_create = True
-            elif repeat_type == 2:  # 工作日重复
-                should_create = is_weekday
-
-            if should_create:
-                cursor.execute('''
-                    INSERT INTO todos (title, description, task_date, estimated_duration, priority, repeat_type, repeat_template_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (title, description, target_date, estimated_duration, priority, repeat_type, template_id))
+    def _set_tags(self, cursor, link_table, owner_column, owner_id, names):
+        """替换某个任务/模板的标签（在调用方的事务中执行）"""
+        cursor.execute(f'DELETE FROM {link_table} WHERE {owner_column}=?', (owner_id,))
+        for name in names:
+            cursor.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (name,))
+            cursor.execute('SELECT id FROM tags WHERE name=?', (name,))
+            cursor.execute(f'INSERT OR IGNORE INTO {link_table} ({owner_column}, tag_id) VALUES (?, ?)',
+                           (owner_id, cursor.fetchone()[0]))
+
+    def _tag_match_sql(self, link_table, owner_column, tag_ids, params, extra=''):
+        """返回"带有全部指定标签的 owner id"子查询，参数写入 params"""
+        names = []
+        for index, tag_id in enumerate(sorted(set(tag_ids))):
+            params[f'tag{index}'] = tag_id
+            names.append(f':tag{index}')
+        params['tag_count'] = len(names)
+        return (f'SELECT {owner_column} FROM {link_table} WHERE tag_id IN ({", ".join(names)}) {extra} '
+                f'GROUP BY {owner_column} HAVING COUNT(*) = :tag_count')
+
+    def get_today_tags(self):
+        """今天的任务用到的标签 [(id, 名称)]，用于主界面的筛选"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT tags.id, tags.name FROM tags WHERE tags.id IN (
+                SELECT todo_tags.tag_id FROM todos JOIN todo_tags ON todo_tags.todo_id = todos.id
+                WHERE todos.task_date = :today AND todos.deleted_at IS NULL
+                UNION
+                SELECT template_tags.tag_id FROM repeat_templates t JOIN template_tags ON template_tags.template_id = t.id
+                WHERE {OCCURRENCE_FILTER})
+            ORDER BY tags.name
+        ''', {'today': datetime.now().strftime('%Y-%m-%d')})
+        tags = cursor.fetchall()
+        conn.close()
+        return tags
+
+    def get_history_tags(self, start_date, end_date=None):
+        """日期范围内完成历史用到的标签 [(id, 名称, 任务数)]，用于历史复盘的筛选"""
+        conn = self._connect_history(start_date)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT tags.id, tags.name, stats.count
+            FROM (SELECT tag_id, COUNT(*) AS count FROM all_completed_task_tags
+                  WHERE task_date >= ? AND task_date <= ?
+                  GROUP BY tag_id) stats
+            JOIN tags ON tags.id = stats.tag_id
+            ORDER BY stats.count DESC, tags.name
+        ''', (start_date, end_date or '9999-12-31'))
+        tags = cursor.fetchall()
+        conn.close()
+        return tags
 
+    def get_settings(self, defaults):
+        """读取设置，返回与 defaults 同类型的值（未保存过的使用默认值）"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT key, value FROM settings')
+        saved = dict(cursor.fetchall())
+        conn.close()
+
+        settings = {}
+        for key, default in defaults.items():
+            try:
+                settings[key] = type(default)(saved[key]) if key in saved else default
+            except ValueError:
+                settings[key] = default
+        return settings
+
+    def save_settings(self, settings):
+        """保存设置"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.executemany('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
+                           [(key, str(value)) for key, value in settings.items()])
+        conn.commit()
+        conn.close()
+
+    def get_database_id(self):
+        """本库的标识（首次使用时随机生成，保存在 settings 表），写入导出的日历 UID"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('database_id', ?)",
+                       (uuid.uuid4().hex[:16],))
+        conn.commit()
+        cursor.execute("SELECT value FROM settings WHERE key='database_id'")
+        database_id = cursor.fetchone()[0]
+        conn.close()
+        return database_id
+
+    def get_appointments(self, appt_date):
+        """某天的固定日程 [(id, 标题, 开始 HH:MM, 结束 HH:MM)]，按开始时间排序"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, title, start_time, end_time FROM appointments
+            WHERE appt_date=? ORDER BY start_time
+        ''', (appt_date,))
+        appointments = cursor.fetchall()
+        conn.close()
+        return appointments
+
+    def add_appointment(self, title, appt_date, start_time, end_time):
+        """添加固定日程，返回 id"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO appointments (title, appt_date, start_time, end_time) VALUES (?, ?, ?, ?)',
+                       (title, appt_date, start_time, end_time))
+        appointment_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return appointment_id
+
+    def delete_appointment(self, appointment_id):
+        """删除固定日程"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM appointments WHERE id=?', (appointment_id,))
         conn.commit()
         conn.close()
 
+    def get_search_items(self):
+        """获取命令面板索引的初始数据：今日及以后的任务、重复模板、按标题合并的完成历史"""
+        conn = self._connect_history()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, title, task_date FROM todos WHERE deleted_at IS NULL AND task_date >= ?',
+                       (datetime.now().strftime('%Y-%m-%d'),))
+        todos = cursor.fetchall()
+        cursor.execute('SELECT id, title FROM repeat_templates WHERE deleted_at IS NULL')
+        templates = cursor.fetchall()
+        cursor.execute('''
+            SELECT title, MAX(task_date), MAX(id), COUNT(*)
+            FROM all_completed_tasks
+            GROUP BY title
+        ''')
+        history = cursor.fetchall()
+        conn.close()
+        return {'todos': todos, 'templates': templates, 'history': history}
+
+    def iter_title_history(self, limit, batch_size=500):
+        """按完成先后倒序（即 id 倒序，无需排序）逐批读取 (标题, 实际用时, 预估用时, 优先级, 日期)"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT title, total_duration, estimated_duration, priority, task_date
+                FROM completed_tasks
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def iter_estimate_history(self, limit, batch_size=500):
+        """按完成先后倒序读取同时有预估和实际用时的记录 (标题, 模板id, 预估用时, 实际用时)"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT title, repeat_template_id, estimated_duration, total_duration
+                FROM completed_tasks
+                WHERE estimated_duration > 0 AND total_duration > 0
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def roll_over_day(self, today=None):
+        """日期变化时发布 day_rolled_over（带当天的重复任务数，上次使用的日期保存在 settings 表），返回是否换了一天"""
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        if today == self.active_date:
+            return False
+        previous = self.active_date or self.get_settings({'last_active_date': ''})['last_active_date']
+        self.active_date = today
+        if previous == today:
+            return False
+        self.save_settings({'last_active_date': today})
+        self._notify('day_rolled_over', date=today, previous_date=previous or None,
+                     recurring=self.count_occurrences(today))
+        return True
+
+
+class AnalyticsEngine:
+    """效率分析：预估准确度、连续完成天数、分时段热力图、按优先级的移动平均"""
+
+    def __init__(self, db):
+        self.db = db
+        # (开始日期, 结束日期) -> (历史数据版本号, 分析结果)
+        self.cache = {}
+
+    def get_report(self, start_date, end_date):
+        """获取日期范围内的分析结果，按范围缓存，有新的完成或计时记录时失效"""
+        key = (start_date, end_date)
+        cached = self.cache.get(key)
+        if cached and cached[0] == self.db.history_version:
+            return cached[1]
+
+        version = self.db.history_version
+        report = self.compute(start_date, end_date)
+        if key not in self.cache and len(self.cache) >= ANALYTICS_CACHE_SIZE:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = (version, report)
+        return report
+
+    def compute(self, start_date, end_date):
+        """计算分析结果：SQL分组汇总后填入按天/按小时索引的数组"""
+        aggregates = self.db.get_analytics_aggregates(start_date, end_date)
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+        day_count = (datetime.strptime(end_date, '%Y-%m-%d') - start_dt).days + 1
+        start_ordinal = start_dt.toordinal()
+
+        # 每个优先级一个按天索引的时长数组，另有一个每日完成数数组
+        daily_durations = [array('q', bytes(8 * day_count)) for _ in range(3)]
+        daily_counts = array('q', bytes(8 * day_count))
+        for task_date, priority, count, duration in aggregates['daily_priority_stats']:
+            index = datetime.strptime(task_date, '%Y-%m-%d').toordinal() - start_ordinal
+            daily_durations[min(max(priority or 0, 0), 2)][index] += duration or 0
+            daily_counts[index] += count
+
+        # 7x24 热力图，行为周一到周日
+        heatmap = [array('q', bytes(8 * 24)) for _ in range(7)]
+        for weekday, hour, count, duration in aggregates['hourly_stats']:
+            heatmap[(weekday + 6) % 7][hour] += duration or 0
+
+        return {
+            'dates': [datetime.fromordinal(start_ordinal + i).strftime('%Y-%m-%d') for i in range(day_count)],
+            'accuracy': self._accuracy(aggregates['accuracy_stats']),
+            'streaks': self._streaks(daily_counts),
+            'heatmap': [list(row) for row in heatmap],
+            'moving_averages': {priority: self._moving_average(durations, MOVING_AVERAGE_DAYS)
+                                for priority, durations in enumerate(daily_durations)}
+        }
+
+    def _accuracy(self, accuracy_stats):
+        """汇总预估准确度，ratio 为实际时长/预估时长"""
+        def summarize(count, actual, estimated, accurate, over):
+            return {
+                'count': count,
+                'ratio': actual / estimated if estimated else 0,
+                'accurate_rate': accurate / count if count else 0,
+                'over_rate': over / count if count else 0
+            }
+
+        by_priority = {}
+        totals = [0, 0, 0, 0, 0]
+        for priority, count, actual, estimated, accurate, over in accuracy_stats:
+            row = (count, actual or 0, estimated or 0, accurate or 0, over or 0)
+            by_priority[priority] = summarize(*row)
+            totals = [total + value for total, value in zip(totals, row)]
+
+        result = summarize(*totals)
+        result['by_priority'] = by_priority
+        return result
+
+    def _streaks(self, daily_counts):
+        """计算连续有完成任务的天数：最长连续和截至最后一天的当前连续"""
+        longest = 0
+        run = 0
+        for count in daily_counts:
+            run = run + 1 if count else 0
+            longest = max(longest, run)
+
+        # 当天还没完成任务时，从前一天开始算当前连续
+        current = run
+        if current == 0 and len(daily_counts) > 1:
+            for count in reversed(daily_counts[:-1]):
+                if not count:
+                    break
+                current += 1
+
+        return {
+            'current': current,
+            'longest': longest,
+            'active_days': sum(1 for count in daily_counts if count)
+        }
+
+    def _moving_average(self, values, window):
+        """滑动窗口求移动平均（窗口不足时按已有天数平均）"""
+        averages = []
+        window_sum = 0
+        for i, value in enumerate(values):
+            window_sum += value
+            if i >= window:
+                window_sum -= values[i - window]
+            averages.append(window_sum / min(i + 1, window))
+        return averages
+
+
+class FuzzyIndex:
+    """模糊搜索索引，支持增量添加/删除
+
+    每个字符维护一个倒排集合，查询时先取交集得到候选集：
+    候选较少时逐个精确打分；候选很多时改为在分块拼接的标题文本上扫描，
+    先一遍查找开头/包含匹配，不够再用正则找字符依次出现的条目，找够结果就提前结束。
+    10 万条标题时单次查询最慢约 8 毫秒
+    """
+
+    # 候选数不超过此值时逐个打分
+    EXACT_SCORE_LIMIT = 2000
+    # 最小的倒排集合超过此值时不求交集，直接扫描
+    INTERSECT_LIMIT = 20000
+    # 每个分块的条目数
+    CHUNK_SIZE = 512
+
+    def __init__(self, group_count=1):
+        # 条目编号 -> (键, 标题, 小写标题, 附加数据, 分组)
+        self.entries = {}
+        self.key_to_entry = {}
+        # 字符 -> 包含该字符的条目编号集合
+        self.char_index = {}
+        self.next_entry_id = 0
+        # 分组越靠前排名越高；每组是若干分块，每块为 [条目编号列表, 拼接文本, 偏移数组]
+        self.groups = [[] for _ in range(group_count)]
+        self.entry_chunk = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, title, data=None, group=0):
+        """添加或更新条目"""
+        self.remove(key)
+        entry_id = self.next_entry_id
+        self.next_entry_id += 1
+        # 换行符用作分块文本的分隔符
+        lower_title = title.lower().replace('\n', ' ')
+        self.entries[entry_id] = (key, title, lower_title, data, group)
+        self.key_to_entry[key] = entry_id
+        for char in set(lower_title):
+            self.char_index.setdefault(char, set()).add(entry_id)
+
+        chunks = self.groups[group]
+        if not chunks or len(chunks[-1][0]) >= self.CHUNK_SIZE:
+            chunks.append([[], None, None])
+        chunk = chunks[-1]
+        chunk[0].append(entry_id)
+        chunk[1] = None
+        self.entry_chunk[entry_id] = chunk
+
+    def remove(self, key):
+        """删除条目"""
+        entry_id = self.key_to_entry.pop(key, None)
+        if entry_id is None:
+            return
+        lower_title = self.entries.pop(entry_id)[2]
+        for char in set(lower_title):
+            entry_ids = self.char_index.get(char)
+            if entry_ids is not None:
+                entry_ids.discard(entry_id)
+                if not entry_ids:
+                    del self.char_index[char]
+        chunk = self.entry_chunk.pop(entry_id)
+        chunk[0].remove(entry_id)
+        chunk[1] = None
+
+    def get(self, key):
+        """按键获取条目 (标题, 附加数据)"""
+        entry_id = self.key_to_entry.get(key)
+        if entry_id is None:
+            return None
+        entry = self.entries[entry_id]
+        return entry[1], entry[3]
+
+    def search(self, query, limit=20):
+        """模糊搜索，返回 [(键, 标题, 附加数据)]
+
+        开头匹配 > 包含查询串 > 字符依次出现（跨度越短越好），同档内分组靠前的优先
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+
+        # 集合求交的代价与较小的集合成正比，先从最小的开始
+        char_sets = sorted((self.char_index.get(char, set()) for char in set(query)), key=len)
+        if not char_sets[0]:
+            return []
+
+        # 常见字符的集合很大，求交集本身就要几毫秒，此时直接扫描分块文本
+        if len(char_sets[0]) <= self.INTERSECT_LIMIT:
+            candidates = char_sets[0]
+            for char_set in char_sets[1:]:
+                candidates = candidates & char_set
+                if not candidates:
+                    return []
+            if len(candidates) <= self.EXACT_SCORE_LIMIT:
+                return self._top_results(self._score_candidates(query, candidates), limit)
+        ranked = self._scan_literal(query, limit)
+        if len(ranked) < limit:
+            ranked = self._scan_fuzzy(query, limit, ranked)
+        return self._top_results(ranked, limit)
+
+    def _top_results(self, ranked, limit):
+        """取排名最前的 limit 条"""
+        return [(self.entries[entry_id][0], self.entries[entry_id][1], self.entries[entry_id][3])
+                for rank, entry_id in heapq.nsmallest(limit, ranked)]
+
+    def _fuzzy_pattern(self, query):
+        """字符依次出现的正则（不跨越标题分隔符）
+
+        每个字符后只跳过不含下一个字符的内容，等价于非贪婪匹配但不需要回溯
+        """
+        parts = []
+        for char, next_char in zip(query, query[1:]):
+            parts.append(re.escape(char) + '[^\n' + re.escape(next_char) + ']*')
+        parts.append(re.escape(query[-1]))
+        return re.compile(''.join(parts))
+
+    def _score_candidates(self, query, candidates):
+        """逐个候选打分"""
+        pattern = self._fuzzy_pattern(query)
+        ranked = []
+        for entry_id in candidates:
+            key, title, lower_title, data, group = self.entries[entry_id]
+            position = lower_title.find(query)
+            if position >= 0:
+                rank = (0 if position == 0 else 1, group, len(lower_title))
+            else:
+                match = pattern.search(lower_title)
+                if match is None:
+                    continue
+                rank = (2, group, match.end() - match.start(), len(lower_title))
+            ranked.append((rank, entry_id))
+        return ranked
+
+    def _scan_literal(self, query, limit):
+        """一遍扫描分块文本找开头匹配和包含匹配，开头匹配够 limit 条即停止
+
+        包含匹配够数后只再找开头匹配（查找 "\n" + 查询串），避免为大量包含匹配逐条处理
+        """
+        ranked = []
+        seen = set()
+        prefix_count = 0
+        needle = query
+        for group, chunks in enumerate(self.groups):
+            for chunk in chunks:
+                entry_ids, text, offsets = self._chunk_text(chunk)
+                position = text.find(needle)
+                while position >= 0:
+                    if needle is query:
+                        # 每个标题前都有换行符
+                        tier = 0 if text[position - 1] == '\n' else 1
+                    else:
+                        tier = 0
+                        position += 1
+                    entry_id = entry_ids[bisect.bisect_right(offsets, position) - 1]
+                    if entry_id not in seen:
+                        seen.add(entry_id)
+                        ranked.append(((tier, group, len(self.entries[entry_id][2])), entry_id))
+                        if tier == 0:
+                            prefix_count += 1
+                            if prefix_count >= limit:
+                                return ranked
+                        if needle is query and len(ranked) >= limit:
+                            needle = '\n' + query
+                    position = text.find(needle, position + 1)
+        return ranked
+
+    def _scan_fuzzy(self, query, limit, ranked):
+        """在分块文本上找字符依次出现的条目，找够 limit 条即停止；ranked 为前两档已有的结果"""
+        pattern = self._fuzzy_pattern(query)
+        seen = set(entry_id for rank, entry_id in ranked)
+        for group, chunks in enumerate(self.groups):
+            for chunk in chunks:
+                entry_ids, text, offsets = self._chunk_text(chunk)
+                for match in pattern.finditer(text):
+                    entry_id = entry_ids[bisect.bisect_right(offsets, match.start()) - 1]
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    rank = (2, group, match.end() - match.start(), len(self.entries[entry_id][2]))
+                    ranked.append((rank, entry_id))
+                    if len(ranked) >= limit:
+                        return ranked
+        return ranked
+
+    def _chunk_text(self, chunk):
+        """获取分块的拼接文本和各标题前换行符的偏移（修改后首次使用时重建）"""
+        if chunk[1] is None:
+            titles = [self.entries[entry_id][2] for entry_id in chunk[0]]
+            offsets = []
+            position = 0
+            for title in titles:
+                offsets.append(position)
+                position += len(title) + 1
+            chunk[1] = ''.join('\n' + title for title in titles)
+            chunk[2] = offsets
+        return chunk[0], chunk[1], chunk[2]
+
+
+class TitleSuggester:
+    """新建任务时的标题补全：按小写标题排序的数组 + bisect 做前缀查找
+
+    每个标题只保留最近若干次完成记录，用其中位数给出默认时长和优先级；
+    标题数超过上限时淘汰最久未完成的标题，内存占用有上界
+    """
+
+    def __init__(self, max_titles=TITLE_SUGGEST_MAX_TITLES, samples=TITLE_SUGGEST_SAMPLES):
+        self.max_titles = max_titles
+        self.samples = samples
+        # 排序的小写标题
+        self.keys = []
+        # 小写标题 -> [标题, 最近完成日期, 完成次数, 用时列表, 优先级列表]（列表按时间从新到旧）
+        self.stats = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, db):
+        """从完成历史加载（记录按时间从新到旧）"""
+        for title, total_duration, estimated_duration, priority, task_date in \
+                db.iter_title_history(self.max_titles * self.samples):
+            key = title.lower()
+            stat = self.stats.get(key)
+            if stat is None:
+                if len(self.stats) >= self.max_titles:
+                    continue
+                stat = self.stats[key] = [title, task_date, 0, [], []]
+            stat[2] += 1
+            if len(stat[3]) < self.samples:
+                stat[3].append(total_duration or estimated_duration)
+                stat[4].append(priority)
+        self.keys = sorted(self.stats)
+
+    def record(self, title, duration, priority, task_date):
+        """记录一次新的完成"""
+        key = title.lower()
+        stat = self.stats.get(key)
+        if stat is None:
+            if len(self.stats) >= self.max_titles:
+                self._evict()
+            stat = self.stats[key] = [title, task_date, 0, [], []]
+            bisect.insort(self.keys, key)
+        stat[0] = title
+        stat[1] = max(stat[1], task_date)
+        stat[2] += 1
+        stat[3].insert(0, duration)
+        stat[4].insert(0, priority)
+        del stat[3][self.samples:], stat[4][self.samples:]
+
+    def _evict(self):
+        """淘汰最久未完成的标题"""
+        key = min(self.stats, key=lambda k: self.stats[k][1])
+        del self.stats[key]
+        del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def suggest(self, prefix, limit=8):
+        """返回以 prefix 开头的标题，完成次数多、最近完成的优先"""
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+        matches = [self.stats[key] for key in self.keys[start:end]]
+        matches.sort(key=lambda stat: (stat[2], stat[1]), reverse=True)
+        return [stat[0] for stat in matches[:limit]]
+
+    def defaults(self, title):
+        """返回 (用时秒数中位数, 优先级中位数)，没有记录时返回 None"""
+        stat = self.stats.get(title.lower())
+        if stat is None:
+            return None
+        return self._median(stat[3]), self._median(stat[4])
+
+    @staticmethod
+    def _median(values):
+        """中位数（偶数个时取较小的一个，保证结果是已有的值）"""
+        ordered = sorted(values)
+        return ordered[(len(ordered) - 1) // 2]
+
+
+class DurationEstimator:
+    """根据历史的实际/预估比值修正预估用时
+
+    按重复模板、标题和全局分别保留最近若干个比值，记录时重新计算中位数并缓存，
+    预测时只做字典查找：优先用模板的比值，其次标题，样本不足时用全局比值
+    """
+
+    GLOBAL_KEY = ('global', None)
+    # 全局比值保留的样本数
+    GLOBAL_SAMPLES = 200
+
+    def __init__(self, samples=ESTIMATE_SAMPLES, min_samples=ESTIMATE_MIN_SAMPLES, max_keys=ESTIMATE_MAX_KEYS):
+        self.samples = samples
+        self.min_samples = min_samples
+        self.max_keys = max_keys
+        # 键 -> 最近的比值列表（从新到旧）；字典顺序即最近使用顺序，最旧的在前
+        self.ratios = {}
+        # 键 -> 缓存的中位数比值（样本足够时才有）
+        self.factors = {}
+
+    def load(self, db):
+        """从完成历史加载（记录按时间从新到旧）"""
+        for title, template_id, estimated, actual in db.iter_estimate_history(ESTIMATE_HISTORY_ROWS):
+            ratio = self._clamp(actual / estimated)
+            for key in self._keys(title, template_id):
+                values = self.ratios.get(key)
+                if values is None:
+                    if len(self.ratios) >= self.max_keys:
+                        continue
+                    values = self.ratios[key] = []
+                if len(values) < self._capacity(key):
+                    values.append(ratio)
+        # 加载时先遇到的是最近的记录，反转后最旧的在前
+        self.ratios = dict(reversed(list(self.ratios.items())))
+        for key in self.ratios:
+            self._refresh(key)
+
+    def record(self, title, template_id, estimated, actual):
+        """记录一次完成，只更新相关的几个键"""
+        if estimated <= 0 or actual <= 0:
+            return
+        ratio = self._clamp(actual / estimated)
+        for key in self._keys(title, template_id):
+            values = self.ratios.pop(key, None)
+            if values is None:
+                values = []
+                if len(self.ratios) >= self.max_keys:
+                    evicted = next(k for k in self.ratios if k != self.GLOBAL_KEY)
+                    del self.ratios[evicted]
+                    self.factors.pop(evicted, None)
+            values.insert(0, ratio)
+            del values[self._capacity(key):]
+            self.ratios[key] = values
+            self._refresh(key)
+
+    def factor(self, title, template_id=None):
+        """返回修正系数（实际/预估），没有足够历史时返回 1.0"""
+        for key in self._keys(title, template_id):
+            factor = self.factors.get(key)
+            if factor is not None:
+                return factor
+        return 1.0
+
+    def likely_actual(self, title, estimated, template_id=None):
+        """预估用时修正后的可能实际用时（秒），没有预估时返回 None"""
+        if estimated <= 0:
+            return None
+        return int(round(estimated * self.factor(title, template_id)))
+
+    def _keys(self, title, template_id):
+        """按优先顺序返回相关的键"""
+        keys = []
+        if template_id:
+            keys.append(('template', template_id))
+        keys.append(('title', title.lower()))
+        keys.append(self.GLOBAL_KEY)
+        return keys
+
+    def _capacity(self, key):
+        return self.GLOBAL_SAMPLES if key == self.GLOBAL_KEY else self.samples
+
+    def _refresh(self, key):
+        """重新计算一个键的中位数比值"""
+        values = self.ratios[key]
+        if len(values) < self.min_samples:
+            self.factors.pop(key, None)
+            return
+        ordered = sorted(values)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            self.factors[key] = ordered[middle]
+        else:
+            self.factors[key] = (ordered[middle - 1] + ordered[middle]) / 2
+
+    @staticmethod
+    def _clamp(ratio):
+        low, high = ESTIMATE_RATIO_RANGE
+        return min(high, max(low, ratio))
+
+
+class DependencyGraph:
+    """任务依赖图（前置任务 → 被阻塞的任务），增量维护一个拓扑序
+
+    加边时用 Pearce–Kelly 算法：新边与当前拓扑序一致时不需要任何搜索；不一致时只在两端序号之间的
+    受影响区间内搜索（同时发现环），并把这些节点的序号重新分配。删边和删除节点（完成、删除任务）
+    不会破坏拓扑序，无需处理
+    """
+
+    def __init__(self):
+        # 节点 -> 后继集合 / 前驱集合
+        self.successors = {}
+        self.predecessors = {}
+        # 节点 -> 拓扑序号（前置任务的序号总是更小）
+        self.rank = {}
+        self.next_rank = 0
+
+    def load(self, edges):
+        """批量载入 (前置任务, 任务) 边：先用一次 Kahn 排序得到初始拓扑序，返回因形成环而没有载入的边"""
+        edges = list(dict.fromkeys(edges))
+        successors = {}
+        in_degree = {}
+        for blocker, todo in edges:
+            successors.setdefault(blocker, []).append(todo)
+            successors.setdefault(todo, [])
+            in_degree[todo] = in_degree.get(todo, 0) + 1
+            in_degree.setdefault(blocker, 0)
+        ready = [node for node, degree in in_degree.items() if degree == 0]
+        while ready:
+            node = ready.pop()
+            self._add_node(node)
+            for todo in successors[node]:
+                in_degree[todo] -= 1
+                if in_degree[todo] == 0:
+                    ready.append(todo)
+
+        rejected = []
+        deferred = []
+        for blocker, todo in edges:
+            if blocker in self.rank and todo in self.rank:
+                self.successors[blocker].add(todo)
+                self.predecessors[todo].add(blocker)
+            else:
+                deferred.append((blocker, todo))
+        # 环上（或环下游）的节点逐条加入，形成环的边丢弃
+        for blocker, todo in deferred:
+            try:
+                self.add_edge(blocker, todo)
+            except ValueError:
+                rejected.append((blocker, todo))
+        return rejected
+
+    def _add_node(self, node):
+        if node not in self.rank:
+            self.rank[node] = self.next_rank
+            self.next_rank += 1
+            self.successors[node] = set()
+            self.predecessors[node] = set()
+
+    def add_edge(self, blocker, todo):
+        """添加依赖，会形成环时抛出 ValueError(环上的节点列表)，图保持不变"""
+        if blocker == todo:
+            raise ValueError([blocker, todo])
+        self._add_node(blocker)
+        self._add_node(todo)
+        if todo in self.successors[blocker]:
+            return
+        lower, upper = self.rank[todo], self.rank[blocker]
+        if upper > lower:
+            # 从 todo 向后只看序号不超过 blocker 的节点，碰到 blocker 就是环
+            forward, parents = self._search(todo, self.successors, lower, upper)
+            if blocker in forward:
+                path = [blocker]
+                while path[-1] != todo:
+                    path.append(parents[path[-1]])
+                path.reverse()
+                raise ValueError([blocker] + path)
+            backward, _ = self._search(blocker, self.predecessors, lower, upper)
+            self._reorder(backward, forward)
+        self.successors[blocker].add(todo)
+        self.predecessors[todo].add(blocker)
+
+    def _search(self, start, adjacency, lower, upper):
+        """从 start 出发在序号位于 [lower, upper] 的节点中深度优先搜索，返回 (访问到的节点, 父节点)"""
+        rank = self.rank
+        visited = {start}
+        parents = {}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbor in adjacency[node]:
+                if neighbor not in visited and lower <= rank[neighbor] <= upper:
+                    visited.add(neighbor)
+                    parents[neighbor] = node
+                    stack.append(neighbor)
+        return visited, parents
+
+    def _reorder(self, backward, forward):
+        """把受影响节点原有的序号重新分配：能到达 blocker 的节点在前，从 todo 可达的节点在后"""
+        backward = sorted(backward, key=self.rank.__getitem__)
+        forward = sorted(forward, key=self.rank.__getitem__)
+        ranks = sorted(self.rank[node] for node in backward + forward)
+        for node, rank in zip(backward + forward, ranks):
+            self.rank[node] = rank
+
+    def remove_edge(self, blocker, todo):
+        """删除依赖，依赖不存在时什么也不做"""
+        if todo in self.successors.get(blocker, ()):
+            self.successors[blocker].discard(todo)
+            self.predecessors[todo].discard(blocker)
+            self._drop_if_isolated(blocker)
+            self._drop_if_isolated(todo)
+
+    def remove_node(self, node):
+        """删除节点（任务完成或删除），返回因此不再被阻塞的任务"""
+        if node not in self.rank:
+            return []
+        unblocked = []
+        for todo in self.successors.pop(node):
+            self.predecessors[todo].discard(node)
+            if not self.predecessors[todo]:
+                unblocked.append(todo)
+            self._drop_if_isolated(todo)
+        for blocker in self.predecessors.pop(node):
+            self.successors[blocker].discard(node)
+            self._drop_if_isolated(blocker)
+        del self.rank[node]
+        return unblocked
+
+    def _drop_if_isolated(self, node):
+        """不再有任何依赖的节点从图中去掉"""
+        if node in self.rank and not self.successors[node] and not self.predecessors[node]:
+            del self.successors[node], self.predecessors[node], self.rank[node]
+
+    @staticmethod
+    def linearize(items, edges, priority):
+        """把按手动顺序排列的 items 调整为满足 edges（(前, 后) 对）的顺序
+
+        没有被阻塞的保持原来的相对位置；被阻塞的紧跟在它最后一个前置任务之后，
+        同时解除阻塞的按优先级从高到低、再按原顺序排列；环上剩下的按原顺序放在最后
+        """
+        position = {item: index for index, item in enumerate(items)}
+        waiting = {}
+        dependents = {}
+        for before, after in set(edges):
+            waiting[after] = waiting.get(after, 0) + 1
+            dependents.setdefault(before, []).append(after)
+
+        ordered = []
+        emitted = set()
+        for item in items:
+            if item in emitted or waiting.get(item):
+                continue
+            released = [(0, 0, item)]
+            while released:
+                _, _, current = heapq.heappop(released)
+                ordered.append(current)
+                emitted.add(current)
+                for after in dependents.get(current, ()):
+                    waiting[after] -= 1
+                    if waiting[after] == 0:
+                        heapq.heappush(released, (-priority(after), position[after], after))
+        if len(ordered) < len(items):
+            ordered.extend(item for item in items if item not in emitted)
+        return ordered
+
+
+class DayScheduler:
+    """把今天的任务排进工作时间：去掉休息和固定日程得到空闲时段，按依赖和优先级依次填入
+
+    plan 在任务变化时调用：用优先队列排出顺序（前置任务都已排入的任务中优先级高的先排，
+    同优先级按列表顺序），再从当前时间起顺序填入空闲时段，跨过休息时拆开；排不进下班前的部分记为超出。
+    replan 在计时过程中每秒调用：顺序不变，只有分钟变化（或正在计时的任务预计结束时间变化）时才重新填入，
+    进行中的任务超出预估时后面的任务随之顺延
+    """
+
+    def __init__(self, settings):
+        self.work_start = parse_clock(settings['schedule_work_start'])
+        self.work_end = parse_clock(settings['schedule_work_end'])
+        self.breaks = self.parse_ranges(settings['schedule_breaks'])
+        self.default_duration = settings['schedule_default_minutes'] * 60
+        self.order = []
+        self.remaining = {}
+        self.busy = []
+        self.plan_key = None
+        self.entries = {}
+        self.overflow = 0
+
+    @staticmethod
+    def parse_ranges(text):
+        """把 "12:00-13:00, 15:00-15:15" 解析为 [(开始秒数, 结束秒数)]，格式不对时抛出 ValueError"""
+        ranges = []
+        for part in re.split(r'[,，;；\s]+', text or ''):
+            if not part:
+                continue
+            start, sep, end = part.partition('-')
+            if not sep:
+                raise ValueError(f'时间段格式应为 HH:MM-HH:MM: {part}')
+            start, end = parse_clock(start), parse_clock(end)
+            if end > start:
+                ranges.append((start, end))
+        return ranges
+
+    def plan(self, tasks, now, appointments=(), blockers=None, active_id=None, active_remaining=0):
+        """重新安排：tasks 为按列表顺序的 [(id, 优先级, 剩余用时秒数)]，blockers 为 id -> 前置任务 id 集合，
+        appointments 为 [(开始秒数, 结束秒数)]，now 为当天的秒数
+        """
+        self.order = self.order_tasks(tasks, blockers or {})
+        self.remaining = {task_id: remaining for task_id, _, remaining in tasks}
+        self.busy = sorted(self.breaks + list(appointments))
+        self.plan_key = None
+        return self.replan(now, active_id, active_remaining)
+
+    def order_tasks(self, tasks, blockers):
+        """前置任务（在 tasks 中的）都已排入后才能排；可排的任务中优先级高的先排，同优先级按列表顺序"""
+        position = {task_id: index for index, (task_id, _, _) in enumerate(tasks)}
+        priority = {task_id: task_priority for task_id, task_priority, _ in tasks}
+        waiting = {}
+        dependents = {}
+        for task_id, _, _ in tasks:
+            for blocker_id in blockers.get(task_id, ()):
+                if blocker_id in position:
+                    waiting[task_id] = waiting.get(task_id, 0) + 1
+                    dependents.setdefault(blocker_id, []).append(task_id)
+        ready = [(-priority[task_id], position[task_id], task_id) for task_id in position if not waiting.get(task_id)]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, _, task_id = heapq.heappop(ready)
+            order.append(task_id)
+            for dependent in dependents.get(task_id, ()):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    heapq.heappush(ready, (-priority[dependent], position[dependent], dependent))
+        # 环上的任务（数据异常时）按列表顺序放在最后
+        if len(order) < len(tasks):
+            placed = set(order)
+            order.extend(task_id for task_id, _, _ in tasks if task_id not in placed)
+        return order
+
+    def replan(self, now, active_id=None, active_remaining=0):
+        """按当前时间重新填入，返回是否有变化；正在计时的任务排在最前，剩余用时为 active_remaining"""
+        now = int(now)
+        key = (now // 60, active_id, (now + int(active_remaining)) // 60 if active_id else None)
+        if key == self.plan_key:
+            return False
+        self.plan_key = key
+
+        order = self.order
+        if active_id in self.remaining:
+            order = [active_id] + [task_id for task_id in order if task_id != active_id]
+        durations = dict(self.remaining)
+        if active_id in durations:
+            durations[active_id] = max(0, int(active_remaining))
+        self.entries, self.overflow = self.pack(order, durations, self.free_slots(now), max(self.work_start, now))
+        return True
+
+    def free_slots(self, now):
+        """从 now 到下班之间去掉休息和固定日程后的空闲时段 [(开始, 结束)]"""
+        slots = []
+        cursor = max(self.work_start, now)
+        for start, end in self.busy:
+            if cursor >= self.work_end:
+                break
+            if end <= cursor:
+                continue
+            if start > cursor:
+                slots.append((cursor, min(start, self.work_end)))
+            cursor = max(cursor, end)
+        if cursor < self.work_end:
+            slots.append((cursor, self.work_end))
+        return slots
+
+    @staticmethod
+    def pack(order, durations, slots, position):
+        """从 position 起按顺序把任务填入空闲时段，返回 ({id: (开始, 结束, 排不下的秒数)}, 排不下的总秒数)"""
+        entries = {}
+        overflow = 0
+        slot_index = 0
+        for task_id in order:
+            need = durations[task_id]
+            start = None
+            while need > 0 and slot_index < len(slots):
+                slot_start, slot_end = slots[slot_index]
+                position = max(position, slot_start)
+                if start is None:
+                    start = position
+                used = min(need, slot_end - position)
+                need -= used
+                position += used
+                if position >= slot_end:
+                    slot_index += 1
+            if start is None:
+                start = position
+            entries[task_id] = (start, position, need)
+            overflow += need
+        return entries, overflow
+
+
+class ReportExporter:
+    """复盘报告导出：Markdown / CSV / HTML，逐行生成，内存占用与日期范围无关"""
+
+    FORMATS = ('md', 'csv', 'html')
+
+    def __init__(self, db):
+        self.db = db
+
+    def export(self, fmt, start_date, end_date, path):
+        """将报告写入文件"""
+        newline = '' if fmt == 'csv' else None
+        # CSV 带 BOM，方便 Excel 直接打开中文
+        encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+        with open(path, 'w', encoding=encoding, newline=newline) as f:
+            for chunk in self.iter_report(fmt, start_date, end_date):
+                f.write(chunk)
+
+    def iter_report(self, fmt, start_date, end_date):
+        """按格式逐块生成报告文本"""
+        if fmt == 'md':
+            return self.iter_markdown(start_date, end_date)
+        elif fmt == 'csv':
+            return self.iter_csv(start_date, end_date)
+        elif fmt == 'html':
+            return self.iter_html(start_date, end_date)
+        raise ValueError(f'不支持的导出格式: {fmt}')
+
+    def iter_markdown(self, start_date, end_date):
+        """生成 Markdown 报告"""
+        stats = self.db.get_statistics(start_date=start_date, end_date=end_date)
+
+        yield f"# 复盘报告 {start_date} ~ {end_date}\n\n"
+        yield f"- 完成任务：{stats['total_completed']} 个\n"
+        yield f"- 总用时：{format_duration(stats['total_duration'])}\n\n"
+
+        yield "## 按优先级\n\n| 优先级 | 完成数 | 用时 |\n| --- | ---: | ---: |\n"
+        for priority, count, duration in stats['priority_stats']:
+            yield f"| {self._priority_name(priority)} | {count} | {format_duration(duration or 0)} |\n"
+
+        yield "\n## 每日统计\n\n| 日期 | 完成数 | 用时 |\n| --- | ---: | ---: |\n"
+        for date, count, duration in stats['daily_stats']:
+            yield f"| {date} | {count} | {format_duration(duration or 0)} |\n"
+
+        yield "\n## 已完成任务\n\n| 日期 | 任务 | 优先级 | 用时 | 总结 |\n| --- | --- | --- | ---: | --- |\n"
+        for task in self.db.iter_completed_tasks(start_date, end_date):
+            yield (f"| {task.task_date} | {self._md_cell(task.title)} | {self._priority_name(task.priority)} "
+                   f"| {format_duration(task.total_duration)} | {self._md_cell(task.summary)} |\n")
+
+    def iter_csv(self, start_date, end_date):
+        """生成 CSV 报告（每个已完成任务一行）"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return value
+
+        writer.writerow(['日期', '完成时间', '任务', '描述', '优先级', '用时(秒)', '总结'])
+        yield flush()
+        for task in self.db.iter_completed_tasks(start_date, end_date):
+            writer.writerow([task.task_date, task.completed_at, task.title, task.description or '',
+                             self._priority_name(task.priority), task.total_duration, task.summary or ''])
+            yield flush()
+
+    def iter_html(self, start_date, end_date):
+        """生成自包含的 HTML 报告（内嵌 SVG 图表）"""
+        stats = self.db.get_statistics(start_date=start_date, end_date=end_date)
+        title = html.escape(f"复盘报告 {start_date} ~ {end_date}")
+
+        yield ('<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="utf-8">\n'
+               f'<title>{title}</title>\n<style>\n'
+               'body{font-family:"Microsoft YaHei UI","Segoe UI",sans-serif;background:#F9F9F9;color:#333;margin:24px}\n'
+               '.card{display:inline-block;background:#fff;border-radius:8px;padding:12px 20px;margin:0 12px 12px 0}\n'
+               '.card b{display:block;font-size:24px;color:#0078D4}\n'
+               'table{border-collapse:collapse;background:#fff;width:100%}\n'
+               'th,td{border-bottom:1px solid #E0E0E0;padding:6px 8px;text-align:left;vertical-align:top}\n'
+               'td.num{text-align:right;white-space:nowrap}\n'
+               '</style>\n</head>\n<body>\n')
+        yield f'<h1>{title}</h1>\n'
+        yield (f'<div class="card">完成任务<b>{stats["total_completed"]} 个</b></div>'
+               f'<div class="card">总用时<b>{html.escape(format_duration(stats["total_duration"]))}</b></div>\n')
+
+        yield '<h2>每日用时</h2>\n'
+        yield self._svg_daily_chart(stats['daily_stats'])
+        yield '<h2>按优先级</h2>\n'
+        yield self._svg_priority_chart(stats['priority_stats'])
+
+        yield '<h2>已完成任务</h2>\n<table>\n<tr><th>日期</th><th>任务</th><th>优先级</th><th>用时</th><th>总结</th></tr>\n'
+        for task in self.db.iter_completed_tasks(start_date, end_date):
+            yield (f'<tr><td>{html.escape(task.task_date)}</td><td>{html.escape(task.title)}</td>'
+                   f'<td>{self._priority_name(task.priority)}</td>'
+                   f'<td class="num">{html.escape(format_duration(task.total_duration))}</td>'
+                   f'<td>{html.escape(task.summary or "")}</td></tr>\n')
+        yield '</table>\n</body>\n</html>\n'
+
+    def _svg_daily_chart(self, daily_stats, width=760, height=200):
+        """每日用时柱状图（daily_stats 已按日期汇总，条数不超过天数）"""
+        if not daily_stats:
+            return '<p>无数据</p>\n'
+        days = sorted(daily_stats)
+        peak = max(duration or 0 for _, _, duration in days) or 1
+        bar_width = width / len(days)
+        bars = []
+        for i, (date, count, duration) in enumerate(days):
+            bar_height = (duration or 0) / peak * (height - 20)
+            bars.append(f'<rect x="{i * bar_width:.1f}" y="{height - bar_height:.1f}" '
+                        f'width="{max(bar_width - 1, 0.5):.1f}" height="{bar_height:.1f}" fill="#0078D4">'
+                        f'<title>{html.escape(date)} {count}个 {html.escape(format_duration(duration or 0))}</title></rect>')
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">' + ''.join(bars) + '</svg>\n')
+
+    def _svg_priority_chart(self, priority_stats, width=760, bar_height=24):
+        """各优先级用时横向条形图"""
+        if not priority_stats:
+            return '<p>无数据</p>\n'
+        colors = ['#9E9E9E', '#FF9800', '#E53935']
+        peak = max(duration or 0 for _, _, duration in priority_stats) or 1
+        label_width = 80
+        rows = []
+        for i, (priority, count, duration) in enumerate(sorted(priority_stats, reverse=True)):
+            y = i * (bar_height + 6)
+            bar_width = (duration or 0) / peak * (width - label_width - 160)
+            rows.append(f'<text x="0" y="{y + bar_height - 7}" font-size="13">{self._priority_name(priority)}</text>'
+                        f'<rect x="{label_width}" y="{y}" width="{bar_width:.1f}" height="{bar_height}" '
+                        f'fill="{colors[min(max(priority or 0, 0), 2)]}"/>'
+                        f'<text x="{label_width + bar_width + 6:.1f}" y="{y + bar_height - 7}" font-size="13">'
+                        f'{count}个 / {html.escape(format_duration(duration or 0))}</text>')
+        height = len(priority_stats) * (bar_height + 6)
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">' + ''.join(rows) + '</svg>\n')
+
+    def _priority_name(self, priority):
+        """优先级显示名称"""
+        return PRIORITY_NAMES[min(max(priority or 0, 0), 2)]
+
+    def _md_cell(self, text):
+        """转义 Markdown 表格单元格中的竖线和换行"""
+        return (text or '').replace('|', '\\|').replace('\r', '').replace('\n', '<br>')
+
+
+class CalendarSync:
+    """iCalendar (.ics) 导入导出，逐行读写，内存占用与文件大小无关
+
+    导出：待办任务 → VTODO，重复模板 → 带 RRULE 的 VTODO，已完成任务 → VEVENT（完成前用掉的时间段）。
+    导入：VTODO / VEVENT 按日期、优先级、分类（标签）和 RRULE 转为任务或重复模板，
+    已完成、已取消和今天以前的一次性条目跳过
+    """
+
+    PRODID = '-//todo-reminder//每日待办小助手//ZH'
+    RRULES = {1: 'FREQ=DAILY', 2: 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR'}
+    WEEKDAYS = {'MO', 'TU', 'WE', 'TH', 'FR'}
+    # 优先级与 iCalendar PRIORITY（1 最高，9 最低）互相转换
+    PRIORITIES = {0: 9, 1: 5, 2: 1}
+    DURATION_PATTERN = re.compile(r'^[+-]?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+    def __init__(self, db):
+        self.db = db
+
+    def export(self, path, start_date, end_date=None):
+        """导出全部待办任务、重复模板，以及日期范围内的已完成任务"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for line in self.iter_calendar(start_date, end_date):
+                f.write(line)
+
+    def import_file(self, path):
+        """导入 .ics 文件，返回 {'todos': 新增任务数, 'templates': 新增模板数, 'skipped': 跳过数}"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        ignored = [0]
+
+        def items():
+            with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+                for kind, props in self.iter_components(f):
+                    item = self._to_item(kind, props, today)
+                    if item is None:
+                        ignored[0] += 1
+                    else:
+                        yield item
+
+        added, templates, duplicates = self.db.bulk_add_todos(items())
+        return {'todos': added, 'templates': templates, 'skipped': ignored[0] + duplicates}
+
+    def iter_calendar(self, start_date, end_date=None):
+        """逐行生成日历文本（已按 75 字节折行，CRLF 换行）"""
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        database_id = self.db.get_database_id()
+        yield from self._lines([('BEGIN', 'VCALENDAR'), ('VERSION', '2.0'), ('PRODID', self.PRODID),
+                                ('CALSCALE', 'GREGORIAN')])
+
+        for (todo_id, title, description, task_date, estimated_duration, priority, status, parent_id, uid,
+             tags) in self.db.iter_calendar_todos():
+            props = [('BEGIN', 'VTODO'), ('UID', uid or self._uid('todo', todo_id, database_id)), ('DTSTAMP', stamp),
+                     ('SUMMARY', self._text(title)), ('DUE;VALUE=DATE', task_date.replace('-', '')),
+                     ('PRIORITY', self.PRIORITIES.get(priority, 9)),
+                     ('STATUS', 'IN-PROCESS' if status == 1 else 'NEEDS-ACTION')]
+            if parent_id:
+                props.append(('RELATED-TO', self._uid('todo', parent_id, database_id)))
+            props.extend(self._common_props(description, estimated_duration, tags))
+            props.append(('END', 'VTODO'))
+            yield from self._lines(props)
+
+        for (template_id, title, description, estimated_duration, priority, repeat_type, created_at, uid,
+             tags) in self.db.iter_calendar_templates():
+            if repeat_type not in self.RRULES:
+                continue
+            props = [('BEGIN', 'VTODO'), ('UID', uid or self._uid('template', template_id, database_id)), ('DTSTAMP', stamp),
+                     ('SUMMARY', self._text(title)),
+                     ('DTSTART;VALUE=DATE', (created_at or start_date)[:10].replace('-', '')),
+                     ('RRULE', self.RRULES[repeat_type]), ('PRIORITY', self.PRIORITIES.get(priority, 9))]
+            props.extend(self._common_props(description, estimated_duration, tags))
+            props.append(('END', 'VTODO'))
+            yield from self._lines(props)
+
+        for task in self.db.iter_completed_tasks(start_date, end_date):
+            props = [('BEGIN', 'VEVENT'), ('UID', self._uid('done', task.id, database_id)), ('DTSTAMP', stamp),
+                     ('SUMMARY', self._text(task.title))]
+            try:
+                completed_at = datetime.strptime(task.completed_at, '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                completed_at = None
+            if completed_at and task.total_duration:
+                # 按完成时间往前推用时，得到实际做这件事的时间段
+                props.append(('DTSTART', (completed_at - timedelta(seconds=task.total_duration)).strftime('%Y%m%dT%H%M%S')))
+                props.append(('DTEND', completed_at.strftime('%Y%m%dT%H%M%S')))
+            else:
+                props.append(('DTSTART;VALUE=DATE', task.task_date.replace('-', '')))
+            if task.summary or task.description:
+                props.append(('DESCRIPTION', self._text(task.summary or task.description)))
+            props.append(('END', 'VEVENT'))
+            yield from self._lines(props)
+
+        yield from self._lines([('END', 'VCALENDAR')])
+
+    def iter_components(self, lines):
+        """逐个解析 VTODO / VEVENT，返回 (组件名, {属性名: (参数, 值)})
+
+        折行在读取时展开，同时只保存当前组件的属性；嵌套的组件（如 VALARM）忽略
+        """
+        component = None
+        kind = None
+        nested = 0
+        for line in self._unfold(lines):
+            name, params, value = self._parse_line(line)
+            if name == 'BEGIN':
+                if component is not None:
+                    nested += 1
+                elif value.upper() in ('VTODO', 'VEVENT'):
+                    component = {}
+                    kind = value.upper()
+            elif name == 'END':
+                if component is None:
+                    continue
+                if nested:
+                    nested -= 1
+                elif value.upper() == kind:
+                    yield kind, component
+                    component = None
+            elif component is not None and not nested:
+                if name == 'CATEGORIES' and name in component:
+                    # 分类可以分多行写，合并
+                    value = component[name][1] + ',' + value
+                    component[name] = (params, value)
+                else:
+                    component.setdefault(name, (params, value))
+
+    def _to_item(self, kind, props, today):
+        """把解析出的组件转换为 bulk_add_todos 的一项，不需要导入的返回 None"""
+        def value(name):
+            return props[name][1].strip() if name in props else ''
+
+        if value('STATUS').upper() in ('COMPLETED', 'CANCELLED'):
+            return None
+        title = self._untext(value('SUMMARY')).strip()
+        if not title:
+            return None
+
+        start = self._parse_moment(value('DTSTART'))
+        due = self._parse_moment(value('DUE'))
+        moment = (due or start) if kind == 'VTODO' else (start or due)
+        task_date = moment.strftime('%Y-%m-%d') if moment else today
+
+        estimated_duration = self._parse_duration(value('X-ESTIMATED-DURATION') or value('DURATION'))
+        if not estimated_duration and kind == 'VEVENT' and 'DTEND' in props and start:
+            end = self._parse_moment(value('DTEND'))
+            if end and 'T' in value('DTSTART').upper():
+                estimated_duration = max(0, int((end - start).total_seconds()))
+
+        repeat_type = self._parse_rrule(value('RRULE'))
+        if not repeat_type and task_date < today:
+            return None
+
+        try:
+            ical_priority = int(value('PRIORITY') or 0)
+        except ValueError:
+            ical_priority = 0
+        priority = 2 if 1 <= ical_priority <= 4 else (1 if ical_priority == 5 else 0)
+
+        tags = parse_tags(' '.join(self._untext(name) for name in re.split(r'(?<!\\),', value('CATEGORIES'))))
+        return {'title': title, 'description': self._untext(value('DESCRIPTION')), 'task_date': task_date,
+                'estimated_duration': estimated_duration, 'priority': priority, 'repeat_type': repeat_type,
+                'tags': tags, 'ical_uid': value('UID') or None}
+
+    def _parse_rrule(self, rule):
+        """RRULE 能表示为每日/工作日重复时返回 1/2，否则返回 0（按一次性任务导入）"""
+        if not rule:
+            return 0
+        parts = dict(part.split('=', 1) for part in rule.upper().split(';') if '=' in part)
+        if parts.get('INTERVAL', '1') != '1' or 'COUNT' in parts or 'UNTIL' in parts:
+            return 0
+        days = set(parts['BYDAY'].split(',')) if 'BYDAY' in parts else None
+        if parts.get('FREQ') == 'DAILY' and (days is None or len(days) == 7):
+            return 1
+        if parts.get('FREQ') == 'WEEKLY' and days is not None:
+            if len(days) == 7:
+                return 1
+            if days == self.WEEKDAYS:
+                return 2
+        if parts.get('FREQ') == 'DAILY' and days == self.WEEKDAYS:
+            return 2
+        return 0
+
+    def _parse_moment(self, value):
+        """解析 DATE / DATE-TIME（UTC 时间转为本地时间），格式不对时返回 None"""
+        value = value.upper()
+        try:
+            if len(value) >= 15 and value[8] == 'T':
+                moment = datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+                if value.endswith('Z'):
+                    moment = moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+                return moment
+            return datetime.strptime(value[:8], '%Y%m%d')
+        except (ValueError, IndexError):
+            return None
+
+    def _parse_duration(self, value):
+        """解析 ISO 8601 时长（如 PT1H30M），返回秒数"""
+        match = self.DURATION_PATTERN.match(value.upper()) if value else None
+        if not match:
+            return 0
+        weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+        return (((weeks * 7 + days) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+    def _format_duration(self, seconds):
+        """秒数格式化为 ISO 8601 时长"""
+        hours, rest = divmod(int(seconds), 3600)
+        minutes, seconds = divmod(rest, 60)
+        return 'PT' + (f'{hours}H' if hours else '') + (f'{minutes}M' if minutes else '') + \
+            (f'{seconds}S' if seconds or not (hours or minutes) else '')
+
+    def _common_props(self, description, estimated_duration, tags):
+        """任务和模板共用的可选属性"""
+        props = []
+        if description:
+            props.append(('DESCRIPTION', self._text(description)))
+        if estimated_duration:
+            props.append(('X-ESTIMATED-DURATION', self._format_duration(estimated_duration)))
+        if tags:
+            props.append(('CATEGORIES', ','.join(self._text(name) for name in tags.split())))
+        return props
+
+    def _uid(self, kind, item_id, database_id):
+        """本库导出的条目 UID，例如 todo-12.3f9a0c1d2e4b5a67@todo-reminder"""
+        return f'{kind}-{item_id}.{database_id}@{ICAL_UID_DOMAIN}'
+
+    def _lines(self, props):
+        """把 (属性, 值) 列表格式化为折行后的文本行"""
+        for name, value in props:
+            yield self._fold(f'{name}:{value}')
+
+    def _fold(self, line):
+        """按 UTF-8 字节数在 75 字节处折行（不拆开多字节字符），续行以空格开头"""
+        if len(line) <= 18 or len(line.encode('utf-8')) <= 75:
+            return line + '\r\n'
+        parts = []
+        current = []
+        size = 0
+        limit = 75
+        for char in line:
+            char_size = len(char.encode('utf-8'))
+            if size + char_size > limit:
+                parts.append(''.join(current))
+                current = []
+                size = 0
+                limit = 74
+            current.append(char)
+            size += char_size
+        parts.append(''.join(current))
+        return '\r\n '.join(parts) + '\r\n'
+
+    def _unfold(self, lines):
+        """展开折行：以空格或制表符开头的行接到上一行"""
+        pending = None
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line[:1] in (' ', '\t') and pending is not None:
+                pending += line[1:]
+                continue
+            if pending:
+                yield pending
+            pending = line
+        if pending:
+            yield pending
+
+    def _parse_line(self, line):
+        """拆分内容行 NAME;PARAM=VALUE:VALUE，返回 (属性名, {参数: 值}, 值)"""
+        colon = line.find(':')
+        if colon < 0:
+            return line.upper(), {}, ''
+        if '"' in line[:colon]:
+            # 参数值带引号时其中可能有冒号
+            in_quotes = False
+            for colon, char in enumerate(line):
+                if char == '"':
+                    in_quotes = not in_quotes
+                elif char == ':' and not in_quotes:
+                    break
+        head, value = line[:colon], line[colon + 1:]
+        name, _, param_text = head.partition(';')
+        params = {}
+        for param in param_text.split(';') if param_text else ():
+            key, _, param_value = param.partition('=')
+            params[key.upper()] = param_value
+        return name.upper(), params, value
+
+    def _text(self, value):
+        """转义 TEXT 值"""
+        return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+                .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+    def _untext(self, value):
+        """反转义 TEXT 值"""
+        if '\\' not in value:
+            return value
+        return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def get_report_range(period, today=None):
+    """根据周期（week/month/year）计算包含今天的日期范围"""
+    today = today or datetime.now()
+    if period == 'week':
+        start = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        start = today.replace(day=1)
+    elif period == 'year':
+        start = today.replace(month=1, day=1)
+    else:
+        raise ValueError(f'不支持的周期: {period}')
+    return start.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
+
+class BackupManager:
+    """数据库快照备份（基于SQLite在线备份API）"""
+
+    def __init__(self, db_path, backup_dir=None, keep=BACKUP_KEEP, compress=BACKUP_COMPRESS):
+        self.db_path = db_path
+        # 默认备份目录与数据库同级，例如 todo_reminder_v2_backups/
+        self.backup_dir = backup_dir or os.path.splitext(db_path)[0] + '_backups'
+        self.keep = keep
+        self.compress = compress
+        self.name_prefix = os.path.splitext(os.path.basename(db_path))[0]
+        # 归档库与主库一起备份和恢复，路径规则与 Database.archive_path 相同
+        self.archive_path = os.path.splitext(db_path)[0] + '_archive.db'
+
+    def create_backup(self, rotate=True):
+        """创建一个快照（主库和归档库一起），校验完整性后轮换旧备份，返回主库备份文件路径"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        # 同一秒内的多个备份按顺序加序号，不覆盖已有的备份（最新的一份不会被轮换删除，序号不会重复）
+        name = f'{self.name_prefix}-{timestamp}'
+        bases = [os.path.basename(path).split('.db')[0] for path in self.list_backups()]
+        counters = [0 if base == name else int(base[len(name) + 1:])
+                    for base in bases if base == name or base.startswith(name + '-')]
+        if counters:
+            name += f'-{max(counters) + 1}'
+        backup_path = os.path.join(self.backup_dir, name + '.db')
+        archive_backup_path = self._archive_backup_path(backup_path)
+        copies = [('main', backup_path + '.partial', backup_path)]
+
+        # 分步复制，每步之间短暂让出，不在两步之间持有读锁，前台的读写不会被阻塞
+        # （复制期间源库被修改时备份API会从头重来，每个文件各自是一致的快照）。
+        # 先复制主库再复制归档库：两次复制之间被归档的记录两边都有，复制后从归档库备份中去掉
+        sources = [(self.db_path, copies[0][1])]
+        if os.path.exists(self.archive_path):
+            copies.append(('archive', archive_backup_path + '.partial', archive_backup_path))
+            sources.append((self.archive_path, copies[1][1]))
+        for source_path, partial_path in sources:
+            src = sqlite3.connect(source_path)
+            dst = sqlite3.connect(partial_path)
+            try:
+                src.backup(dst, pages=BACKUP_PAGES_PER_STEP,
+                           progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_PAUSE))
+            finally:
+                dst.close()
+                src.close()
+        if len(copies) > 1:
+            self._drop_archived_twice(copies[0][1], copies[1][1])
+
+        for name, partial_path, _ in copies:
+            result = self._integrity_check_file(partial_path)
+            if result != 'ok':
+                for _, path, _ in copies:
+                    os.remove(path)
+                raise sqlite3.DatabaseError(f'备份完整性校验失败（{name}）: {result}')
+
+        if self.compress:
+            compressed = []
+            for name, partial_path, path in copies:
+                with open(partial_path, 'rb') as f_in, gzip.open(path + '.gz.partial', 'wb', compresslevel=6) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+                os.remove(partial_path)
+                compressed.append((name, path + '.gz.partial', path + '.gz'))
+            copies = compressed
+
+        # 主库备份最后落盘，列出的备份都带着完整的归档库备份
+        for _, partial_path, path in reversed(copies):
+            os.replace(partial_path, path)
+        if rotate:
+            self.rotate()
+        return copies[0][2]
+
+    def _drop_archived_twice(self, main_copy, archive_copy):
+        """从归档库备份中删除主库备份里也有的完成记录（连同计时记录和标签），返回删除的条数"""
+        conn = sqlite3.connect(archive_copy)
+        try:
+            conn.execute('ATTACH DATABASE ? AS snapshot', (main_copy,))
+            overlap = 'SELECT id FROM snapshot.completed_tasks'
+            conn.execute(f'DELETE FROM main.completed_task_tags WHERE completed_task_id IN ({overlap})')
+            conn.execute(f'DELETE FROM main.task_sessions WHERE completed_task_id IN ({overlap})')
+            dropped = conn.execute(f'DELETE FROM main.completed_tasks WHERE id IN ({overlap})').rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return dropped
+
+    def list_backups(self):
+        """列出所有主库备份（不含配套的归档库备份），最新的在前"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [name for name in os.listdir(self.backup_dir)
+                 if name.startswith(self.name_prefix + '-') and (name.endswith('.db') or name.endswith('.db.gz'))
+                 and not name.replace('.gz', '').endswith('_archive.db')]
+        # 去掉扩展名后按字符串排序：时间戳直接可比，同一秒内带序号的排在不带序号的之后
+        names.sort(key=lambda name: name.split('.db')[0], reverse=True)
+        return [os.path.join(self.backup_dir, name) for name in names]
+
+    def rotate(self):
+        """只保留最新的 keep 份备份，归档库备份随主库备份一起删除"""
+        for path in self.list_backups()[self.keep:]:
+            archive_backup_path = self._archive_backup_path(path)
+            if os.path.exists(archive_backup_path):
+                os.remove(archive_backup_path)
+            os.remove(path)
+
+    def check_backup(self, backup_path):
+        """校验备份文件（及配套的归档库备份）的完整性，返回 'ok' 或错误信息"""
+        with self._open_plain_copy(backup_path) as plain_path:
+            result = self._integrity_check_file(plain_path)
+        archive_backup_path = self._archive_backup_path(backup_path)
+        if result == 'ok' and os.path.exists(archive_backup_path):
+            with self._open_plain_copy(archive_backup_path) as plain_path:
+                archive_result = self._integrity_check_file(plain_path)
+            if archive_result != 'ok':
+                result = f'归档库: {archive_result}'
+        return result
+
+    def restore_backup(self, backup_path):
+        """从备份恢复主库和归档库，恢复前会先备份当前数据库，返回该备份的路径
+
+        备份没有配套的归档库备份时，说明当时还没有归档，当前的归档库会被移除，
+        否则其中的记录会和恢复出的主库重复统计（移除前的归档库在恢复前的备份中）
+        """
+        archive_backup_path = self._archive_backup_path(backup_path)
+        has_archive = os.path.exists(archive_backup_path)
+        # 先把备份复制到临时文件再做恢复前备份，恢复的内容不受备份目录变化影响
+        with contextlib.ExitStack() as stack:
+            plain_path = stack.enter_context(self._open_plain_copy(backup_path, always_copy=True))
+            result = self._integrity_check_file(plain_path)
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f'备份文件已损坏: {result}')
+            plain_archive_path = None
+            if has_archive:
+                plain_archive_path = stack.enter_context(self._open_plain_copy(archive_backup_path, always_copy=True))
+                result = self._integrity_check_file(plain_archive_path)
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(f'归档库备份已损坏: {result}')
+
+            # 当前数据库可能已损坏，备份失败时也继续恢复。
+            # 这份备份不轮换，否则达到保留份数时会删掉正在恢复的备份
+            safety_path = None
+            if os.path.exists(self.db_path):
+                try:
+                    safety_path = self.create_backup(rotate=False)
+                except sqlite3.DatabaseError as e:
+                    print(f"警告：恢复前备份当前数据库失败: {e}")
+
+            self._restore_file(plain_path, self.db_path)
+            if plain_archive_path:
+                self._restore_file(plain_archive_path, self.archive_path)
+            elif os.path.exists(self.archive_path):
+                os.remove(self.archive_path)
+        return safety_path
+
+    def _restore_file(self, source_path, target_path):
+        """用备份API把一个数据库文件的内容整体复制到目标文件"""
+        src = sqlite3.connect(source_path)
+        dst = sqlite3.connect(target_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def _archive_backup_path(self, backup_path):
+        """主库备份对应的归档库备份路径，例如 xxx-20240101-120000_archive.db.gz"""
+        for suffix in ('.db.gz', '.db'):
+            if backup_path.endswith(suffix):
+                return backup_path[:-len(suffix)] + '_archive' + suffix
+        return backup_path + '_archive'
+
+    def _integrity_check_file(self, path):
+        """对数据库文件执行 PRAGMA integrity_check"""
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute('PRAGMA integrity_check').fetchall()
+        except sqlite3.DatabaseError as e:
+            return str(e)
+        finally:
+            conn.close()
+        return '; '.join(row[0] for row in rows)
+
+    @contextlib.contextmanager
+    def _open_plain_copy(self, backup_path, always_copy=False):
+        """获取可直接打开的备份文件，压缩备份会先解压到临时文件，用完删除
+
+        always_copy 时未压缩的备份也复制到临时文件，之后备份文件被删除或覆盖也不受影响
+        """
+        if not backup_path.endswith('.gz') and not always_copy:
+            yield backup_path
+            return
+
+        fd, temp_path = tempfile.mkstemp(suffix='.db')
+        try:
+            opener = gzip.open if backup_path.endswith('.gz') else open
+            with os.fdopen(fd, 'wb') as f_out, opener(backup_path, 'rb') as f_in:
+                shutil.copyfileobj(f_in, f_out)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+
+class ToastNotificationBackend:
+    """Windows Toast 通知（win10toast），在发送线程中阻塞显示"""
+
+    def __init__(self, duration=NOTIFY_TOAST_DURATION):
+        self.toaster = ToastNotifier()
+        self.duration = duration
+
+    def show(self, title, msg):
+        self.toaster.show_toast(title=title, msg=msg, duration=self.duration, threaded=False)
+
+
+class ConsoleNotificationBackend:
+    """没有系统通知时（如 Linux 上测试）打印到控制台"""
+
+    def show(self, title, msg):
+        print(f"[通知] {title}: {msg}")
+
+
+def create_notification_backend():
+    """按平台选择通知后端，Toast 不可用时退回控制台"""
+    if sys.platform == 'win32':
+        try:
+            return ToastNotificationBackend()
+        except Exception:
+            print("警告：通知系统初始化失败")
+    return ConsoleNotificationBackend()
+
+
+class NotificationDispatcher:
+    """通知队列：在专用线程中发送，短时间内的多条通知合并为一条摘要，并限制弹出频率
+
+    notify 只是入队，可以在任意线程（包括 Tk 主循环）中调用而不会阻塞。
+    后端只需实现 show(title, msg)
+    """
+
+    def __init__(self, backend, coalesce_seconds=NOTIFY_COALESCE_SECONDS,
+                 min_interval=NOTIFY_MIN_INTERVAL_SECONDS, digest_lines=NOTIFY_DIGEST_LINES):
+        self.backend = backend
+        self.coalesce_seconds = coalesce_seconds
+        self.min_interval = min_interval
+        self.digest_lines = digest_lines
+        self.queue = queue.Queue()
+        self.worker = None
+        self.last_delivery = None
+        self.lock = threading.Lock()
+
+    def notify(self, title, msg):
+        """加入发送队列（首次调用时启动发送线程）"""
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+        self.queue.put((title, msg))
+
+    def close(self, timeout=None):
+        """发送完已入队的通知后停止发送线程"""
+        worker = self.worker
+        if worker is not None and worker.is_alive():
+            self.queue.put(None)
+            worker.join(timeout)
+
+    def run(self):
+        """发送线程：取出一条后继续收集，到合并窗口结束且满足最小间隔时一起发送"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.coalesce_seconds
+            if self.last_delivery is not None:
+                deadline = max(deadline, self.last_delivery + self.min_interval)
+            stopping = False
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.deliver(batch)
+            if stopping:
+                return
+
+    def deliver(self, batch):
+        """发送一批通知：去掉重复的，多于一条时合并为摘要"""
+        messages = list(dict.fromkeys(batch))
+        if len(messages) == 1:
+            title, msg = messages[0]
+        else:
+            title = f"🔔 {len(messages)} 条提醒"
+            lines = [f"{item_title}：{item_msg}" for item_title, item_msg in messages[:self.digest_lines]]
+            if len(messages) > self.digest_lines:
+                lines.append(f"…还有 {len(messages) - self.digest_lines} 条")
+            msg = '\n'.join(lines)
+        try:
+            self.backend.show(title, msg)
+        except Exception as e:
+            print(f"警告：发送通知失败: {e}")
+        self.last_delivery = time.monotonic()
+
 
 class TaskTimer:
     """任务计时器"""
 
-    def __init__(self, parent, todo_id, task_title, on_complete):
+    def __init__(self, parent, todo_id, task_title, on_complete, session_type=SESSION_NORMAL):
         self.parent = parent
         self.todo_id = todo_id
         self.task_title = task_title
         self.on_complete = on_complete
+        self.session_type = session_type
         self.start_time = None
         self.is_running = False
         self.is_paused = False
         self.paused_duration = 0
+        self.pause_start = None
         self.session_id = None
 
+    @classmethod
+    def restore(cls, parent, session, task_title, pauses):
+        """从未结束的计时记录恢复计时器（已记录的暂停照常扣除，最后一次暂停未恢复时仍为暂停状态）"""
+        timer = cls(parent, session.todo_id, task_title, None, session.session_type)
+        timer.session_id = session.id
+        timer.start_time = datetime.strptime(session.start_time, '%Y-%m-%d %H:%M:%S')
+        timer.is_running = True
+        for paused_at, resumed_at in sorted(pauses):
+            if resumed_at is None:
+                timer.is_paused = True
+                timer.pause_start = paused_at
+            else:
+                timer.paused_duration += (resumed_at - paused_at).total_seconds()
+        return timer
+
     def start(self):
         """开始计时"""
         if not self.is_running:
@@ -412,7 +4008,7 @@ class TaskTimer:
             self.is_running = True
             self.is_paused = False
             self.paused_duration = 0
-            self.session_id = self.parent.db.start_task_session(self.todo_id)
+            self.session_id = self.parent.db.start_task_session(self.todo_id, self.session_type)
             return True
         return False
 
@@ -421,14 +4017,17 @@ class TaskTimer:
         if self.is_running and not self.is_paused:
             self.is_paused = True
             self.pause_start = datetime.now()
+            self.parent.db.pause_task_session(self.session_id, self.pause_start)
             return True
         return False
 
     def resume(self):
         """恢复计时"""
         if self.is_running and self.is_paused:
+            resumed_at = datetime.now()
             self.is_paused = False
-            self.paused_duration += (datetime.now() - self.pause_start).total_seconds()
+            self.paused_duration += (resumed_at - self.pause_start).total_seconds()
+            self.parent.db.resume_task_session(self.session_id, resumed_at)
             return True
         return False
 
@@ -451,11 +4050,398 @@ class TaskTimer:
         return 0
 
 
+class PomodoroCycle:
+    """番茄钟：在 TaskTimer 之上循环 专注 → 休息，每个阶段保存为一条计时记录
+
+    每个阶段只在结束时安排一次 after 唤醒，暂停时取消、恢复时按剩余时间重新安排
+    """
+
+    WORK = 'work'
+    SHORT_BREAK = 'short_break'
+    LONG_BREAK = 'long_break'
+
+    def __init__(self, app, todo_id, task_title, settings):
+        self.app = app
+        self.todo_id = todo_id
+        self.task_title = task_title
+        self.settings = settings
+        self.phase = None
+        # 等待用户确认后开始的下一阶段（未开启自动继续时）
+        self.pending_phase = None
+        self.work_count = 0
+        self.phase_end = None
+        self.remaining = None
+        self.wakeup_job = None
+        # 当前阶段的计时器（阶段结束或取消时由 TodoApp 停止）
+        self.timer = None
+
+    def phase_length(self, phase):
+        """阶段时长（秒）"""
+        minutes = {
+            self.WORK: self.settings['pomodoro_work_minutes'],
+            self.SHORT_BREAK: self.settings['pomodoro_short_break_minutes'],
+            self.LONG_BREAK: self.settings['pomodoro_long_break_minutes'],
+        }[phase]
+        return max(1, minutes) * 60
+
+    def start(self, phase=WORK):
+        """开始一个阶段，返回新的计时器"""
+        self.pending_phase = None
+        self.phase = phase
+        session_type = SESSION_WORK if phase == self.WORK else SESSION_BREAK
+        timer = TaskTimer(self.app, self.todo_id, self.task_title, None, session_type=session_type)
+        timer.start()
+        self.timer = timer
+        length = self.phase_length(phase)
+        self.phase_end = datetime.now() + timedelta(seconds=length)
+        self._schedule(length)
+        return timer
+
+    def continue_cycle(self):
+        """开始等待中的下一阶段"""
+        return self.start(self.pending_phase or self.WORK)
+
+    def pause(self):
+        """暂停：记下剩余时间，取消唤醒"""
+        if self.wakeup_job is None:
+            return
+        self.remaining = max(0, (self.phase_end - datetime.now()).total_seconds())
+        self._cancel_wakeup()
+
+    def resume(self):
+        """恢复：按剩余时间重新安排唤醒"""
+        if self.remaining is None:
+            return
+        self.phase_end = datetime.now() + timedelta(seconds=self.remaining)
+        self._schedule(self.remaining)
+        self.remaining = None
+
+    def cancel(self):
+        """结束番茄钟（计时器由调用方停止）"""
+        self._cancel_wakeup()
+        self.phase = None
+        self.pending_phase = None
+
+    def next_phase(self):
+        """当前阶段之后的阶段"""
+        if self.phase != self.WORK:
+            return self.WORK
+        if self.work_count % max(1, self.settings['pomodoro_long_break_every']) == 0:
+            return self.LONG_BREAK
+        return self.SHORT_BREAK
+
+    def _schedule(self, seconds):
+        self._cancel_wakeup()
+        self.wakeup_job = self.app.root.after(int(seconds * 1000), self._on_phase_end)
+
+    def _cancel_wakeup(self):
+        if self.wakeup_job is not None:
+            self.app.root.after_cancel(self.wakeup_job)
+            self.wakeup_job = None
+
+    def _on_phase_end(self):
+        """阶段结束：保存本阶段记录，进入或等待下一阶段"""
+        self.wakeup_job = None
+        if self.phase == self.WORK:
+            self.work_count += 1
+        finished = self.phase
+        self.pending_phase = self.next_phase()
+        self.app.on_pomodoro_phase_end(finished, self.pending_phase,
+                                       bool(self.settings['pomodoro_auto_continue']))
+
+
+class TimerRegistry:
+    """同时运行的多个计时器（每个任务最多一个），由一个共享的每秒节拍统一刷新显示
+
+    计时记录和暂停区间随操作写入数据库，重新打开应用时 restore 恢复仍在计时的任务。
+    所有计时器都暂停或停止后节拍自动停止，恢复或开始新计时器时再启动
+    """
+
+    def __init__(self, root):
+        self.root = root
+        # 按开始（或恢复）顺序排列
+        self.timers = []
+        self.subscribers = []
+        self.tick_job = None
+
+    def __iter__(self):
+        return iter(list(self.timers))
+
+    def __len__(self):
+        return len(self.timers)
+
+    def add(self, timer):
+        """登记一个已开始的计时器"""
+        self.timers.append(timer)
+        self.ensure_ticking()
+
+    def discard(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def get(self, todo_id):
+        """任务正在运行的计时器，没有时返回 None"""
+        return next((timer for timer in self.timers if timer.todo_id == todo_id), None)
+
+    def todo_ids(self):
+        return {timer.todo_id for timer in self.timers}
+
+    def latest(self):
+        """最近开始的计时器"""
+        return self.timers[-1] if self.timers else None
+
+    def subscribe(self, callback):
+        """每个节拍调用 callback()"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def ensure_ticking(self):
+        """有未暂停的计时器时安排下一个节拍"""
+        if self.tick_job is None and any(timer.is_running and not timer.is_paused for timer in self.timers):
+            self.tick_job = self.root.after(1000, self._tick)
+
+    def _tick(self):
+        self.tick_job = None
+        self.timers = [timer for timer in self.timers if timer.is_running]
+        for callback in list(self.subscribers):
+            callback()
+        self.ensure_ticking()
+
+    def restore(self, app):
+        """恢复数据库中未结束的普通计时记录，返回恢复的个数
+
+        番茄钟阶段无法接着计时，已删除或已完成任务的记录以及同一任务多余的记录都按零时长结束，
+        避免一直未结束的记录在重叠时段平分时被算进来
+        """
+        restored = 0
+        for session, title, pauses in app.db.get_open_sessions():
+            if session.session_type == SESSION_NORMAL and title is not None and self.get(session.todo_id) is None:
+                self.timers.append(TaskTimer.restore(app, session, title, pauses))
+                restored += 1
+            else:
+                app.db.stop_task_session(session.id, end_time=session.start_time)
+        self.ensure_ticking()
+        return restored
+
+
+class VirtualListView(tk.Canvas):
+    """Canvas 实现的虚拟列表：只绘制可见的几行，行图元在滚动时循环复用
+
+    选择和滚动接口与单选的 tk.Listbox 一致（curselection、selection_set、see、nearest、yview 等），
+    可直接配合 Scrollbar 和 <<ListboxSelect>> 使用。行内容由 set_items 传入的 formatter 在绘制时才生成，
+    返回 (文本, 左侧色条颜色, 进度)，进度为 None 时不画进度条，超过 1 时进度条变红
+    """
+
+    SELECT_COLOR = '#0078D4'
+    TRACK_COLOR = '#E8E8E8'
+    PROGRESS_COLOR = '#0078D4'
+    OVERRUN_COLOR = '#E53935'
+
+    def __init__(self, parent, row_height=32, font=None, yscrollcommand=None, bg='#FFFFFF', fg='#000000', **kwargs):
+        super().__init__(parent, bg=bg, highlightthickness=0, borderwidth=0, takefocus=1, **kwargs)
+        self.row_height = row_height
+        self.font = font
+        self.bg = bg
+        self.fg = fg
+        self.yscrollcommand = yscrollcommand
+        self.items = []
+        self.formatter = None
+        # 已生成的行（按下标缓存，set_items 时清空）
+        self.rows = {}
+        # 复用的图元组 (背景, 色条, 文本, 进度槽, 进度) 及其当前显示的内容，内容不变时不重新配置
+        self.slots = []
+        self.slot_states = []
+        self.offset = 0
+        self.selected = None
+        # 最近一次重绘耗时（毫秒）
+        self.last_frame_ms = 0.0
+
+        self.bind('<Configure>', lambda event: self._layout())
+        self.bind('<ButtonPress-1>', self._on_click)
+        self.bind('<MouseWheel>', lambda event: self.yview('scroll', -3 * (event.delta // 120 or 1), 'units'))
+        self.bind('<Button-4>', lambda event: self.yview('scroll', -3, 'units'))
+        self.bind('<Button-5>', lambda event: self.yview('scroll', 3, 'units'))
+        self.bind('<Up>', lambda event: self._move_selection(-1))
+        self.bind('<Down>', lambda event: self._move_selection(1))
+        self.bind('<Prior>', lambda event: self.yview('scroll', -1, 'pages'))
+        self.bind('<Next>', lambda event: self.yview('scroll', 1, 'pages'))
+
+    def set_items(self, items, formatter):
+        """替换全部内容（与 Listbox 先删除再插入一样会清除选择），只重绘可见的行"""
+        self.items = items
+        self.formatter = formatter
+        self.rows = {}
+        self.selected = None
+        self._redraw()
+
+    def refresh(self):
+        """重新生成所有行（保留选择和滚动位置），只重绘可见的行"""
+        self.rows = {}
+        self._redraw()
+
+    def refresh_row(self, index, row=None):
+        """更新一行（row 为 None 时重新调用 formatter），只在该行可见时重绘这一行"""
+        if not 0 <= index < len(self.items):
+            return
+        if row is None:
+            self.rows.pop(index, None)
+        else:
+            self.rows[index] = row
+        slot_index = index - self.offset // self.row_height
+        if 0 <= slot_index < len(self.slots):
+            self._draw_slot(slot_index, index, self.winfo_width())
+
+    def size(self):
+        return len(self.items)
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def selection_clear(self, first=0, last=None):
+        previous = self.selected
+        self.selected = None
+        if previous is not None:
+            self.refresh_row(previous, self.rows.get(previous))
+
+    def selection_set(self, index):
+        if not 0 <= index < len(self.items):
+            return
+        self.selection_clear()
+        self.selected = index
+        self.refresh_row(index, self.rows.get(index))
+
+    def activate(self, index):
+        """单选列表中活动行即选中行"""
+
+    def nearest(self, y):
+        """离窗口坐标 y 最近的行，列表为空时返回 -1"""
+        if not self.items:
+            return -1
+        return max(0, min(len(self.items) - 1, int((y + self.offset) // self.row_height)))
+
+    def see(self, index):
+        """滚动到使第 index 行可见"""
+        top = index * self.row_height
+        height = self.winfo_height()
+        if top < self.offset:
+            self._scroll_to(top)
+        elif top + self.row_height > self.offset + height:
+            self._scroll_to(top + self.row_height - height)
+
+    def yview(self, *args):
+        """Scrollbar 协议：无参数时返回可见范围，否则处理 moveto / scroll"""
+        total = len(self.items) * self.row_height
+        if not args:
+            if total == 0:
+                return 0.0, 1.0
+            return self.offset / total, min(1.0, (self.offset + self.winfo_height()) / total)
+        if args[0] == 'moveto':
+            self._scroll_to(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = self.winfo_height() if args[2] == 'pages' else self.row_height
+            self._scroll_to(self.offset + int(args[1]) * step)
+
+    def _scroll_to(self, offset):
+        max_offset = max(0, len(self.items) * self.row_height - self.winfo_height())
+        offset = int(max(0, min(offset, max_offset)))
+        if offset != self.offset:
+            self.offset = offset
+            self._redraw()
+
+    def _layout(self):
+        """窗口大小变化时调整图元组数量（可见行数 + 1，用于滚动到半行时）"""
+        count = self.winfo_height() // self.row_height + 2
+        while len(self.slots) < count:
+            self.slots.append((self.create_rectangle(0, 0, 0, 0, width=0),
+                               self.create_rectangle(0, 0, 0, 0, width=0),
+                               self.create_text(0, 0, anchor=tk.W, font=self.font),
+                               self.create_rectangle(0, 0, 0, 0, width=0, fill=self.TRACK_COLOR),
+                               self.create_rectangle(0, 0, 0, 0, width=0)))
+            self.slot_states.append(None)
+        while len(self.slots) > count:
+            for item in self.slots.pop():
+                self.delete(item)
+            self.slot_states.pop()
+        self._scroll_to(self.offset)
+        self._redraw()
+
+    def _redraw(self):
+        """重绘所有可见行"""
+        start = time.perf_counter()
+        width = self.winfo_width()
+        first = self.offset // self.row_height
+        for slot_index in range(len(self.slots)):
+            self._draw_slot(slot_index, first + slot_index, width)
+        if self.yscrollcommand:
+            self.yscrollcommand(*self.yview())
+        self.last_frame_ms = (time.perf_counter() - start) * 1000
+
+    def _draw_slot(self, slot_index, index, width):
+        """把第 index 行画到指定的图元组上"""
+        background, accent, text, track, bar = self.slots[slot_index]
+        if index >= len(self.items):
+            if self.slot_states[slot_index] is not None:
+                for item in self.slots[slot_index]:
+                    self.itemconfigure(item, state='hidden')
+                self.slot_states[slot_index] = None
+            return
+
+        row = self.rows.get(index)
+        if row is None:
+            row = self.rows[index] = self.formatter(self.items[index])
+        label, color, progress = row
+        selected = index == self.selected
+        y = index * self.row_height - self.offset
+        bottom = y + self.row_height
+
+        self.coords(background, 0, y, width, bottom)
+        self.coords(accent, 0, y + 4, 4, bottom - 4)
+        self.coords(text, 12, y + self.row_height // 2 - (2 if progress is not None else 0))
+        if progress is not None:
+            self.coords(track, 12, bottom - 6, width - 12, bottom - 3)
+            self.coords(bar, 12, bottom - 6, 12 + (width - 24) * min(progress, 1.0), bottom - 3)
+
+        state = (row, selected, width)
+        if self.slot_states[slot_index] == state:
+            return
+        self.slot_states[slot_index] = state
+        self.itemconfigure(background, state='normal', fill=self.SELECT_COLOR if selected else self.bg)
+        self.itemconfigure(accent, state='normal', fill=color)
+        self.itemconfigure(text, state='normal', text=label, fill='#FFFFFF' if selected else self.fg)
+        progress_state = 'hidden' if progress is None else 'normal'
+        self.itemconfigure(track, state=progress_state)
+        bar_color = self.OVERRUN_COLOR if progress is not None and progress > 1 else self.PROGRESS_COLOR
+        self.itemconfigure(bar, state=progress_state, fill='#FFFFFF' if selected else bar_color)
+
+    def _on_click(self, event):
+        self.focus_set()
+        index = self.nearest(event.y)
+        if index >= 0:
+            self.selection_set(index)
+            self.event_generate('<<ListboxSelect>>')
+
+    def _move_selection(self, delta):
+        if not self.items:
+            return 'break'
+        index = 0 if self.selected is None else max(0, min(len(self.items) - 1, self.selected + delta))
+        self.selection_set(index)
+        self.see(index)
+        self.event_generate('<<ListboxSelect>>')
+        return 'break'
+
+
 class TodoApp:
     """每日待办提醒小助手主界面"""
 
-    def __init__(self, root):
+    def __init__(self, root, db_path=DB_PATH, profile=False):
         self.root = root
+        # 界面卡顿分析，PROFILE_HOTKEY 开关；profile 为 True 时从启动开始分析
+        self.profiler = CallbackProfiler(os.path.splitext(db_path)[0])
+        if profile:
+            self.profiler.start()
         self.root.title("📝 每日待办小助手")
         self.root.geometry("650x500")  # 增加宽度从520到600
         self.root.configure(bg='#F9F9F9')  # Win11浅色背景
@@ -470,31 +4456,107 @@ class TodoApp:
             pass
 
         # 初始化数据库
-        self.db = Database(DB_PATH)
-
-        # 初始化通知系统
-        self.notifier = None
-        if sys.platform == 'win32':
-            try:
-                self.notifier = ToastNotifier()
-            except:
-                print("警告：通知系统初始化失败")
-
-        # 当前活动的计时器
+        self.db = Database(db_path)
+        self.backup_manager = BackupManager(db_path)
+        self.analytics = AnalyticsEngine(self.db)
+
+        # 命令面板的模糊索引（首次打开时构建，之后随数据变更增量更新）
+        self.search_index = None
+        # 新建任务的标题补全（首次新建任务时加载）
+        self.title_suggester = None
+        # 用时预测（列表每次刷新都要用，启动时加载，之后随完成增量更新）
+        self.estimator = DurationEstimator()
+        self.estimator.load(self.db)
+        self.db.events.subscribe(self.on_data_changed)
+
+        # 初始化通知系统（在后台线程中发送，避免阻塞界面）
+        self.notifier = NotificationDispatcher(create_notification_backend())
+
+        # 正在运行的计时器（可以同时运行多个），共享一个每秒节拍刷新显示；
+        # active_timer 是计时区显示、暂停和完成按钮操作的那一个
+        self.timers = TimerRegistry(self.root)
+        self.timers.subscribe(self.update_timer_display)
         self.active_timer = None
-        self.timer_update_job = None
+        # 当前的番茄钟循环
+        self.pomodoro = None
+        # 主界面选中的标签筛选（标签 id 集合，需同时带有全部选中的标签）
+        self.tag_filter = set()
+        # 是否只显示可以开始（没有未完成的前置任务）的任务
+        self.ready_only = tk.BooleanVar(value=False)
+        # 列表中显示的（筛选后的）任务和今天的全部任务；计时、完成和日程按全部任务判断
+        self.todos = []
+        self.all_todos = []
+        # 今天的日程安排（工作时间、休息、固定日程），以及未填预估的任务数
+        self.scheduler = DayScheduler(self.db.get_settings(SCHEDULE_DEFAULTS))
+        self.unestimated = 0
 
         # 保存主窗口状态
         self.main_window_visible = True
+        # 打开的精简模式窗口
+        self.mini_window = None
+        # 临时提示到时恢复为完成时间预测的 after 任务
+        self.status_job = None
 
-        # 生成今日重复任务
-        self.generate_today_repeat_tasks()
+        # 记录今天的日期，之后由 check_day_rollover 检查换天
+        self.db.roll_over_day()
 
         # 创建界面
         self.create_widgets()
 
         # 加载今日任务
         self.load_today_todos()
+        # 恢复上次退出时仍在计时的任务
+        self.restore_timers()
+
+        # 任务变化后刷新列表（合并为一次，在事件处理完后进行），完成任务后发送通知
+        self.reload_job = None
+        self.db.events.subscribe(self.on_tasks_changed, VIEW_EVENTS)
+        self.db.events.subscribe(self.on_task_completed, ('task_completed',), threaded=True)
+        self.root.after(DAY_ROLLOVER_CHECK_MS, self.check_day_rollover)
+
+        # 命令面板快捷键
+        self.root.bind('<Control-k>', lambda event: self.show_command_palette())
+        self.root.bind('<Control-p>', lambda event: self.show_command_palette())
+        # 撤销/重做新建、编辑和删除
+        self.root.bind('<Control-z>', lambda event: self.undo())
+        self.root.bind('<Control-y>', lambda event: self.redo())
+        self.root.bind('<Control-Z>', lambda event: self.redo())
+        # 隐藏快捷键：开始/停止界面卡顿分析
+        self.root.bind(PROFILE_HOTKEY, lambda event: self.toggle_profiler())
+
+        # 定期在后台执行数据库维护和备份
+        self.maintenance_thread = None
+        self.backup_thread = None
+        self.root.after(MAINTENANCE_DELAY_MS, self.schedule_maintenance)
+        self.root.after(BACKUP_DELAY_MS, self.schedule_backup)
+
+    def schedule_maintenance(self):
+        """启动后台维护线程，并安排下一次维护"""
+        if self.maintenance_thread is None or not self.maintenance_thread.is_alive():
+            self.maintenance_thread = threading.Thread(target=self.run_maintenance, daemon=True)
+            self.maintenance_thread.start()
+        self.root.after(MAINTENANCE_INTERVAL_MS, self.schedule_maintenance)
+
+    def run_maintenance(self):
+        """执行数据库维护（在后台线程中运行）"""
+        try:
+            self.db.run_maintenance()
+        except sqlite3.Error as e:
+            print(f"警告：数据库维护失败: {e}")
+
+    def schedule_backup(self):
+        """启动后台备份线程，并安排下一次备份"""
+        if self.backup_thread is None or not self.backup_thread.is_alive():
+            self.backup_thread = threading.Thread(target=self.run_backup, daemon=True)
+            self.backup_thread.start()
+        self.root.after(BACKUP_INTERVAL_MS, self.schedule_backup)
+
+    def run_backup(self):
+        """执行一次备份（在后台线程中运行）"""
+        try:
+            self.backup_manager.create_backup()
+        except (sqlite3.Error, OSError) as e:
+            print(f"警告：数据库备份失败: {e}")
 
     def create_widgets(self):
         """创建界面组件"""
@@ -507,15 +4569,10 @@ class TodoApp:
                                bg='#FFFFFF', fg='#000000')
         title_label.pack(side=tk.LEFT, pady=20, padx=25)
 
-        # 日期显示
-        today_date = datetime.now().strftime('%Y-%m-%d')
-        weekday_dict = {0: '周一', 1: '周二', 2: '周三', 3: '周四', 4: '周五', 5: '周六', 6: '周日'}
-        weekday = weekday_dict[datetime.now().weekday()]
-        date_text = f"{today_date} {weekday}"
-
-        date_label = tk.Label(header_frame, text=date_text, font=('Segoe UI Variable', 11),
-                              bg='#FFFFFF', fg='#888888')
-        date_label.pack(side=tk.RIGHT, padx=25)
+        # 日期显示（换天时更新）
+        self.date_label = tk.Label(header_frame, text=self.format_header_date(), font=('Segoe UI Variable', 11),
+                                   bg='#FFFFFF', fg='#888888')
+        self.date_label.pack(side=tk.RIGHT, padx=25)
 
         # 计时器显示区域 - Win11浅色卡片
         self.timer_frame = tk.Frame(self.root, bg='#FFFFFF', height=100)
@@ -530,6 +4587,11 @@ class TodoApp:
                                          bg='#FFFFFF', fg='#888888')
         self.timer_task_label.pack(pady=(0, 5))
 
+        # 按修正后的用时预测今日剩余任务的完成时间
+        self.forecast_label = tk.Label(self.timer_frame, text="", font=('Segoe UI Variable', 9),
+                                       bg='#FFFFFF', fg='#888888')
+        self.forecast_label.pack(pady=(0, 5))
+
         # 计时器按钮 - Win11浅色风格
         timer_btn_frame = tk.Frame(self.root, bg='#F9F9F9')
         timer_btn_frame.pack(fill=tk.X, padx=15, pady=(12, 0))
@@ -538,6 +4600,8 @@ class TodoApp:
                                   bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
                                   command=self.start_task, padx=20, pady=10, activebackground='#005A9E')
         self.start_btn.pack(side=tk.LEFT, padx=3)
+        # 右键设置同时计时时重叠时段的统计方式
+        self.start_btn.bind('<Button-3>', lambda event: self.show_timer_settings())
 
         self.pause_btn = tk.Button(timer_btn_frame, text="暂停", font=('Segoe UI Variable', 11),
                                   bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
@@ -549,6 +4613,17 @@ class TodoApp:
                                      command=self.complete_task, padx=20, pady=10, state=tk.DISABLED, activebackground='#005A9E')
         self.complete_btn.pack(side=tk.LEFT, padx=3)
 
+        # 番茄钟（右键修改设置）
+        self.pomodoro_btn = tk.Button(timer_btn_frame, text="🍅", font=('Segoe UI Variable', 11),
+                                      bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
+                                      command=self.start_pomodoro, padx=10, pady=10, activebackground='#005A9E')
+        self.pomodoro_btn.pack(side=tk.LEFT, padx=3)
+        self.pomodoro_btn.bind('<Button-3>', lambda event: self.show_pomodoro_settings())
+
+        tk.Button(timer_btn_frame, text="日程", font=('Microsoft YaHei UI', 11),
+                 bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
+                 command=self.show_schedule_dialog, padx=20, pady=10, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=3)
+
         tk.Button(timer_btn_frame, text="历史复盘", font=('Microsoft YaHei UI', 11),
                  bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
                  command=self.show_history, padx=20, pady=10, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=3)
@@ -561,6 +4636,10 @@ class TodoApp:
                  bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
                  command=self.show_add_dialog, padx=20, pady=10, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=3)
 
+        # 标签筛选（今天的任务用到的标签，点击切换）
+        self.tag_bar = tk.Frame(self.root, bg='#F9F9F9')
+        self.tag_bar.pack(fill=tk.X, padx=15, pady=(10, 0))
+
         # 任务列表区域 - Win11浅色卡片风格
         list_frame = tk.Frame(self.root, bg='#F9F9F9')
         list_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(15, 10))
@@ -569,18 +4648,18 @@ class TodoApp:
         scrollbar = ttk.Scrollbar(list_frame)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-        # 创建任务列表
-        self.todo_listbox = tk.Listbox(list_frame, font=('Segoe UI Variable', 11),
-                                       bg='#FFFFFF', fg='#000000', selectmode=tk.SINGLE,
-                                       yscrollcommand=scrollbar.set, borderwidth=0,
-                                       highlightthickness=0, selectbackground='#0078D4',
-                                       selectforeground='#FFFFFF')
+        # 创建任务列表（虚拟列表，任务很多时也只绘制可见的行）
+        self.todo_listbox = VirtualListView(list_frame, row_height=32, font=('Segoe UI Variable', 11),
+                                            yscrollcommand=scrollbar.set)
         self.todo_listbox.pack(fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.todo_listbox.yview)
 
         # 绑定选择事件
         self.todo_listbox.bind('<<ListboxSelect>>', self.on_select)
 
+        # 拖动或 Alt+↑/↓ 调整任务顺序
+        self.bind_reorder(self.todo_listbox)
+
         # 底部按钮栏 - Win11浅色风格
         button_frame = tk.Frame(self.root, bg='#F9F9F9')
         button_frame.pack(fill=tk.X, padx=15, pady=(0, 15))
@@ -593,64 +4672,254 @@ class TodoApp:
                  bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
                  command=self.delete_selected, padx=20, pady=8, activebackground='#D0D0D0').pack(side=tk.LEFT, padx=3)
 
-    def load_today_todos(self):
-        """加载今日任务"""
-        self.todos = self.db.get_today_todos()
-        self.update_todo_list()
+        tk.Button(button_frame, text="子任务", font=('Segoe UI Variable', 10),
+                 bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
+                 command=self.add_subtask, padx=20, pady=8, activebackground='#D0D0D0').pack(side=tk.LEFT, padx=3)
 
-    def generate_today_repeat_tasks(self):
-        """启动时生成今日重复任务"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        self.db.generate_repeat_tasks(today)
+        tk.Button(button_frame, text="依赖", font=('Segoe UI Variable', 10),
+                 bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
+                 command=self.edit_dependencies, padx=20, pady=8, activebackground='#D0D0D0').pack(side=tk.LEFT, padx=3)
 
-    def update_todo_list(self):
-        """更新任务列表显示"""
-        self.todo_listbox.delete(0, tk.END)
+        tk.Button(button_frame, text="完成全部✅", font=('Segoe UI Variable', 10),
+                 bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
+                 command=self.complete_all_done, padx=20, pady=8, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=3)
 
-        for todo in self.todos:
-            todo_id, title, description, task_date, estimated_duration, priority, status, created_at, notified, repeat_type, repeat_template_id = todo[:11]
+        tk.Checkbutton(button_frame, text="只看可开始", variable=self.ready_only, command=self.load_today_todos,
+                      font=('Microsoft YaHei UI', 9), bg='#F9F9F9',
+                      activebackground='#F9F9F9').pack(side=tk.RIGHT, padx=3)
 
-            # 获取已用时长
-            total_duration = self.db.get_task_total_duration(todo_id)
-            duration_text = self.format_duration(total_duration)
+    def load_today_todos(self):
+        """加载今日任务（按选中的标签和"只看可开始"筛选）"""
+        today_tags = self.db.get_today_tags()
+        # 今天已经没有任务使用的标签不再参与筛选
+        self.tag_filter &= {tag_id for tag_id, name in today_tags}
+        self.todos = self.db.get_today_todos(tag_ids=self.tag_filter, ready_only=self.ready_only.get())
+        # 筛选时另外查询全部任务（被隐藏的子任务可能正在计时）
+        self.all_todos = self.db.get_today_todos() if self.tag_filter or self.ready_only.get() else self.todos
+        self.build_tag_chips(self.tag_bar, today_tags, self.tag_filter, self.load_today_todos)
+        self.update_todo_list()
 
-            # 优先级标识
-            priority_icon = ['📌', '⭐', '🔥'][priority]
+    def build_tag_chips(self, parent, tags, selected, on_change):
+        """在 parent 中重建标签按钮，点击切换 selected 中的标签 id 后调用 on_change"""
+        for child in parent.winfo_children():
+            child.destroy()
+        if not tags:
+            return
 
-            # 状态标识
-            if status == 1:
-                status_icon = '✅'
+        def toggle(tag_id):
+            if tag_id in selected:
+                selected.discard(tag_id)
             else:
-                status_icon = '⬜'
-
-            # 重复标识
-            repeat_icon = ''
-            if repeat_type == 1:
-                repeat_icon = '🔄'
-            elif repeat_type == 2:
-                repeat_icon = '💼'
+                selected.add(tag_id)
+            on_change()
+
+        tk.Label(parent, text="🏷️", font=('Segoe UI Variable', 10), bg=parent['bg']).pack(side=tk.LEFT)
+        for tag in tags:
+            tag_id, name = tag[0], tag[1]
+            active = tag_id in selected
+            tk.Button(parent, text=f"#{name}", font=('Microsoft YaHei UI', 9),
+                      bg='#0078D4' if active else '#E0E0E0', fg='white' if active else '#333333',
+                      relief=tk.FLAT, cursor='hand2', padx=8, pady=2,
+                      activebackground='#005A9E' if active else '#D0D0D0',
+                      command=lambda tag_id=tag_id: toggle(tag_id)).pack(side=tk.LEFT, padx=2)
+        if selected:
+            tk.Button(parent, text="清除", font=('Microsoft YaHei UI', 9), bg=parent['bg'], fg='#0078D4',
+                      relief=tk.FLAT, cursor='hand2', padx=4, pady=2,
+                      command=lambda: (selected.clear(), on_change())).pack(side=tk.LEFT, padx=2)
+
+    def check_day_rollover(self):
+        """定期检查是否过了零点，换天时由 day_rolled_over 事件刷新界面"""
+        self.db.roll_over_day()
+        self.root.after(DAY_ROLLOVER_CHECK_MS, self.check_day_rollover)
+
+    def format_header_date(self):
+        """标题栏显示的日期和星期"""
+        now = datetime.now()
+        weekday = ['周一', '周二', '周三', '周四', '周五', '周六', '周日'][now.weekday()]
+        return f"{now.strftime('%Y-%m-%d')} {weekday}"
+
+    def on_tasks_changed(self, event):
+        """任务变化时安排刷新列表（同一轮事件处理中的多个变化只刷新一次）"""
+        if event.type == 'day_rolled_over':
+            self.date_label.config(text=self.format_header_date())
+        if self.reload_job is None:
+            self.reload_job = self.root.after_idle(self.reload_views)
+
+    def reload_views(self):
+        """刷新主界面和精简模式窗口的任务列表"""
+        self.reload_job = None
+        self.load_today_todos()
+        if self.mini_window is not None:
+            self.refresh_mini_list(self.mini_window)
 
-            # 显示文本
-            display_text = f"{status_icon} {priority_icon} {title}"
-            if repeat_icon:
-                display_text += f" {repeat_icon}"
-            if total_duration > 0:
-                display_text += f" | ⏱️ {duration_text}"
+    def on_task_completed(self, event):
+        """完成任务后发送通知（在事件总线的后台线程中调用；随父任务完成的子任务不单独通知）"""
+        if event.data['requested']:
+            self.notifier.notify("🎉 任务完成", f"太棒了！又完成了一项任务：{event.data['title']}")
 
-            self.todo_listbox.insert(tk.END, display_text)
+    def update_todo_list(self):
+        """更新任务列表显示（行文本在绘制时才生成，只处理可见的行）"""
+        self.plan_day()
+        self.todo_listbox.set_items(self.todos, lambda todo: self.list_row(todo, self.format_todo_text(todo),
+                                                                           self.running_duration(todo)))
+        self.update_forecast()
+
+    def format_todo_text(self, todo):
+        """主界面任务列表一行的显示文本"""
+        # 已用时长随任务一起查询，有子任务时显示含子任务的汇总
+        total_duration = todo.rollup_duration
+        duration_text = self.format_duration(total_duration)
+
+        # 优先级标识
+        priority_icon = ['📌', '⭐', '🔥'][todo.priority]
+
+        # 状态标识（还在等前置任务的显示锁）
+        if todo.status == 1:
+            status_icon = '✅'
+        elif todo.blocked:
+            status_icon = '🔒'
+        else:
+            status_icon = '⬜'
+
+        # 重复标识
+        repeat_icon = ''
+        if todo.repeat_type == 1:
+            repeat_icon = '🔄'
+        elif todo.repeat_type == 2:
+            repeat_icon = '💼'
+
+        # 显示文本（子任务按层级缩进）
+        display_text = f"{self.subtask_indent(todo)}{status_icon} {priority_icon} {todo.title}"
+        if repeat_icon:
+            display_text += f" {repeat_icon}"
+        if todo.tags:
+            display_text += " " + " ".join(f"#{name}" for name in todo.tags.split())
+        if total_duration > 0:
+            display_text += f" | ⏱️ {duration_text}"
+        if todo.subtask_total:
+            display_text += f" | 📊 {todo.subtask_done}/{todo.subtask_total} ({todo.progress:.0%})"
+        timer = self.timers.get(todo.id)
+        if timer:
+            display_text += f" | {'⏸️' if timer.is_paused else '▶️'} {self.format_timer(timer.get_elapsed_time())}"
+
+        # 日程安排的时间段，下班前排不完的标出
+        entry = self.scheduler.entries.get(todo.id)
+        if entry:
+            start, end, overflow = entry
+            if overflow:
+                display_text += " | ⚠️ 排不下" if start == end else f" | ⚠️ {format_clock(start)} 起，排不完"
+            elif end > start:
+                display_text += f" | 🕘 {format_clock(start)}-{format_clock(end)}"
+
+        # 按历史修正后的可能实际用时（与预估相差不到一分钟时不显示）
+        likely = self.estimator.likely_actual(todo.title, todo.estimated_duration, todo.repeat_template_id)
+        if likely is not None and abs(likely - todo.estimated_duration) >= 60:
+            display_text += f" | 🎯 预估{self.format_duration_simple(todo.estimated_duration)}→可能{self.format_duration_simple(likely)}"
+        return display_text
+
+    def running_duration(self, todo):
+        """任务已记录的用时加上正在进行的计时"""
+        timer = self.timers.get(todo.id)
+        return todo.total_duration + (timer.get_elapsed_time() if timer else 0)
+
+    def timer_rows(self):
+        """正在计时的任务在今日列表中的下标"""
+        running = self.timers.todo_ids()
+        return [index for index, todo in enumerate(self.todos) if todo.id in running]
+
+    def list_row(self, todo, text, total_duration):
+        """虚拟列表的一行：文本、优先级色条、含子任务的已用时长相对预估时长的进度（没填预估时为 None）"""
+        progress = None
+        if todo.estimated_duration > 0:
+            progress = (total_duration + todo.rollup_duration - todo.total_duration) / todo.estimated_duration
+        return text, PRIORITY_COLORS[todo.priority], progress
+
+    def plan_day(self):
+        """任务列表变化后重新安排今天的日程（剩余用时按历史修正后的可能用时，未填预估的按默认时长）
+
+        日程和预计完成时间针对今天的全部任务，不受列表的标签和"只看可开始"筛选影响
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        active_id = self.active_timer.todo_id if self.active_timer else None
+        tasks = []
+        self.unestimated = 0
+        for todo in self.all_todos:
+            if todo.task_date != today or (todo.status == 1 and todo.id != active_id):
+                continue
+            likely = self.estimator.likely_actual(todo.title, todo.estimated_duration, todo.repeat_template_id)
+            if likely is None:
+                self.unestimated += 1
+                likely = self.scheduler.default_duration
+            tasks.append((todo.id, todo.priority, max(0, likely - todo.total_duration)))
+
+        appointments = []
+        for _, _, start_time, end_time in self.db.get_appointments(today):
+            try:
+                appointments.append((parse_clock(start_time), parse_clock(end_time)))
+            except ValueError:
+                continue
+        active_id, active_remaining = self.active_remaining()
+        self.scheduler.plan(tasks, self.seconds_of_day(), appointments, self.db.get_dependency_graph().predecessors,
+                            active_id, active_remaining)
+
+    def active_remaining(self):
+        """正在计时的任务 id 和预计还要多久（超出预估时为 0，后面的任务从现在开始顺延）"""
+        if not self.active_timer or self.active_timer.todo_id not in self.scheduler.remaining:
+            return None, 0
+        todo_id = self.active_timer.todo_id
+        return todo_id, max(0, self.scheduler.remaining[todo_id] - self.active_timer.get_elapsed_time())
+
+    def seconds_of_day(self):
+        now = datetime.now()
+        return now.hour * 3600 + now.minute * 60 + now.second
+
+    def update_forecast(self):
+        """按日程安排更新今日剩余任务的预计完成时间（每秒调用，安排只在分钟变化时重新计算）"""
+        active_id, active_remaining = self.active_remaining()
+        if self.scheduler.replan(self.seconds_of_day(), active_id, active_remaining):
+            self.todo_listbox.refresh()
+
+        entries = self.scheduler.entries
+        remaining = sum(self.scheduler.remaining.values())
+        if active_id is not None:
+            remaining += active_remaining - self.scheduler.remaining[active_id]
+        if not entries or remaining <= 0:
+            self.forecast_label.config(text="")
+            return
+        if self.scheduler.overflow:
+            late = sum(1 for _, _, overflow in entries.values() if overflow)
+            text = (f"⚠️ 剩余约 {self.format_duration(remaining)}，超出工作时间 "
+                    f"{self.format_duration(self.scheduler.overflow)}（{late} 个任务排不下）")
+        else:
+            finish = max(end for _, end, _ in entries.values())
+            text = f"📅 剩余约 {self.format_duration(remaining)}，预计 {format_clock(finish)} 完成"
+        if self.unestimated:
+            text += f"（{self.unestimated} 个任务未填预估，按 {self.scheduler.default_duration // 60} 分钟安排）"
+        self.forecast_label.config(text=text)
+
+    def format_mini_row(self, todo, total_duration):
+        """精简模式列表的显示文本：已进行时长/预估时长（有子任务时含子任务用时和进度）"""
+        priority_icon = ['📌', '⭐', '🔥'][todo.priority]
+        status_icon = '✅' if todo.status == 1 else '⬜'
+        elapsed_text = self.format_duration_simple(total_duration + todo.rollup_duration - todo.total_duration)
+        prefix = f"{self.subtask_indent(todo)}{status_icon} {priority_icon} {todo.title}"
+        if todo.subtask_total:
+            prefix += f" 📊{todo.subtask_done}/{todo.subtask_total}"
+
+        if todo.estimated_duration > 0:
+            total_text = self.format_duration_simple(todo.estimated_duration)
+            return f"{prefix} | ⏱️ {elapsed_text}/{total_text}"
+        return f"{prefix} | ⏱️ {elapsed_text}"
+
+    def subtask_indent(self, todo):
+        """子任务的缩进前缀"""
+        if not todo.depth:
+            return ''
+        return '    ' * (todo.depth - 1) + '  └ '
 
     def format_duration(self, seconds):
         """格式化时长显示"""
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-
-        if hours > 0:
-            return f"{hours}小时{minutes}分"
-        elif minutes > 0:
-            return f"{minutes}分钟"
-        else:
-            return f"{secs}秒"
+        return format_duration(seconds)
 
     def format_timer(self, seconds):
         """格式化计时器显示"""
@@ -676,6 +4945,70 @@ class TodoApp:
         """选择任务时的处理"""
         pass
 
+    def bind_reorder(self, listbox, on_reordered=None):
+        """为任务列表绑定拖动排序和 Alt+↑/↓ 键盘排序"""
+        drag_state = {'index': None}
+
+        def on_press(event):
+            drag_state['index'] = listbox.nearest(event.y)
+
+        def on_release(event):
+            start_index = drag_state['index']
+            drag_state['index'] = None
+            if start_index is None:
+                return
+            target_index = listbox.nearest(event.y)
+            if target_index != start_index:
+                self.reorder_todo(start_index, target_index, listbox, on_reordered)
+
+        def on_key(delta):
+            selection = listbox.curselection()
+            if selection:
+                self.reorder_todo(selection[0], selection[0] + delta, listbox, on_reordered)
+            return 'break'
+
+        listbox.bind('<ButtonPress-1>', on_press, add='+')
+        listbox.bind('<ButtonRelease-1>', on_release, add='+')
+        listbox.bind('<Alt-Up>', lambda event: on_key(-1))
+        listbox.bind('<Alt-Down>', lambda event: on_key(1))
+
+    def reorder_todo(self, from_index, to_index, listbox, on_reordered=None):
+        """把列表中 from_index 处的任务移到 to_index 处任务的位置（只在同级任务之间移动）"""
+        if not (0 <= from_index < len(self.todos) and 0 <= to_index < len(self.todos)):
+            return
+        moved = self.todos[from_index]
+        target = self.todos[to_index]
+        if target.parent_id != moved.parent_id:
+            self.root.bell()
+            return
+
+        # 在去掉被移动任务后的同级列表里找新位置的前后邻居
+        siblings = [todo for todo in self.todos if todo.parent_id == moved.parent_id]
+        sibling_from = siblings.index(moved)
+        sibling_to = siblings.index(target)
+        remaining = siblings[:sibling_from] + siblings[sibling_from + 1:]
+        prev_todo = remaining[sibling_to - 1] if sibling_to > 0 else None
+        next_todo = remaining[sibling_to] if sibling_to < len(remaining) else None
+        self.db.move_todo(moved.id,
+                          prev_todo.id if prev_todo else None,
+                          next_todo.id if next_todo else None)
+
+        self.load_today_todos()
+        if on_reordered:
+            on_reordered()
+        new_index = next((i for i, todo in enumerate(self.todos) if todo.id == moved.id), to_index)
+        listbox.selection_clear(0, tk.END)
+        listbox.selection_set(new_index)
+        listbox.activate(new_index)
+        listbox.see(new_index)
+
+    def refresh_mini_list(self, mini_window):
+        """刷新精简模式窗口的任务列表"""
+        if hasattr(mini_window, 'mini_listbox'):
+            mini_window.mini_listbox.set_items(
+                self.todos, lambda todo: self.list_row(todo, self.format_mini_row(todo, self.running_duration(todo)),
+                                                       self.running_duration(todo)))
+
     def get_selected_id(self):
         """获取选中的任务ID"""
         selection = self.todo_listbox.curselection()
@@ -684,7 +5017,7 @@ class TodoApp:
         index = selection[0]
         if index >= len(self.todos):
             return None
-        return self.todos[index][0]
+        return self.todos[index].id
 
     def start_task(self):
         """开始任务"""
@@ -692,28 +5025,71 @@ class TodoApp:
         if not todo_id:
             messagebox.showinfo("提示", "请先选择一个任务")
             return
+        self.begin_timer(todo_id)
+
+    def begin_timer(self, todo_id):
+        """开始为任务计时；已有任务在计时时可以同时计时或切换，任务已在后台计时时切换到计时区显示"""
+        running = self.timers.get(todo_id)
+        if running:
+            if self.pomodoro:
+                # 计时区和暂停、完成按钮要一直对着番茄钟的计时器，切到其他计时器前先结束番茄钟
+                if running is self.pomodoro.timer:
+                    return running
+                if not messagebox.askyesno("确认", f"番茄钟进行中，切换到「{running.task_title}」会结束番茄钟，是否切换？"):
+                    return None
+                self.stop_timer_internal()
+            self.focus_timer(running)
+            return running
+
+        if not self.confirm_start_blocked(todo_id):
+            return None
 
-        # 如果有正在运行的任务，先停止
+        # 如果有正在运行的任务，选择同时计时或先停止（番茄钟不能和其他计时并行）
         if self.active_timer and self.active_timer.is_running:
-            if not messagebox.askyesno("确认", "当前有任务正在进行，是否切换？"):
-                return
-            self.stop_timer_internal()
-
-        # 获取任务标题
-        todo = next((t for t in self.todos if t[0] == todo_id), None)
-        if todo:
-            task_title = todo[1]
-            self.active_timer = TaskTimer(self, todo_id, task_title, None)
-            self.active_timer.start()
-
-            # 更新界面
-            self.timer_task_label.config(text=f"正在进行: {task_title}")
-            self.start_btn.config(state=tk.DISABLED)
-            self.pause_btn.config(state=tk.NORMAL, text="⏸️ 暂停")
-            self.complete_btn.config(state=tk.NORMAL)
+            if self.pomodoro:
+                if not messagebox.askyesno("确认", "当前有任务正在进行，是否切换？"):
+                    return None
+                self.stop_timer_internal()
+            else:
+                choice = messagebox.askyesnocancel(
+                    "确认", f"「{self.active_timer.task_title}」正在计时。\n\n"
+                    "是：两个任务同时计时\n否：停止当前任务，切换到新任务")
+                if choice is None:
+                    return None
+                if not choice:
+                    self.stop_timer_internal()
+        self.cancel_pomodoro()
+
+        # 获取任务标题（重复任务的虚拟实例先写入，计时器记录真实 id）
+        todo = next((t for t in self.all_todos if t.id == todo_id), None)
+        if not todo:
+            return None
+        todo_id = self.db.materialize(todo_id)
+        timer = TaskTimer(self, todo_id, todo.title, None)
+        timer.start()
+        self.timers.add(timer)
+        self.focus_timer(timer)
+        return timer
+
+    def focus_timer(self, timer):
+        """计时区改为显示 timer（None 时显示空闲），暂停和完成按钮随之针对它"""
+        self.active_timer = timer
+        self.start_btn.config(state=tk.NORMAL)
+        if timer is None:
+            self.timer_label.config(text="⏱️ 00:00:00")
+            self.timer_task_label.config(text="暂无任务")
+            self.pause_btn.config(state=tk.DISABLED, text="⏸️ 暂停")
+            self.complete_btn.config(state=tk.DISABLED)
+            self.todo_listbox.refresh()
+            return
 
-            # 开始更新计时器
-            self.update_timer_display()
+        others = len(self.timers) - 1
+        self.timer_task_label.config(text=f"正在进行: {timer.task_title}" +
+                                     (f"（另有 {others} 个任务同时计时）" if others > 0 else ""))
+        self.timer_label.config(text=f"⏱️ {self.format_timer(timer.get_elapsed_time())}")
+        self.pause_btn.config(state=tk.NORMAL, text="▶️ 继续" if timer.is_paused else "⏸️ 暂停")
+        self.complete_btn.config(state=tk.NORMAL)
+        self.update_timer_display()
 
     def pause_task(self):
         """暂停/恢复任务"""
@@ -723,15 +5099,17 @@ class TodoApp:
         if self.active_timer.is_paused:
             # 恢复
             self.active_timer.resume()
+            if self.pomodoro and self.active_timer is self.pomodoro.timer:
+                self.pomodoro.resume()
             self.pause_btn.config(text="⏸️ 暂停")
-            self.update_timer_display()
+            self.timers.ensure_ticking()
         else:
             # 暂停
             self.active_timer.pause()
+            if self.pomodoro and self.active_timer is self.pomodoro.timer:
+                self.pomodoro.pause()
             self.pause_btn.config(text="▶️ 继续")
-            if self.timer_update_job:
-                self.root.after_cancel(self.timer_update_job)
-                self.timer_update_job = None
+        self.update_timer_display()
 
     def complete_task(self):
         """完成任务"""
@@ -739,43 +5117,347 @@ class TodoApp:
             messagebox.showinfo("提示", "没有正在进行的任务")
             return
 
-        # 停止计时器
+        # 停止计时器（之后计时区会显示其他仍在计时的任务，先记下要完成的任务）
+        todo_id = self.active_timer.todo_id
         self.stop_timer_internal()
 
         # 弹出总结对话框
-        self.show_summary_dialog()
+        self.show_summary_dialog(todo_id)
 
     def stop_timer_internal(self):
-        """内部停止计时器"""
+        """内部停止计时器（计时区显示的那个，连同番茄钟和它的计时器）"""
+        pomodoro_timer = self.pomodoro.timer if self.pomodoro else None
+        self.cancel_pomodoro()
+        if pomodoro_timer and pomodoro_timer.is_running and pomodoro_timer is not self.active_timer:
+            self.stop_timer(pomodoro_timer)
         if self.active_timer and self.active_timer.is_running:
-            if self.timer_update_job:
-                self.root.after_cancel(self.timer_update_job)
-                self.timer_update_job = None
+            self.stop_timer(self.active_timer)
+
+    def stop_timer(self, timer):
+        """停止一个计时器；停止的是计时区显示的计时器时改为显示最近开始的其他计时器"""
+        if self.pomodoro and timer is self.pomodoro.timer:
+            self.cancel_pomodoro()
+        timer.stop()
+        self.timers.discard(timer)
+        if timer is self.active_timer:
+            self.focus_timer(self.timers.latest())
+        elif self.active_timer and not self.pomodoro:
+            # 更新"另有几个任务同时计时"
+            self.focus_timer(self.active_timer)
+        self.todo_listbox.refresh()
+
+    def show_timer_settings(self):
+        """同时计时设置：重叠时段计入用时的方式"""
+        settings = self.db.get_settings(TIMER_DEFAULTS)
 
-            self.active_timer.stop()
-            self.active_timer = None
+        dialog = tk.Toplevel(self.root)
+        dialog.title("⏱️ 同时计时")
+        dialog.configure(bg='white')
+        dialog.transient(self.root)
+        dialog.grab_set()
 
-            # 重置界面
-            self.timer_label.config(text="⏱️ 00:00:00")
-            self.timer_task_label.config(text="暂无任务")
-            self.start_btn.config(state=tk.NORMAL)
-            self.pause_btn.config(state=tk.DISABLED, text="⏸️ 暂停")
-            self.complete_btn.config(state=tk.DISABLED)
+        content_frame = tk.Frame(dialog, bg='white')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+
+        tk.Label(content_frame, text="多个任务同时计时时，重叠的时段：", font=('Microsoft YaHei UI', 10, 'bold'),
+                bg='white', fg='#333333').pack(anchor=tk.W, pady=(0, 6))
+        mode_var = tk.StringVar(value=settings['timer_overlap_attribution'])
+        for mode, label in TIMER_OVERLAP_MODES.items():
+            tk.Radiobutton(content_frame, text=label, variable=mode_var, value=mode,
+                           font=('Microsoft YaHei UI', 10), bg='white',
+                           activebackground='white').pack(anchor=tk.W, pady=2)
+        tk.Label(content_frame, text="💡 修改后从下一次停止计时起生效，暂停的时段都不计入用时",
+                font=('Microsoft YaHei UI', 9), bg='white', fg='#999999').pack(anchor=tk.W, pady=(8, 0))
+
+        def save():
+            self.db.save_settings({'timer_overlap_attribution': mode_var.get()})
+            dialog.destroy()
+
+        button_frame = tk.Frame(dialog, bg='white')
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 20))
+        tk.Button(button_frame, text="取消", font=('Microsoft YaHei UI', 10),
+                 bg='#E0E0E0', fg='#333333', relief=tk.FLAT, cursor='hand2',
+                 command=dialog.destroy, padx=25, pady=8, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="保存", font=('Microsoft YaHei UI', 10, 'bold'),
+                 bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
+                 command=save, padx=30, pady=8, activebackground='#005A9E').pack(side=tk.RIGHT)
+
+    def restore_timers(self):
+        """恢复上次退出时仍在计时的任务，计时区显示最近开始的一个"""
+        if self.timers.restore(self):
+            self.focus_timer(self.timers.latest())
+
+    def start_pomodoro(self):
+        """开始番茄钟；上一阶段结束后等待确认时，继续下一阶段"""
+        todo_id = self.get_selected_id()
+        pomodoro = self.pomodoro
+        if pomodoro and pomodoro.pending_phase and not self.active_timer and todo_id in (None, pomodoro.todo_id):
+            self.begin_pomodoro_phase(pomodoro.continue_cycle())
+            return
+
+        if not todo_id:
+            messagebox.showinfo("提示", "请先选择一个任务")
+            return
+        todo = next((t for t in self.todos if t.id == todo_id), None)
+        if not todo:
+            return
+
+        if self.active_timer and self.active_timer.is_running:
+            if not messagebox.askyesno("确认", "当前有任务正在进行，是否切换？"):
+                return
+        self.stop_timer_internal()
+
+        todo_id = self.db.materialize(todo_id)
+        self.pomodoro = PomodoroCycle(self, todo_id, todo.title, self.db.get_settings(POMODORO_DEFAULTS))
+        self.begin_pomodoro_phase(self.pomodoro.start())
+
+    def begin_pomodoro_phase(self, timer):
+        """番茄钟进入新阶段后更新界面"""
+        pomodoro = self.pomodoro
+        self.active_timer = timer
+        self.timers.add(timer)
+        end_text = pomodoro.phase_end.strftime('%H:%M')
+        if pomodoro.phase == PomodoroCycle.WORK:
+            self.timer_task_label.config(text=f"🍅 第{pomodoro.work_count + 1}个番茄: {timer.task_title}（{end_text} 休息）")
+        else:
+            self.timer_task_label.config(text=f"☕ 休息中，{end_text} 回到: {timer.task_title}")
+        self.start_btn.config(state=tk.DISABLED)
+        self.pause_btn.config(state=tk.NORMAL, text="⏸️ 暂停")
+        self.complete_btn.config(state=tk.NORMAL)
+        self.update_timer_display()
+
+    def on_pomodoro_phase_end(self, finished_phase, next_phase, auto_continue):
+        """番茄钟阶段结束（由 PomodoroCycle 的唤醒调用）：保存记录、提醒，自动或等待进入下一阶段"""
+        pomodoro = self.pomodoro
+        timer, pomodoro.timer = pomodoro.timer, None
+        if timer:
+            timer.stop()
+            self.timers.discard(timer)
+            if timer is self.active_timer:
+                self.active_timer = None
+
+        if finished_phase == PomodoroCycle.WORK:
+            minutes = pomodoro.phase_length(next_phase) // 60
+            self.show_notification("🍅 专注结束", f"完成第{pomodoro.work_count}个番茄，休息 {minutes} 分钟吧")
+            waiting_text = "🍅 专注结束，点击🍅开始休息"
+        else:
+            self.show_notification("☕ 休息结束", f"继续：{pomodoro.task_title}")
+            waiting_text = "☕ 休息结束，点击🍅开始下一个番茄"
+
+        if auto_continue:
+            self.begin_pomodoro_phase(pomodoro.continue_cycle())
+            return
+
+        self.timer_label.config(text="⏱️ 00:00:00")
+        self.timer_task_label.config(text=waiting_text)
+        self.start_btn.config(state=tk.NORMAL)
+        self.pause_btn.config(state=tk.DISABLED, text="⏸️ 暂停")
+        self.complete_btn.config(state=tk.DISABLED)
+
+    def cancel_pomodoro(self):
+        """结束番茄钟循环"""
+        if self.pomodoro:
+            self.pomodoro.cancel()
+            self.pomodoro = None
+
+    def show_pomodoro_settings(self):
+        """番茄钟设置对话框"""
+        settings = self.db.get_settings(POMODORO_DEFAULTS)
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("🍅 番茄钟设置")
+        dialog.configure(bg='white')
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        content_frame = tk.Frame(dialog, bg='white')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+
+        fields = [
+            ('pomodoro_work_minutes', "专注时长(分钟)"),
+            ('pomodoro_short_break_minutes', "短休息(分钟)"),
+            ('pomodoro_long_break_minutes', "长休息(分钟)"),
+            ('pomodoro_long_break_every', "每几个番茄长休息一次"),
+        ]
+        entries = {}
+        for row, (key, label) in enumerate(fields):
+            tk.Label(content_frame, text=label, font=('Microsoft YaHei UI', 10),
+                    bg='white', fg='#333333').grid(row=row, column=0, sticky=tk.W, pady=4)
+            entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5', width=8,
+                             relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+            entry.insert(0, str(settings[key]))
+            entry.grid(row=row, column=1, sticky=tk.W, padx=(10, 0), pady=4)
+            entries[key] = entry
+
+        auto_var = tk.IntVar(value=settings['pomodoro_auto_continue'])
+        tk.Checkbutton(content_frame, text="阶段结束后自动开始下一阶段", variable=auto_var,
+                      font=('Microsoft YaHei UI', 10), bg='white',
+                      activebackground='white').grid(row=len(fields), column=0, columnspan=2, sticky=tk.W, pady=(8, 0))
+
+        def save():
+            new_settings = {'pomodoro_auto_continue': auto_var.get()}
+            for key, entry in entries.items():
+                try:
+                    value = int(entry.get().strip())
+                except ValueError:
+                    value = 0
+                if value <= 0:
+                    messagebox.showwarning("警告", "请输入正整数", parent=dialog)
+                    return
+                new_settings[key] = value
+            self.db.save_settings(new_settings)
+            # 进行中的番茄钟从下一阶段起使用新设置
+            if self.pomodoro:
+                self.pomodoro.settings = new_settings
+            dialog.destroy()
+
+        button_frame = tk.Frame(dialog, bg='white')
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 20))
+        tk.Button(button_frame, text="取消", font=('Microsoft YaHei UI', 10),
+                 bg='#E0E0E0', fg='#333333', relief=tk.FLAT, cursor='hand2',
+                 command=dialog.destroy, padx=25, pady=8, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="保存", font=('Microsoft YaHei UI', 10, 'bold'),
+                 bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
+                 command=save, padx=30, pady=8, activebackground='#005A9E').pack(side=tk.RIGHT)
+
+    def show_schedule_dialog(self):
+        """日程设置：工作时间、休息时段和今天的固定日程"""
+        settings = self.db.get_settings(SCHEDULE_DEFAULTS)
+        today = datetime.now().strftime('%Y-%m-%d')
 
-    def update_timer_display(self):
-        """更新计时器显示"""
-        if self.active_timer and self.active_timer.is_running and not self.active_timer.is_paused:
-            elapsed = self.active_timer.get_elapsed_time()
-            self.timer_label.config(text=f"⏱️ {self.format_timer(elapsed)}")
-            self.timer_update_job = self.root.after(1000, self.update_timer_display)
-
-    def show_summary_dialog(self):
-        """显示任务总结对话框"""
         dialog = tk.Toplevel(self.root)
+        dialog.title("📅 日程")
+        dialog.configure(bg='white')
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        content_frame = tk.Frame(dialog, bg='white')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+
+        fields = [
+            ('schedule_work_start', "上班时间", 8),
+            ('schedule_work_end', "下班时间", 8),
+            ('schedule_breaks', "休息时段", 24),
+            ('schedule_default_minutes', "未填预估按(分钟)", 8),
+        ]
+        entries = {}
+        for row, (key, label, width) in enumerate(fields):
+            tk.Label(content_frame, text=label, font=('Microsoft YaHei UI', 10),
+                    bg='white', fg='#333333').grid(row=row, column=0, sticky=tk.W, pady=4)
+            entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5', width=width,
+                             relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+            entry.insert(0, str(settings[key]))
+            entry.grid(row=row, column=1, columnspan=3, sticky=tk.W, padx=(10, 0), pady=4)
+            entries[key] = entry
+
+        tk.Label(content_frame, text="今天的固定日程（会议等，安排任务时避开）：", font=('Microsoft YaHei UI', 10, 'bold'),
+                bg='white', fg='#333333').grid(row=len(fields), column=0, columnspan=4, sticky=tk.W, pady=(12, 4))
+        appointment_list = tk.Listbox(content_frame, font=('Microsoft YaHei UI', 10), height=6, bg='#F5F5F5',
+                                      relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0',
+                                      selectbackground='#0078D4', activestyle='none')
+        appointment_list.grid(row=len(fields) + 1, column=0, columnspan=4, sticky='we')
+        appointments = []
+
+        def load_appointments():
+            appointments[:] = self.db.get_appointments(today)
+            appointment_list.delete(0, tk.END)
+            for _, title, start_time, end_time in appointments:
+                appointment_list.insert(tk.END, f"{start_time}-{end_time}  {title}")
+
+        add_row = len(fields) + 2
+        title_entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5', width=14,
+                               relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+        title_entry.grid(row=add_row, column=0, sticky=tk.W, pady=(6, 0))
+        start_entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5', width=6,
+                               relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+        start_entry.grid(row=add_row, column=1, sticky=tk.W, padx=(10, 0), pady=(6, 0))
+        end_entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5', width=6,
+                             relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+        end_entry.grid(row=add_row, column=2, sticky=tk.W, padx=(4, 0), pady=(6, 0))
+
+        def add_appointment():
+            title = title_entry.get().strip()
+            try:
+                start, end = parse_clock(start_entry.get()), parse_clock(end_entry.get())
+            except ValueError:
+                messagebox.showwarning("警告", "时间格式应为 HH:MM", parent=dialog)
+                return
+            if not title or end <= start:
+                messagebox.showwarning("警告", "请填写标题，结束时间要晚于开始时间", parent=dialog)
+                return
+            self.db.add_appointment(title, today, format_clock(start), format_clock(end))
+            for entry in (title_entry, start_entry, end_entry):
+                entry.delete(0, tk.END)
+            load_appointments()
+
+        def delete_appointment():
+            for index in appointment_list.curselection():
+                self.db.delete_appointment(appointments[index][0])
+            load_appointments()
+
+        tk.Button(content_frame, text="添加", font=('Microsoft YaHei UI', 9), bg='#E0E0E0', fg='#333333',
+                 relief=tk.FLAT, cursor='hand2', command=add_appointment, padx=10,
+                 activebackground='#D0D0D0').grid(row=add_row, column=3, sticky=tk.W, padx=(6, 0), pady=(6, 0))
+        tk.Button(content_frame, text="删除选中", font=('Microsoft YaHei UI', 9), bg='#E0E0E0', fg='#333333',
+                 relief=tk.FLAT, cursor='hand2', command=delete_appointment, padx=10,
+                 activebackground='#D0D0D0').grid(row=add_row + 1, column=0, sticky=tk.W, pady=(6, 0))
+        load_appointments()
+
+        def save():
+            new_settings = {key: entry.get().strip() for key, entry in entries.items()}
+            try:
+                new_settings['schedule_default_minutes'] = int(new_settings['schedule_default_minutes'])
+            except ValueError:
+                new_settings['schedule_default_minutes'] = 0
+            try:
+                scheduler = DayScheduler(new_settings)
+            except ValueError as e:
+                messagebox.showwarning("警告", str(e), parent=dialog)
+                return
+            if scheduler.work_end <= scheduler.work_start or scheduler.default_duration <= 0:
+                messagebox.showwarning("警告", "下班时间要晚于上班时间，默认时长请输入正整数", parent=dialog)
+                return
+            self.db.save_settings(new_settings)
+            self.scheduler = scheduler
+            close()
+
+        def close():
+            # 固定日程添加/删除后立即生效
+            dialog.destroy()
+            self.update_todo_list()
+
+        dialog.protocol("WM_DELETE_WINDOW", close)
+        button_frame = tk.Frame(dialog, bg='white')
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 20))
+        tk.Button(button_frame, text="关闭", font=('Microsoft YaHei UI', 10),
+                 bg='#E0E0E0', fg='#333333', relief=tk.FLAT, cursor='hand2',
+                 command=close, padx=25, pady=8, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="保存设置", font=('Microsoft YaHei UI', 10, 'bold'),
+                 bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
+                 command=save, padx=30, pady=8, activebackground='#005A9E').pack(side=tk.RIGHT)
+
+    def show_notification(self, title, msg):
+        """系统通知（不可用时仅响铃）"""
+        self.root.bell()
+        self.notifier.notify(title, msg)
+
+    def update_timer_display(self):
+        """更新计时区和列表中所有正在计时的任务（由计时器的共享节拍每秒调用）"""
+        timer = self.active_timer
+        if timer and timer.is_running:
+            self.timer_label.config(text=f"⏱️ {self.format_timer(timer.get_elapsed_time())}")
+            self.update_forecast()
+        for index in self.timer_rows():
+            self.todo_listbox.refresh_row(index)
+
+    def show_summary_dialog(self, todo_id, parent=None):
+        """显示任务总结对话框（精简模式中依附于迷你窗口而不是主窗口）"""
+        parent = parent or self.root
+        dialog = tk.Toplevel(parent)
         dialog.title("任务总结")
         dialog.geometry("520x450")
         dialog.configure(bg='#F3F3F3')
-        dialog.transient(self.root)
+        dialog.transient(parent)
         dialog.grab_set()
 
         # 居中显示
@@ -808,22 +5490,10 @@ class TodoApp:
 
         def save_summary():
             summary = summary_text.get("1.0", tk.END).strip()
-            todo_id = self.get_selected_id()
 
+            # 列表刷新和完成通知由 task_completed 事件的订阅者处理
             if todo_id:
                 self.db.complete_task(todo_id, summary)
-                self.load_today_todos()
-
-                # 发送完成通知
-                if self.notifier:
-                    try:
-                        self.notifier.show_toast(
-                            title="🎉 任务完成",
-                            msg="太棒了！又完成了一项任务",
-                            duration=5
-                        )
-                    except:
-                        pass
 
             dialog.destroy()
 
@@ -836,11 +5506,11 @@ class TodoApp:
                  bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
                  command=save_summary, padx=30, pady=10, activebackground='#005A9E').pack(side=tk.RIGHT)
 
-    def show_add_dialog(self, todo_id=None):
-        """显示添加/编辑对话框"""
+    def show_add_dialog(self, todo_id=None, parent_id=None):
+        """显示添加/编辑对话框（parent_id 为新建子任务的父任务）"""
         dialog = tk.Toplevel(self.root)
-        dialog.title("编辑任务" if todo_id else "新建任务")
-        dialog.geometry("480x600")
+        dialog.title("编辑任务" if todo_id else ("新建子任务" if parent_id else "新建任务"))
+        dialog.geometry("480x660")
         dialog.configure(bg='#F3F3F3')
         dialog.transient(self.root)
         dialog.grab_set()
@@ -851,7 +5521,7 @@ class TodoApp:
         height = dialog.winfo_height()
         x = (dialog.winfo_screenwidth() // 2) - (width // 2)
         y = (dialog.winfo_screenheight() // 2) - (height // 2)
-        dialog.geometry(f'480x600+{x}+{y}')
+        dialog.geometry(f'480x660+{x}+{y}')
 
         # 创建内容容器
         content_frame = tk.Frame(dialog, bg='white')
@@ -883,6 +5553,12 @@ class TodoApp:
                               relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0', width=15)
         date_entry.pack(side=tk.LEFT, padx=(5, 20))
         date_entry.insert(0, datetime.now().strftime('%Y-%m-%d'))
+        # 子任务与父任务同一天
+        parent = next((t for t in self.todos if t.id == parent_id), None) if parent_id else None
+        if parent:
+            date_entry.delete(0, tk.END)
+            date_entry.insert(0, parent.task_date)
+            date_entry.config(state='readonly')
 
         tk.Label(info_frame, text="预估时长(分钟)", font=('Microsoft YaHei UI', 10, 'bold'),
                 bg='white', fg='#333333').pack(side=tk.LEFT)
@@ -890,6 +5566,15 @@ class TodoApp:
                                  relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0', width=10)
         duration_entry.pack(side=tk.LEFT, padx=5)
 
+        # 标签（空格或逗号分隔，子任务默认沿用父任务的标签）
+        tk.Label(content_frame, text="标签", font=('Microsoft YaHei UI', 10, 'bold'),
+                bg='white', fg='#333333').pack(anchor=tk.W)
+        tags_entry = tk.Entry(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5',
+                              relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
+        tags_entry.pack(fill=tk.X, pady=(5, 5))
+        if parent and parent.tags:
+            tags_entry.insert(0, parent.tags)
+
         # 优先级
         tk.Label(content_frame, text="优先级", font=('Microsoft YaHei UI', 10, 'bold'),
                 bg='white', fg='#333333').pack(anchor=tk.W, pady=(10, 5))
@@ -925,20 +5610,21 @@ class TodoApp:
         # 如果是编辑，填充数据
         if todo_id:
             for todo in self.todos:
-                if todo[0] == todo_id:
-                    title_entry.insert(0, todo[1])
-                    desc_text.insert(tk.END, todo[2] or '')
+                if todo.id == todo_id:
+                    title_entry.insert(0, todo.title)
+                    desc_text.insert(tk.END, todo.description or '')
                     date_entry.delete(0, tk.END)
-                    date_entry.insert(0, todo[3] or '')
+                    date_entry.insert(0, todo.task_date or '')
                     duration_entry.delete(0, tk.END)
                     # 将秒转换为分钟显示
-                    duration_minutes = (todo[4] or 0) // 60
+                    duration_minutes = todo.estimated_duration // 60
                     duration_entry.insert(0, str(duration_minutes))
-                    priority_var.set(todo[5])
-                    # 读取重复类型 (新增字段在第9位)
-                    if len(todo) > 9:
-                        repeat_var.set(todo[9] or 0)
+                    priority_var.set(todo.priority)
+                    repeat_var.set(todo.repeat_type)
+                    tags_entry.insert(0, todo.tags)
                     break
+        else:
+            self.bind_title_suggestions(content_frame, title_entry, duration_entry, priority_var)
 
         # 按钮 - Win11风格
         button_frame = tk.Frame(dialog, bg='white')
@@ -958,15 +5644,15 @@ class TodoApp:
                 estimated_duration = 0
             priority = priority_var.get()
             repeat_type = repeat_var.get()
+            tags = parse_tags(tags_entry.get())
 
             if todo_id:
                 # 更新
-                self.db.update_todo(todo_id, title, description, estimated_duration, priority, repeat_type)
+                self.db.update_todo(todo_id, title, description, estimated_duration, priority, repeat_type, tags)
             else:
                 # 新增
-                self.db.add_todo(title, description, task_date, estimated_duration, priority, repeat_type)
-
-            self.load_today_todos()
+                self.db.add_todo(title, description, task_date, estimated_duration, priority, repeat_type, parent_id,
+                                 tags)
             dialog.destroy()
 
         tk.Button(button_frame, text="取消", font=('Microsoft YaHei UI', 10),
@@ -977,35 +5663,427 @@ class TodoApp:
                  bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
                  command=save, padx=30, pady=10, activebackground='#005A9E').pack(side=tk.RIGHT)
 
+    def bind_title_suggestions(self, parent, title_entry, duration_entry, priority_var):
+        """标题输入框下方弹出历史标题补全，选中后按历史中位数填入预估时长和优先级"""
+        if self.title_suggester is None:
+            self.title_suggester = TitleSuggester()
+            self.title_suggester.load(self.db)
+
+        suggestion_listbox = tk.Listbox(parent, font=('Microsoft YaHei UI', 10), bg='white', fg='#333',
+                                        height=5, relief=tk.FLAT, highlightthickness=1,
+                                        highlightbackground='#0078D4', activestyle='none')
+
+        def hide():
+            suggestion_listbox.place_forget()
+
+        def update(event=None):
+            if event is not None and event.keysym in ('Down', 'Up', 'Return', 'Escape', 'Tab'):
+                return
+            suggestions = self.title_suggester.suggest(title_entry.get().strip())
+            if not suggestions:
+                hide()
+                return
+            suggestion_listbox.delete(0, tk.END)
+            for title in suggestions:
+                suggestion_listbox.insert(tk.END, title)
+            suggestion_listbox.config(height=len(suggestions))
+            suggestion_listbox.place(in_=title_entry, x=0, rely=1.0, relwidth=1.0)
+            suggestion_listbox.lift()
+
+        def pick(event=None):
+            selection = suggestion_listbox.curselection()
+            if not selection:
+                return 'break'
+            title = suggestion_listbox.get(selection[0])
+            title_entry.delete(0, tk.END)
+            title_entry.insert(0, title)
+            defaults = self.title_suggester.defaults(title)
+            if defaults:
+                duration, priority = defaults
+                duration_entry.delete(0, tk.END)
+                if duration > 0:
+                    # 不足一分钟按一分钟填
+                    duration_entry.insert(0, str(max(1, round(duration / 60))))
+                priority_var.set(priority)
+            hide()
+            title_entry.focus_set()
+            title_entry.icursor(tk.END)
+            return 'break'
+
+        def focus_list(event):
+            if not suggestion_listbox.winfo_ismapped():
+                return None
+            suggestion_listbox.focus_set()
+            suggestion_listbox.selection_clear(0, tk.END)
+            suggestion_listbox.selection_set(0)
+            return 'break'
+
+        title_entry.bind('<KeyRelease>', update)
+        title_entry.bind('<Down>', focus_list)
+        title_entry.bind('<Escape>', lambda event: hide())
+        suggestion_listbox.bind('<Return>', pick)
+        suggestion_listbox.bind('<ButtonRelease-1>', pick)
+        suggestion_listbox.bind('<Escape>', lambda event: [hide(), title_entry.focus_set()])
+
     def edit_selected(self):
         """编辑选中的任务"""
         todo_id = self.get_selected_id()
         if todo_id:
             # 检查是否有活动的计时器
-            if self.active_timer and self.active_timer.todo_id == todo_id:
+            if self.timers.get(todo_id):
                 messagebox.showwarning("警告", "任务正在进行中，无法编辑")
                 return
             self.show_add_dialog(todo_id)
         else:
             messagebox.showinfo("提示", "请先选择一个任务")
 
+    def get_active_chain(self, timer=None):
+        """正在计时的任务及其所有上级任务的id（完成其中任何一个都会带上正在计时的任务）；不指定 timer 时包含所有计时器"""
+        parents = {todo.id: todo.parent_id for todo in self.all_todos}
+        chain = set()
+        for timer in ([timer] if timer else self.timers):
+            todo_id = timer.todo_id
+            while todo_id is not None and todo_id not in chain:
+                chain.add(todo_id)
+                todo_id = parents.get(todo_id)
+        return chain
+
+    def add_subtask(self):
+        """为选中的任务新建子任务"""
+        todo_id = self.get_selected_id()
+        if not todo_id:
+            messagebox.showinfo("提示", "请先选择一个任务")
+            return
+        self.show_add_dialog(parent_id=todo_id)
+
+    def confirm_start_blocked(self, todo_id):
+        """任务还有未完成的前置任务时询问是否仍要开始"""
+        todo = next((t for t in self.todos if t.id == todo_id), None)
+        if todo is None or not todo.blocked:
+            return True
+        blockers = self.db.get_blockers(todo_id)
+        names = [t.title for t in self.all_todos if t.id in blockers]
+        if len(names) < len(blockers):
+            names.append(f"{len(blockers) - len(names)} 个其他任务")
+        return messagebox.askyesno("确认", f"「{todo.title}」还在等待：{'、'.join(names)}\n仍要开始吗？")
+
+    def edit_dependencies(self):
+        """设置选中任务的前置任务（在今天的任务中多选）"""
+        todo_id = self.get_selected_id()
+        if not todo_id:
+            messagebox.showinfo("提示", "请先选择一个任务")
+            return
+        todo = next(t for t in self.todos if t.id == todo_id)
+        # 候选不受筛选影响；其他日期的前置任务不在列表中，保存时保留
+        candidates = [t for t in self.db.get_today_todos() if t.id != todo_id]
+        candidate_ids = {t.id for t in candidates}
+        current = self.db.get_blockers(todo_id)
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("🔗 前置任务")
+        dialog.geometry("420x460")
+        dialog.configure(bg='white')
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        content_frame = tk.Frame(dialog, bg='white')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(20, 10))
+        tk.Label(content_frame, text=f"「{todo.title}」需要先完成：", font=('Microsoft YaHei UI', 11, 'bold'),
+                bg='white', fg='#333333', wraplength=380, justify=tk.LEFT).pack(anchor=tk.W, pady=(0, 10))
+
+        listbox = tk.Listbox(content_frame, selectmode=tk.MULTIPLE, font=('Microsoft YaHei UI', 10),
+                             bg='#F5F5F5', relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0',
+                             selectbackground='#0078D4', activestyle='none')
+        listbox.pack(fill=tk.BOTH, expand=True)
+        for index, candidate in enumerate(candidates):
+            listbox.insert(tk.END, f"{self.subtask_indent(candidate)}{candidate.title}")
+            if candidate.id in current:
+                listbox.selection_set(index)
+
+        def save():
+            selected = {candidates[index].id for index in listbox.curselection()}
+            try:
+                self.db.set_dependencies(todo_id, selected | (current - candidate_ids))
+            except ValueError as e:
+                messagebox.showwarning("无法设置", str(e), parent=dialog)
+                return
+            dialog.destroy()
+
+        button_frame = tk.Frame(dialog, bg='white')
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 20))
+        tk.Button(button_frame, text="取消", font=('Microsoft YaHei UI', 10),
+                 bg='#E0E0E0', fg='#333333', relief=tk.FLAT, cursor='hand2',
+                 command=dialog.destroy, padx=25, pady=8, activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="保存", font=('Microsoft YaHei UI', 10, 'bold'),
+                 bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
+                 command=save, padx=30, pady=8, activebackground='#005A9E').pack(side=tk.RIGHT)
+
     def delete_selected(self):
         """删除选中的任务"""
         todo_id = self.get_selected_id()
         if todo_id:
             # 检查是否有活动的计时器
-            if self.active_timer and self.active_timer.todo_id == todo_id:
+            if self.timers.get(todo_id):
                 messagebox.showwarning("警告", "任务正在进行中，无法删除")
                 return
 
             if messagebox.askyesno("确认", "确定要删除这个任务吗？"):
+                title = next(todo.title for todo in self.todos if todo.id == todo_id)
                 self.db.delete_todo(todo_id)
-                self.load_today_todos()
+                self.show_status(f"🗑️ 已删除「{title}」，按 Ctrl+Z 撤销")
         else:
             messagebox.showinfo("提示", "请先选择一个任务")
 
-    def show_history(self):
-        """显示历史记录和复盘界面"""
+    def undo(self):
+        """撤销最近一次新建/编辑/删除（Ctrl+Z）"""
+        self.step_journal(self.db.undo, "已撤销")
+
+    def redo(self):
+        """重做撤销的修改（Ctrl+Y / Ctrl+Shift+Z）"""
+        self.step_journal(self.db.redo, "已重做")
+
+    def step_journal(self, step, verb):
+        """执行一步撤销/重做（列表由数据变更事件刷新）"""
+        result = step()
+        if result is None:
+            self.root.bell()
+            return
+        action, title = result
+        action_name = {'add': '新建', 'update': '编辑', 'delete': '删除'}.get(action, action)
+        self.show_status(f"↩️ {verb}{action_name}「{title}」")
+
+    def show_status(self, text, duration_ms=4000):
+        """在计时区下方临时显示一条提示，之后恢复为完成时间预测"""
+        self.forecast_label.config(text=text)
+        # 连续撤销时只保留最后一次的恢复任务，不让先到期的任务提前清掉新提示
+        if self.status_job is not None:
+            self.root.after_cancel(self.status_job)
+        self.status_job = self.root.after(duration_ms, self.restore_forecast)
+
+    def toggle_profiler(self):
+        """开始或停止界面卡顿分析，停止时结果保存在数据库旁边"""
+        if not self.profiler.running:
+            self.profiler.start()
+            self.show_status("📈 正在分析界面卡顿，再按 Ctrl+Shift+F12 停止并保存", 10000)
+            return
+        try:
+            folded_path, summary_path = self.profiler.stop()
+        except OSError as e:
+            messagebox.showerror("错误", f"保存分析结果失败：{e}")
+            return
+        self.show_status(f"📈 分析结果已保存: {os.path.basename(summary_path)}", 10000)
+        print(f"卡顿分析已保存到: {folded_path}、{summary_path}")
+
+    def restore_forecast(self):
+        self.status_job = None
+        self.update_forecast()
+
+    def complete_all_done(self):
+        """将所有已打勾（已计时）的任务一次性完成（子任务随父任务一起完成，包括被筛选隐藏的）"""
+        # 正在计时的任务及其所有上级都不能完成
+        busy_ids = self.get_active_chain()
+        done_ids = [todo.id for todo in self.all_todos if todo.status == 1 and todo.id not in busy_ids]
+        if not done_ids:
+            messagebox.showinfo("提示", "没有已打勾的任务")
+            return
+
+        if messagebox.askyesno("确认", f"确定要完成 {len(done_ids)} 个已打勾的任务吗？"):
+            self.db.complete_tasks(done_ids)
+
+    def build_search_index(self):
+        """构建命令面板索引：0 今日及以后的任务，1 重复模板，2 完成历史（按标题合并）"""
+        items = self.db.get_search_items()
+        index = FuzzyIndex(group_count=3)
+        for todo_id, title, task_date in items['todos']:
+            index.add(('todo', todo_id), title, {'task_date': task_date}, 0)
+        for template_id, title in items['templates']:
+            index.add(('template', template_id), title, None, 1)
+        for title, task_date, completed_task_id, count in items['history']:
+            index.add(('history', title), title, {'task_date': task_date, 'id': completed_task_id, 'count': count}, 2)
+        self.search_index = index
+
+    def on_data_changed(self, event):
+        """数据变更时增量更新命令面板索引和标题补全（尚未加载时忽略）"""
+        event_type, data = event.type, event.data
+        # 撤销新建时正在计时的任务可能被删除，先停止计时
+        if event_type == 'task_deleted' and self.timers.get(data['todo_id']):
+            self.stop_timer(self.timers.get(data['todo_id']))
+
+        if event_type == 'task_completed':
+            self.estimator.record(data['title'], data['repeat_template_id'],
+                                  data['estimated_duration'], data['total_duration'])
+            if self.title_suggester is not None:
+                self.title_suggester.record(data['title'], data['total_duration'] or data['estimated_duration'],
+                                            data['priority'], data['task_date'])
+
+        index = self.search_index
+        if index is None:
+            return
+        if event_type == 'tasks_imported':
+            # 批量导入不逐条通知，下次打开命令面板时重建索引
+            self.search_index = None
+            return
+
+        if event_type in ('task_added', 'task_updated'):
+            if data['task_date'] < datetime.now().strftime('%Y-%m-%d'):
+                # 与 get_search_items 一致，只索引今日及以后的任务
+                index.remove(('todo', data['todo_id']))
+            else:
+                index.add(('todo', data['todo_id']), data['title'], {'task_date': data['task_date']}, 0)
+        elif event_type == 'task_deleted':
+            index.remove(('todo', data['todo_id']))
+        elif event_type == 'task_completed':
+            index.remove(('todo', data['todo_id']))
+            key = ('history', data['title'])
+            existing = index.get(key)
+            count = existing[1]['count'] + 1 if existing else 1
+            task_date = max(existing[1]['task_date'], data['task_date']) if existing else data['task_date']
+            index.add(key, data['title'], {'task_date': task_date, 'id': data['completed_task_id'], 'count': count}, 2)
+        elif event_type == 'template_saved':
+            index.add(('template', data['template_id']), data['title'], None, 1)
+        elif event_type == 'template_deleted':
+            index.remove(('template', data['template_id']))
+
+    def show_command_palette(self):
+        """命令面板（Ctrl+K / Ctrl+P）：模糊搜索任务、重复模板和完成历史
+
+        回车：开始任务 / 跳转到历史日期；Ctrl+回车：直接完成任务；Shift+回车：编辑任务 / 查看历史详情
+        """
+        if self.search_index is None:
+            self.build_search_index()
+
+        palette = tk.Toplevel(self.root)
+        palette.title("🔍 命令面板")
+        palette.geometry("520x380")
+        palette.configure(bg='white')
+        palette.transient(self.root)
+
+        # 居中显示在主窗口上方
+        palette.update_idletasks()
+        x = self.root.winfo_rootx() + (self.root.winfo_width() - 520) // 2
+        y = self.root.winfo_rooty() + 40
+        palette.geometry(f'520x380+{x}+{y}')
+
+        query_entry = tk.Entry(palette, font=('Microsoft YaHei UI', 12), bg='#F5F5F5',
+                               relief=tk.FLAT, highlightthickness=1, highlightbackground='#0078D4')
+        query_entry.pack(fill=tk.X, padx=12, pady=(12, 6), ipady=4)
+
+        result_listbox = tk.Listbox(palette, font=('Microsoft YaHei UI', 10), bg='white', fg='#333',
+                                    selectmode=tk.SINGLE, borderwidth=0, highlightthickness=0,
+                                    selectbackground='#CCE4F7', selectforeground='#000000', activestyle='none')
+        result_listbox.pack(fill=tk.BOTH, expand=True, padx=12)
+
+        tk.Label(palette, text="回车 开始/跳转 · Ctrl+回车 完成 · Shift+回车 编辑/详情 · Esc 关闭",
+                font=('Microsoft YaHei UI', 8), bg='white', fg='#999').pack(anchor=tk.W, padx=12, pady=(4, 8))
+
+        results = []
+        last_query = [None]
+        today = datetime.now().strftime('%Y-%m-%d')
+
+        def refresh(event=None):
+            query = query_entry.get()
+            if query == last_query[0]:
+                return
+            last_query[0] = query
+            results[:] = self.search_index.search(query)
+            result_listbox.delete(0, tk.END)
+            for (kind, item_id), title, data in results:
+                if kind == 'todo':
+                    date_text = '今日' if data['task_date'] == today else data['task_date']
+                    result_listbox.insert(tk.END, f"⬜ {title}  · {date_text}")
+                elif kind == 'template':
+                    result_listbox.insert(tk.END, f"🔄 {title}  · 重复模板")
+                else:
+                    result_listbox.insert(tk.END, f"📜 {title}  · {data['task_date']} ×{data['count']}")
+            if results:
+                result_listbox.selection_set(0)
+
+        def move(delta):
+            if not results:
+                return 'break'
+            selection = result_listbox.curselection()
+            index = max(0, min(len(results) - 1, (selection[0] if selection else -1) + delta))
+            result_listbox.selection_clear(0, tk.END)
+            result_listbox.selection_set(index)
+            result_listbox.see(index)
+            return 'break'
+
+        def activate(action):
+            selection = result_listbox.curselection()
+            if not selection:
+                return 'break'
+            key, title, data = results[selection[0]]
+            palette.destroy()
+            self.run_palette_action(action, key, title, data)
+            return 'break'
+
+        query_entry.bind('<KeyRelease>', refresh)
+        query_entry.bind('<Down>', lambda event: move(1))
+        query_entry.bind('<Up>', lambda event: move(-1))
+        query_entry.bind('<Return>', lambda event: activate('open'))
+        query_entry.bind('<Control-Return>', lambda event: activate('complete'))
+        query_entry.bind('<Shift-Return>', lambda event: activate('edit'))
+        result_listbox.bind('<Double-Button-1>', lambda event: activate('open'))
+        palette.bind('<Escape>', lambda event: palette.destroy())
+        query_entry.focus_set()
+
+    def run_palette_action(self, action, key, title, data):
+        """执行命令面板选中项的操作"""
+        kind, item_id = key
+        if kind == 'history':
+            if action == 'edit':
+                tasks = self.db.get_completed_tasks(start_date=data['task_date'], end_date=data['task_date'])
+                task = next((t for t in tasks if t.title == title), None)
+                if task:
+                    self.show_task_detail_dialog(task)
+            else:
+                self.show_history(focus_date=data['task_date'], focus_title=title)
+            return
+
+        # 重复模板对应今日生成的任务
+        if kind == 'template':
+            todo = next((t for t in self.todos if t.repeat_template_id == item_id), None)
+            if not todo:
+                messagebox.showinfo("提示", "今日没有该重复任务")
+                return
+            item_id = todo.id
+
+        if action == 'complete':
+            if self.timers.get(item_id):
+                self.select_todo(item_id)
+                self.focus_timer(self.timers.get(item_id))
+                self.complete_task()
+            elif item_id in self.get_active_chain():
+                # 完成父任务会带上正在计时的子任务，先保存计时
+                for timer in self.timers:
+                    if item_id in self.get_active_chain(timer):
+                        self.stop_timer(timer)
+                self.db.complete_task(item_id)
+            else:
+                self.db.complete_task(item_id)
+            return
+
+        # 开始和编辑只针对今日列表中的任务
+        if not self.select_todo(item_id):
+            messagebox.showinfo("提示", "只能开始或编辑今日的任务")
+            return
+        if action == 'edit':
+            self.edit_selected()
+        elif not (self.active_timer and self.active_timer.todo_id == item_id):
+            self.start_task()
+
+    def select_todo(self, todo_id):
+        """在今日任务列表中选中指定任务，找不到时返回 False"""
+        index = next((i for i, t in enumerate(self.todos) if t.id == todo_id), None)
+        if index is None:
+            return False
+        self.todo_listbox.selection_clear(0, tk.END)
+        self.todo_listbox.selection_set(index)
+        self.todo_listbox.see(index)
+        return True
+
+    def show_history(self, focus_date=None, focus_title=None):
+        """显示历史记录和复盘界面（focus_date/focus_title 定位到指定的已完成任务）"""
         history_window = tk.Toplevel(self.root)
         history_window.title("📊 历史复盘")
         history_window.geometry("800x600")
@@ -1023,7 +6101,8 @@ class TodoApp:
         cards = [
             ("近7天完成", f"{stats['total_completed']} 个", "#4CAF50"),
             ("总工作时长", self.format_duration(stats['total_duration']), "#2196F3"),
-            ("平均每天", f"{stats['total_completed'] // 7 if stats['total_completed'] > 0 else 0} 个", "#FF9800")
+            ("平均每天", f"{stats['total_completed'] // 7 if stats['total_completed'] > 0 else 0} 个", "#FF9800"),
+            ("近7天番茄", f"{stats['pomodoro_stats']['work_count']} 个", "#E53935")
         ]
 
         for i, (title, value, color) in enumerate(cards):
@@ -1033,6 +6112,14 @@ class TodoApp:
             tk.Label(card, text=title, font=('Microsoft YaHei UI', 10), bg='white', fg='#666').pack(pady=(15, 5))
             tk.Label(card, text=value, font=('Microsoft YaHei UI', 24, 'bold'), bg='white', fg=color).pack(pady=(0, 15))
 
+        # 导出报告
+        export_frame = tk.Frame(history_window, bg='#f5f5f5')
+        export_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
+        tk.Button(export_frame, text="导出近30天报告", font=('Microsoft YaHei UI', 10),
+                 bg='#E0E0E0', fg='#000000', relief=tk.FLAT, cursor='hand2',
+                 command=lambda: self.export_report(history_window), padx=15, pady=6,
+                 activebackground='#D0D0D0').pack(side=tk.RIGHT)
+
         # Tab控件
         notebook = ttk.Notebook(history_window)
         notebook.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
@@ -1045,19 +6132,53 @@ class TodoApp:
         scrollbar1 = ttk.Scrollbar(completed_frame)
         scrollbar1.pack(side=tk.RIGHT, fill=tk.Y)
 
+        # 时间范围和标签筛选
+        filter_frame = tk.Frame(completed_frame, bg='white')
+        filter_frame.pack(fill=tk.X, padx=5, pady=5)
+        range_options = {'近30天': 30, '近一年': 365}
+        range_var = tk.StringVar(value='近30天')
+        range_box = ttk.Combobox(filter_frame, textvariable=range_var, values=list(range_options), width=8,
+                                 state='readonly')
+        range_box.pack(side=tk.LEFT)
+        tag_chips = tk.Frame(filter_frame, bg='white')
+        tag_chips.pack(side=tk.LEFT, fill=tk.X, padx=5)
+        tag_filter = set()
+
         completed_listbox = tk.Listbox(completed_frame, font=('Microsoft YaHei UI', 11),
                                        bg='white', fg='#333', selectmode=tk.SINGLE,
                                        yscrollcommand=scrollbar1.set, borderwidth=0)
         completed_listbox.pack(fill=tk.BOTH, expand=True)
         scrollbar1.config(command=completed_listbox.yview)
 
-        # 加载已完成任务
-        completed_tasks = self.db.get_completed_tasks(days=30)
-        for task in completed_tasks:
-            task_id, title, description, task_date, completed_at, total_duration, priority, summary = task
-            priority_icon = ['📌', '⭐', '🔥'][priority]
-            display_text = f"{priority_icon} {title} | ⏱️ {self.format_duration(total_duration)} | 📅 {task_date}"
-            completed_listbox.insert(tk.END, display_text)
+        completed_tasks = []
+
+        def load_completed():
+            """按范围和选中的标签加载已完成任务（定位的日期早于范围时从该日期开始加载）"""
+            start_date = (datetime.now() - timedelta(days=range_options[range_var.get()])).strftime('%Y-%m-%d')
+            if focus_date and focus_date < start_date:
+                start_date = focus_date
+            history_tags = self.db.get_history_tags(start_date)
+            tag_filter.intersection_update(tag_id for tag_id, name, count in history_tags)
+            self.build_tag_chips(tag_chips, [(tag_id, f"{name}({count})") for tag_id, name, count in history_tags],
+                                 tag_filter, load_completed)
+            completed_tasks[:] = self.db.get_completed_tasks(start_date=start_date, tag_ids=tag_filter)
+            completed_listbox.delete(0, tk.END)
+            for task in completed_tasks:
+                priority_icon = ['📌', '⭐', '🔥'][task.priority]
+                display_text = f"{priority_icon} {task.title} | ⏱️ {self.format_duration(task.total_duration)} | 📅 {task.task_date}"
+                completed_listbox.insert(tk.END, display_text)
+
+        # 绑定在控件上（窗口关闭时随控件删除），不用变量的 trace：trace 回调引用着变量本身，
+        # 窗口关闭后变量、它的 Tcl 命令和整个窗口的闭包都不会被释放
+        range_box.bind('<<ComboboxSelected>>', lambda event: load_completed())
+        load_completed()
+
+        if focus_date:
+            focus_index = next((i for i, task in enumerate(completed_tasks)
+                                if task.task_date == focus_date and task.title == focus_title), None)
+            if focus_index is not None:
+                completed_listbox.selection_set(focus_index)
+                completed_listbox.see(focus_index)
 
         # 双击查看详情
         def show_task_detail(event):
@@ -1088,6 +6209,98 @@ class TodoApp:
             display_text = f"📅 {date} | ✅ 完成 {count} 个任务 | ⏱️ 用时 {self.format_duration(duration)}"
             daily_listbox.insert(tk.END, display_text)
 
+        # 标签统计Tab
+        tag_frame = tk.Frame(notebook, bg='white')
+        notebook.add(tag_frame, text="🏷️ 标签统计")
+
+        tag_listbox = tk.Listbox(tag_frame, font=('Microsoft YaHei UI', 11),
+                                 bg='white', fg='#333', selectmode=tk.SINGLE, borderwidth=0)
+        tag_listbox.pack(fill=tk.BOTH, expand=True)
+        for name, count, duration in stats['tag_stats']:
+            tag_listbox.insert(tk.END, f"🏷️ #{name} | ✅ 完成 {count} 个任务 | ⏱️ 用时 {self.format_duration(duration or 0)}")
+        if not stats['tag_stats']:
+            tag_listbox.insert(tk.END, "近7天完成的任务都没有标签")
+
+        # 效率分析Tab
+        analysis_frame = tk.Frame(notebook, bg='white')
+        notebook.add(analysis_frame, text="📉 效率分析")
+        self.build_analysis_tab(analysis_frame)
+
+    def build_analysis_tab(self, parent, days=30):
+        """效率分析：预估准确度、连续天数、分时段热力图、移动平均"""
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        start_date = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        report = self.analytics.get_report(start_date, end_date)
+
+        accuracy = report['accuracy']
+        streaks = report['streaks']
+        if accuracy['count']:
+            accuracy_text = (f"🎯 预估准确率 {accuracy['accurate_rate']:.0%}（误差20%以内）"
+                             f" | 实际/预估 {accuracy['ratio']:.2f} | 超时 {accuracy['over_rate']:.0%}")
+        else:
+            accuracy_text = "🎯 近期没有填写预估时长的已完成任务"
+        streak_text = (f"🔥 当前连续 {streaks['current']} 天 | 最长连续 {streaks['longest']} 天"
+                       f" | 近{days}天有完成 {streaks['active_days']} 天")
+
+        tk.Label(parent, text=accuracy_text, font=('Microsoft YaHei UI', 10),
+                bg='white', fg='#333').pack(anchor=tk.W, padx=10, pady=(10, 2))
+        tk.Label(parent, text=streak_text, font=('Microsoft YaHei UI', 10),
+                bg='white', fg='#333').pack(anchor=tk.W, padx=10, pady=(0, 8))
+
+        # 分时段热力图（行：周一到周日，列：0-23点）
+        cell_w, cell_h, left, top = 26, 18, 40, 20
+        canvas = tk.Canvas(parent, width=left + cell_w * 24 + 10, height=top + cell_h * 7 + 60,
+                           bg='white', highlightthickness=0)
+        canvas.pack(anchor=tk.W, padx=10)
+
+        heatmap = report['heatmap']
+        peak = max(max(row) for row in heatmap) or 1
+        weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+        for hour in range(0, 24, 3):
+            canvas.create_text(left + hour * cell_w + cell_w // 2, top // 2, text=str(hour),
+                               font=('Segoe UI', 8), fill='#888')
+        for row, seconds_by_hour in enumerate(heatmap):
+            y = top + row * cell_h
+            canvas.create_text(left // 2, y + cell_h // 2, text=weekday_names[row],
+                               font=('Microsoft YaHei UI', 8), fill='#666')
+            for hour, seconds in enumerate(seconds_by_hour):
+                # 颜色从浅灰到主题蓝按时长线性插值
+                level = seconds / peak
+                color = '#%02X%02X%02X' % (int(240 - 240 * level), int(240 - 120 * level), int(240 - 28 * level))
+                x = left + hour * cell_w
+                canvas.create_rectangle(x + 1, y + 1, x + cell_w - 1, y + cell_h - 1, fill=color, outline='')
+
+        # 各优先级每日时长的移动平均（取最后一天的值）
+        names = ['📌 普通', '⭐ 重要', '🔥 紧急']
+        averages = report['moving_averages']
+        average_text = " | ".join(f"{names[p]} {self.format_duration(int(averages[p][-1]))}/天" for p in range(3))
+        canvas.create_text(left, top + cell_h * 7 + 25, anchor=tk.W,
+                           text=f"近{MOVING_AVERAGE_DAYS}天平均用时：{average_text}",
+                           font=('Microsoft YaHei UI', 9), fill='#333')
+
+    def export_report(self, parent, days=30):
+        """导出近期复盘报告，格式由文件扩展名决定"""
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        path = filedialog.asksaveasfilename(
+            parent=parent, title="导出复盘报告", defaultextension='.html',
+            initialfile=f"复盘报告-{start_date}-{end_date}.html",
+            filetypes=[('HTML', '*.html'), ('Markdown', '*.md'), ('CSV', '*.csv')])
+        if not path:
+            return
+
+        fmt = os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ReportExporter.FORMATS:
+            messagebox.showwarning("警告", "请选择 .html、.md 或 .csv 格式", parent=parent)
+            return
+
+        try:
+            ReportExporter(self.db).export(fmt, start_date, end_date, path)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出失败：{e}", parent=parent)
+            return
+        messagebox.showinfo("提示", f"报告已导出到：\n{path}", parent=parent)
+
     def show_task_detail_dialog(self, task):
         """显示任务详情对话框"""
         dialog = tk.Toplevel(self.root)
@@ -1097,8 +6310,6 @@ class TodoApp:
         dialog.transient(self.root)
         dialog.grab_set()
 
-        task_id, title, description, task_date, completed_at, total_duration, priority, summary = task
-
         # 居中显示
         dialog.update_idletasks()
         x = (dialog.winfo_screenwidth() // 2) - 250
@@ -1109,26 +6320,26 @@ class TodoApp:
         content_frame = tk.Frame(dialog, bg='white')
         content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
-        tk.Label(content_frame, text=title, font=('Microsoft YaHei UI', 16, 'bold'),
+        tk.Label(content_frame, text=task.title, font=('Microsoft YaHei UI', 16, 'bold'),
                 bg='white', fg='#333').pack(anchor=tk.W, pady=(0, 10))
 
-        info_text = f"📅 完成日期: {task_date}\n⏱️ 用时: {self.format_duration(total_duration)}"
+        info_text = f"📅 完成日期: {task.task_date}\n⏱️ 用时: {self.format_duration(task.total_duration)}"
         tk.Label(content_frame, text=info_text, font=('Microsoft YaHei UI', 10),
                 bg='white', fg='#666').pack(anchor=tk.W, pady=(0, 15))
 
-        if description:
+        if task.description:
             tk.Label(content_frame, text="📄 任务描述", font=('Microsoft YaHei UI', 11, 'bold'),
                     bg='white').pack(anchor=tk.W, pady=(5, 5))
-            tk.Label(content_frame, text=description, font=('Microsoft YaHei UI', 10),
+            tk.Label(content_frame, text=task.description, font=('Microsoft YaHei UI', 10),
                     bg='white', fg='#333', wraplength=450, justify=tk.LEFT).pack(anchor=tk.W, pady=(0, 10))
 
-        if summary:
+        if task.summary:
             tk.Label(content_frame, text="💡 任务总结", font=('Microsoft YaHei UI', 11, 'bold'),
                     bg='white').pack(anchor=tk.W, pady=(5, 5))
             summary_text_widget = tk.Text(content_frame, font=('Microsoft YaHei UI', 10),
                                          bg='#f8f9fa', height=8, wrap=tk.WORD)
             summary_text_widget.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
-            summary_text_widget.insert(tk.END, summary)
+            summary_text_widget.insert(tk.END, task.summary)
             summary_text_widget.config(state=tk.DISABLED)
 
         tk.Button(content_frame, text="关闭", font=('Microsoft YaHei UI', 10),
@@ -1162,6 +6373,8 @@ class TodoApp:
 
         # 当窗口关闭时恢复主窗口
         def on_mini_window_close():
+            self.timers.unsubscribe(update_mini_timer)
+            self.mini_window = None
             self.root.deiconify()  # 显示主窗口
             self.main_window_visible = True
             mini_window.destroy()
@@ -1251,38 +6464,19 @@ class TodoApp:
         list_frame = tk.Frame(mini_window, bg='#F9F9F9')
         list_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(10, 5))
 
-        # 任务列表（无滚动条，Win11圆角风格，字体增大到14号）
-        mini_listbox = tk.Listbox(list_frame, font=('Microsoft YaHei UI', 14),
-                                 bg='#FFFFFF', fg='#000000', selectmode=tk.SINGLE,
-                                 borderwidth=0, highlightthickness=0,
-                                 selectbackground='#0078D4', selectforeground='#FFFFFF',
-                                 relief=tk.FLAT)
+        # 任务列表（无滚动条，可用滚轮滚动，字体增大到14号）
+        mini_listbox = VirtualListView(list_frame, row_height=40, font=('Microsoft YaHei UI', 14))
         mini_listbox.pack(fill=tk.BOTH, expand=True)
 
-        # 填充任务
-        for todo in self.todos:
-            todo_id, title, description, task_date, estimated_duration, priority, status, created_at, notified, repeat_type, repeat_template_id = todo[:11]
-            # 获取实际已用时长
-            total_duration = self.db.get_task_total_duration(todo_id)
-
-            priority_icon = ['📌', '⭐', '🔥'][priority]
-            status_icon = '✅' if status == 1 else '⬜'
-
-            # 显示时长：已进行时长/总时长
-            elapsed_text = self.format_duration_simple(total_duration)
-
-            if estimated_duration > 0:
-                total_text = self.format_duration_simple(estimated_duration)
-                display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}/{total_text}"
-            else:
-                display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}"
-
-            mini_listbox.insert(tk.END, display_text)
-
         # 保存引用
         mini_window.mini_listbox = mini_listbox
         mini_window.mini_timer_label = mini_timer_label
 
+        # 填充任务（之后随任务变化事件刷新）
+        self.mini_window = mini_window
+        self.refresh_mini_list(mini_window)
+        self.bind_reorder(mini_listbox, lambda: self.refresh_mini_list(mini_window))
+
         # 右下角小按钮区域
         bottom_right_frame = tk.Frame(mini_window, bg='#F9F9F9')
         bottom_right_frame.pack(side=tk.RIGHT, padx=15, pady=10)
@@ -1315,51 +6509,14 @@ class TodoApp:
                             activebackground='#E0E0E0')
         back_btn.pack(side=tk.LEFT, padx=3)
 
-        # 定时更新计时器和任务列表
+        # 随计时器的共享节拍更新计时器和任务列表中所有正在计时的行
         def update_mini_timer():
-            if hasattr(self, 'active_timer') and self.active_timer and self.active_timer.is_running:
-                # 更新计时器显示
-                elapsed = self.active_timer.get_elapsed_time()
-                mini_timer_label.config(text=self.format_timer(elapsed))
-
-                # 更新任务列表中正在进行的任务的时间显示
-                if hasattr(mini_window, 'mini_listbox'):
-                    try:
-                        # 找到当前正在进行的任务在列表中的位置
-                        current_todo_id = self.active_timer.todo_id
-                        for idx, todo in enumerate(self.todos):
-                            if todo[0] == current_todo_id:
-                                # 获取该任务的总时长（之前已用时长 + 当前会话时长）
-                                todo_id, title, description, task_date, estimated_duration, priority, status, created_at, notified, repeat_type, repeat_template_id = todo[:11]
-                                # 获取之前记录的已用时长
-                                previous_duration = self.db.get_task_total_duration(todo_id)
-                                # 加上当前会话的时长（注意：get_task_total_duration不包括当前未保存的会话）
-                                total_elapsed = previous_duration + elapsed
-
-                                priority_icon = ['📌', '⭐', '🔥'][priority]
-                                status_icon = '✅' if status == 1 else '⬜'
-
-                                # 更新显示文本
-                                elapsed_text = self.format_duration_simple(total_elapsed)
-                                if estimated_duration > 0:
-                                    total_text = self.format_duration_simple(estimated_duration)
-                                    display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}/{total_text}"
-                                else:
-                                    display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}"
-
-                                # 更新列表中的这一项
-                                mini_window.mini_listbox.delete(idx)
-                                mini_window.mini_listbox.insert(idx, display_text)
-                                break
-                    except:
-                        pass
-
-            try:
-                if mini_window.winfo_exists():
-                    mini_window.after(1000, update_mini_timer)
-            except:
-                pass
+            if self.active_timer and self.active_timer.is_running:
+                mini_timer_label.config(text=self.format_timer(self.active_timer.get_elapsed_time()))
+            for index in self.timer_rows():
+                mini_listbox.refresh_row(index)
 
+        self.timers.subscribe(update_mini_timer)
         update_mini_timer()
 
     def start_task_from_mini(self, mini_window):
@@ -1374,23 +6531,12 @@ class TodoApp:
         if index >= len(self.todos):
             return
 
-        todo_id = self.todos[index][0]
-
-        # 如果有正在运行的任务，先停止
-        if self.active_timer and self.active_timer.is_running:
-            if not messagebox.askyesno("确认", "当前有任务正在进行，是否切换？"):
-                return
-            self.stop_timer_internal()
-
-        # 获取任务标题
-        todo = next((t for t in self.todos if t[0] == todo_id), None)
-        if todo:
-            task_title = todo[1]
-            self.active_timer = TaskTimer(self, todo_id, task_title, None)
-            self.active_timer.start()
+        todo_id = self.todos[index].id
 
+        timer = self.begin_timer(todo_id)
+        if timer:
             # 更新迷你窗口界面
-            mini_window.mini_timer_label.config(text=f"⏱️ 00:00:00")
+            mini_window.mini_timer_label.config(text=self.format_timer(timer.get_elapsed_time()))
 
     def pause_task_from_mini(self, mini_window):
         """从迷你窗口暂停任务"""
@@ -1403,113 +6549,455 @@ class TodoApp:
             return
 
         # 停止计时器
-        if self.timer_update_job:
-            self.root.after_cancel(self.timer_update_job)
-            self.timer_update_job = None
-
-        self.active_timer.stop()
-        todo_id = self.active_timer.todo_id  # 保存todo_id,因为后面会清空
-        self.active_timer = None
+        todo_id = self.active_timer.todo_id  # 保存todo_id,因为后面会切换到其他计时器
+        self.stop_timer_internal()
 
         # 重置迷你窗口界面
-        mini_window.mini_timer_label.config(text="⏱️ 00:00:00")
+        timer = self.active_timer
+        mini_window.mini_timer_label.config(
+            text=self.format_timer(timer.get_elapsed_time()) if timer else "⏱️ 00:00:00")
 
         # 弹出总结对话框（依附于迷你窗口而不是主窗口）
-        self.show_summary_dialog_for_mini(mini_window, todo_id)
-
-    def show_summary_dialog_for_mini(self, parent_window, todo_id):
-        """显示任务总结对话框（精简模式专用）"""
-        dialog = tk.Toplevel(parent_window)
-        dialog.title("任务总结")
-        dialog.geometry("520x450")
-        dialog.configure(bg='#F3F3F3')
-        dialog.transient(parent_window)  # 依附于迷你窗口而不是主窗口
-        dialog.grab_set()  # 模态对话框
-
-        # 居中显示
-        dialog.update_idletasks()
-        x = (dialog.winfo_screenwidth() // 2) - 260
-        y = (dialog.winfo_screenheight() // 2) - 225
-        dialog.geometry(f'520x450+{x}+{y}')
-
-        # 创建内容容器
-        content_frame = tk.Frame(dialog, bg='white')
-        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
-
-        tk.Label(content_frame, text="✨ 任务完成！记录一下收获吧", font=('Microsoft YaHei UI', 14, 'bold'),
-                bg='white', fg='#0078D4').pack(pady=(0, 15))
-
-        tk.Label(content_frame, text="本次任务总结：", font=('Microsoft YaHei UI', 11, 'bold'),
-                bg='white', fg='#333333').pack(anchor=tk.W)
-
-        summary_text = tk.Text(content_frame, font=('Microsoft YaHei UI', 10), bg='#F5F5F5',
-                              height=10, relief=tk.FLAT, highlightthickness=1, highlightbackground='#E0E0E0')
-        summary_text.pack(fill=tk.BOTH, expand=True, pady=(10, 10))
-
-        # 添加提示
-        tips = "💡 提示：可以记录遇到的问题、解决方案、收获心得等"
-        tk.Label(content_frame, text=tips, font=('Microsoft YaHei UI', 9),
-                bg='white', fg='#999999').pack(anchor=tk.W)
-
-        button_frame = tk.Frame(content_frame, bg='white')
-        button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(15, 0))
-
-        def save_summary():
-            summary = summary_text.get("1.0", tk.END).strip()
-
-            if todo_id:
-                self.db.complete_task(todo_id, summary)
-                self.load_today_todos()
-
-                # 刷新迷你窗口的任务列表
-                if hasattr(parent_window, 'mini_listbox'):
-                    parent_window.mini_listbox.delete(0, tk.END)
-                    for todo in self.todos:
-                        t_id, title, description, task_date, estimated_duration, priority, status, created_at, notified, repeat_type, repeat_template_id = todo[:11]
-                        total_duration = self.db.get_task_total_duration(t_id)
-
-                        priority_icon = ['📌', '⭐', '🔥'][priority]
-                        status_icon = '✅' if status == 1 else '⬜'
-
-                        # 显示时长：已进行时长/总时长
-                        elapsed_text = self.format_duration_simple(total_duration)
-
-                        if estimated_duration > 0:
-                            total_text = self.format_duration_simple(estimated_duration)
-                            display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}/{total_text}"
-                        else:
-                            display_text = f"{status_icon} {priority_icon} {title} | ⏱️ {elapsed_text}"
-
-                        parent_window.mini_listbox.insert(tk.END, display_text)
-
-                # 发送完成通知
-                if self.notifier:
-                    try:
-                        self.notifier.show_toast(
-                            title="🎉 任务完成",
-                            msg="太棒了！又完成了一项任务",
-                            duration=5
-                        )
-                    except:
-                        pass
+        self.show_summary_dialog(todo_id, mini_window)
+
+
+class CallbackProfiler:
+    """界面卡顿分析：Tk 回调都在主线程执行，开启后用 cProfile 统计主线程的函数耗时，
+    同时由后台线程定时采样主线程的调用栈。主线程持有 GIL 时采样会推迟，所以每次采样按距上次采样的
+    实际时间计权。停止时写出火焰图工具可直接读取的折叠栈文件（权重为微秒），
+    以及按 Tk 回调和按函数的耗时汇总。未开启时不安装任何钩子
+    """
+
+    # 主线程停在这些函数里等待事件，采样计为空闲
+    IDLE_FRAMES = ('mainloop', 'wait_window', 'wait_variable')
+    # 回调外面包的一层（lambda、after 的 callit），汇总时归到里面真正的回调
+    WRAPPER_FRAMES = ('<lambda>', 'callit')
+
+    def __init__(self, path_prefix, interval=PROFILE_SAMPLE_INTERVAL, top_n=PROFILE_TOP_N):
+        # 输出文件为 path_prefix-profile-时间戳.folded / .txt
+        self.path_prefix = path_prefix
+        self.interval = interval
+        self.top_n = top_n
+        self.profile = None
+        self.sampler = None
+        self.stopping = threading.Event()
+        self.started_at = None
+        self.thread_id = None
+        # 折叠栈 -> 耗时，Tk 回调 -> 耗时，空闲时间（秒）
+        self.stacks = {}
+        self.callbacks = {}
+        self.idle = 0.0
+
+    @property
+    def running(self):
+        return self.profile is not None
 
-            dialog.destroy()
+    def start(self):
+        """在主线程中调用，开始分析"""
+        if self.running:
+            return
+        self.stacks = {}
+        self.callbacks = {}
+        self.idle = 0.0
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.now()
+        self.stopping.clear()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        """停止分析并写出结果，返回 (折叠栈文件, 汇总文件)；未开启时返回 None"""
+        if not self.running:
+            return None
+        self.profile.disable()
+        self.stopping.set()
+        self.sampler.join()
+        profile, self.profile = self.profile, None
+
+        path = f"{self.path_prefix}-profile-{self.started_at.strftime('%Y%m%d-%H%M%S')}"
+        with open(path + '.folded', 'w', encoding='utf-8') as f:
+            for stack, seconds in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {round(seconds * 1e6)}\n')
+        with open(path + '.txt', 'w', encoding='utf-8') as f:
+            self._write_summary(f, profile)
+        return path + '.folded', path + '.txt'
+
+    def _sample(self):
+        """采样线程：记录主线程的调用栈（外层在前）和所在的 Tk 回调"""
+        callwrapper = tk.CallWrapper.__call__.__code__
+        last = time.perf_counter()
+        while not self.stopping.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            if frame.f_code.co_name in self.IDLE_FRAMES:
+                self.idle += elapsed
+                continue
+            names = []
+            callback = None
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                if frame.f_back is not None and frame.f_back.f_code is callwrapper:
+                    callback = len(names) - 1
+                frame = frame.f_back
+            names.reverse()
+            stack = ';'.join(names)
+            self.stacks[stack] = self.stacks.get(stack, 0) + elapsed
+            if callback is not None:
+                index = len(names) - 1 - callback
+                while names[index].split(' ', 1)[0] in self.WRAPPER_FRAMES and index + 1 < len(names):
+                    index += 1
+                name = names[index]
+                self.callbacks[name] = self.callbacks.get(name, 0) + elapsed
+
+    def _write_summary(self, f, profile):
+        """写出耗时汇总：采样概况、按 Tk 回调的采样耗时、cProfile 按累计耗时排序的前 top_n 个函数"""
+        busy = sum(self.stacks.values())
+        f.write(f"分析时段: {self.started_at.strftime('%Y-%m-%d %H:%M:%S')} - "
+                f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"采样间隔 {self.interval * 1000:g} 毫秒，主线程忙碌 {busy:.2f} 秒，空闲 {self.idle:.2f} 秒\n\n")
+        f.write(f"Tk 回调（按采样估算的耗时，前 {self.top_n} 个）\n")
+        for name, seconds in sorted(self.callbacks.items(), key=lambda item: -item[1])[:self.top_n]:
+            f.write(f"{seconds * 1000:10.0f} ms  {seconds / busy:6.1%}  {name}\n")
+        f.write("\n")
+        stats = pstats.Stats(profile, stream=f)
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+
+
+class SoakTest:
+    """浸泡测试：用临时数据库在真实的 Tk 中脚本化地模拟多天的使用，检查长时间运行是否有泄漏
+
+    每一轮通过对话框新建任务、并行计时、暂停、完成并填写总结，打开精简模式、命令面板、历史复盘和日程，
+    跑番茄钟，删除后撤销和重做；每个模拟日结束时记录 RSS、Tk 控件数、待执行的 after 任务、Tcl 命令数、
+    Python 对象数和 tracemalloc 统计的内存。预热后按前后三分之一的中位数估算每天的增长，
+    超过 SOAK_GROWTH_LIMITS 即判定为泄漏。没有显示器的环境可以用 xvfb-run 运行。
+    每一步都检查结果，步骤没有生效、弹出提示或警告、Tk 回调抛出异常时以 RuntimeError 中止。
+    模拟的日期通过替换本模块的 datetime 前移，换天、今日任务和新建任务的日期一致
+    """
+
+    TITLES = ['写周报', '代码评审', '构建', '开会', '读书', '回复邮件']
+
+    def __init__(self, days, rounds=SOAK_ROUNDS_PER_DAY, warmup=SOAK_WARMUP_DAYS):
+        self.days = days
+        self.rounds = rounds
+        self.warmup = warmup
+        self.samples = []
+        # 自动应答的消息框次数
+        self.prompts = 0
+        # 还没检查的提示、警告和回调异常（出现即说明某一步没有按预期进行）
+        self.alerts = []
+        # 模拟时钟比真实时间前移的天数
+        self.day_offset = 0
+
+    def run(self, report=print):
+        """运行测试，返回超过上限的指标 [(指标, 每天增长)]，为空表示通过"""
+        tracemalloc.start()
+        with tempfile.TemporaryDirectory() as workdir, self.autopilot(), self.simulated_clock():
+            root = tk.Tk()
+            root.report_callback_exception = lambda exc, value, tb: self.alerts.append(f"{exc.__name__}: {value}")
+            try:
+                app = TodoApp(root, os.path.join(workdir, 'soak.db'))
+                for day in range(self.days):
+                    for round_index in range(self.rounds):
+                        self.simulate_round(app, round_index)
+                    self.day_offset = day + 1
+                    self.expect(app.db.roll_over_day(), "换天")
+                    self.settle(root)
+                    sample = self.measure(root)
+                    self.samples.append(sample)
+                    report(f"第 {day + 1} 天: " + ', '.join(f"{name}={value}" for name, value in sample.items()))
+            finally:
+                root.destroy()
+                tracemalloc.stop()
+        return self.check(self.samples)
+
+    def check(self, samples):
+        """预热后按前后三分之一的中位数估算每天的增长，返回超过上限的指标"""
+        measured = samples[self.warmup:]
+        if len(measured) < 3:
+            raise ValueError(f"预热 {self.warmup} 天后至少还要 3 天才能判断增长")
+        third = len(measured) // 3
+        span = len(measured) - third
+        failures = []
+        for name, limit in SOAK_GROWTH_LIMITS.items():
+            head = statistics.median(sample[name] for sample in measured[:third])
+            tail = statistics.median(sample[name] for sample in measured[-third:])
+            growth = (tail - head) / span
+            if growth > limit:
+                failures.append((name, growth))
+        return failures
+
+    def measure(self, root):
+        """一次采样"""
+        gc.collect()
+        return {
+            'rss_kb': current_rss_kb(),
+            'traced_kb': tracemalloc.get_traced_memory()[0] // 1024,
+            'objects': len(gc.get_objects()),
+            'widgets': self.count_widgets(root, '.'),
+            'after_jobs': len(root.tk.splitlist(root.tk.call('after', 'info'))),
+            'tcl_commands': len(root.tk.splitlist(root.tk.call('info', 'commands'))),
+        }
 
-        tk.Button(button_frame, text="跳过", font=('Microsoft YaHei UI', 10),
-                 bg='#E0E0E0', fg='#333333', relief=tk.FLAT, cursor='hand2',
-                 command=lambda: [save_summary(), dialog.destroy()], padx=25, pady=10,
-                 activebackground='#D0D0D0').pack(side=tk.RIGHT, padx=5)
+    def count_widgets(self, root, path):
+        """Tk 中实际存在的控件数（直接查询 Tk，包括没有 Python 对象引用的控件）"""
+        return 1 + sum(self.count_widgets(root, str(child))
+                       for child in root.tk.splitlist(root.tk.call('winfo', 'children', path)))
+
+    @contextlib.contextmanager
+    def autopilot(self):
+        """测试期间消息框不弹出，确认类的都回答“是”"""
+        def answer(value):
+            def prompt(*args, **kwargs):
+                self.prompts += 1
+                if value == 'ok':
+                    self.alerts.append(' '.join(str(arg) for arg in args))
+                return value
+            return prompt
+
+        names = {'askyesno': True, 'askyesnocancel': True, 'askokcancel': True,
+                 'showinfo': 'ok', 'showwarning': 'ok', 'showerror': 'ok'}
+        saved = {name: getattr(messagebox, name) for name in names}
+        for name, value in names.items():
+            setattr(messagebox, name, answer(value))
+        try:
+            yield
+        finally:
+            for name, function in saved.items():
+                setattr(messagebox, name, function)
+
+    @contextlib.contextmanager
+    def simulated_clock(self):
+        """测试期间本模块的 datetime.now() 按 day_offset 前移"""
+        module = sys.modules[__name__]
+        real_datetime = module.datetime
+        soak = self
+
+        class SimulatedDatetime(real_datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return real_datetime.now(tz) + timedelta(days=soak.day_offset)
+
+        module.datetime = SimulatedDatetime
+        try:
+            yield
+        finally:
+            module.datetime = real_datetime
+
+    def expect(self, condition, step):
+        """检查一步的结果：没有生效，或期间出现了提示、警告、回调异常时中止测试"""
+        alerts, self.alerts = self.alerts, []
+        if not condition or alerts:
+            detail = f"（{'；'.join(alerts)}）" if alerts else ''
+            raise RuntimeError(f"浸泡测试第 {self.day_offset + 1} 天「{step}」失败{detail}")
+
+    def today_ids(self, app):
+        return {todo.id for todo in app.all_todos}
+
+    def simulate_round(self, app, round_index):
+        """一轮模拟操作"""
+        root = app.root
+        title = self.TITLES[round_index % len(self.TITLES)]
+        today = datetime.now().strftime('%Y-%m-%d')
 
-        tk.Button(button_frame, text="保存总结", font=('Microsoft YaHei UI', 10, 'bold'),
-                 bg='#0078D4', fg='white', relief=tk.FLAT, cursor='hand2',
-                 command=save_summary, padx=30, pady=10, activebackground='#005A9E').pack(side=tk.RIGHT)
+        # 通过新建对话框添加两个任务
+        added = []
+        for suffix in ('', ' 复查'):
+            before = self.today_ids(app)
+            app.show_add_dialog()
+            dialog = self.last_window(root)
+            entry = self.find(dialog, tk.Entry)
+            entry.delete(0, tk.END)
+            entry.insert(0, title + suffix)
+            self.press(dialog, "保存")
+            self.settle(root)
+            new = [todo for todo in app.todos if todo.id not in before]
+            self.expect(len(new) == 1 and new[0].title == title + suffix and new[0].task_date == today,
+                        f"新建「{title + suffix}」")
+            added.append(new[0].id)
+        first_id, second_id = added
+
+        # 两个任务同时计时，暂停再继续，刷新几次显示
+        for todo_id in added:
+            self.expect(app.select_todo(todo_id), f"选中任务 {todo_id}")
+            app.start_task()
+        self.expect(app.timers.get(first_id) and app.timers.get(second_id), "同时计时")
+        app.pause_task()
+        self.expect(app.active_timer.is_paused, "暂停")
+        app.pause_task()
+        self.expect(app.active_timer.todo_id == second_id and app.active_timer.is_running, "继续")
+        for _ in range(3):
+            app.update_timer_display()
+
+        # 完成计时区的任务并保存总结
+        app.complete_task()
+        self.press(self.last_window(root), "保存总结")
+        self.settle(root)
+        self.expect(second_id not in self.today_ids(app) and app.active_timer.todo_id == first_id, "完成任务")
+
+        # 在精简模式中完成仍在计时的另一个任务，然后返回主界面
+        app.show_mini_window()
+        mini = app.mini_window
+        self.settle(root)
+        app.complete_task_from_mini(mini)
+        self.press(self.last_window(mini), "保存总结")
+        self.press(mini, "返回")
+        self.settle(root)
+        self.expect(first_id not in self.today_ids(app) and not app.timers and app.mini_window is None,
+                    "精简模式中完成任务")
+
+        # 命令面板、历史复盘打开后关闭，日程对话框取消
+        app.show_command_palette()
+        self.last_window(root).destroy()
+        app.show_history()
+        self.last_window(root).destroy()
+        app.show_schedule_dialog()
+        self.press(self.last_window(root), "取消")
+        self.expect(True, "打开命令面板、历史复盘和日程")
+
+        # 番茄钟开始后停止，然后删除这个任务，撤销、重做
+        todo_id = app.db.add_todo(f"{title} 番茄", task_date=today)
+        self.settle(root)
+        self.expect(app.select_todo(todo_id), "选中番茄钟任务")
+        app.start_pomodoro()
+        self.expect(app.pomodoro and app.pomodoro.todo_id == todo_id and app.timers.get(todo_id), "开始番茄钟")
+        app.stop_timer_internal()
+        self.expect(app.pomodoro is None and not app.timers, "停止番茄钟")
+        self.expect(app.select_todo(todo_id), "选中要删除的任务")
+        app.delete_selected()
+        self.settle(root)
+        self.expect(todo_id not in self.today_ids(app), "删除任务")
+        app.undo()
+        self.settle(root)
+        self.expect(todo_id in self.today_ids(app), "撤销删除")
+        app.redo()
+        self.settle(root)
+        self.expect(todo_id not in self.today_ids(app), "重做删除")
+
+    def settle(self, root):
+        """处理完已到期的事件和空闲任务"""
+        for _ in range(3):
+            root.update()
+
+    def last_window(self, parent):
+        """parent 下最近创建的 Toplevel"""
+        return [child for child in parent.winfo_children() if isinstance(child, tk.Toplevel)][-1]
+
+    def find(self, widget, widget_type, text=None):
+        """按创建顺序深度优先查找第一个指定类型（和文字）的控件"""
+        for child in widget.winfo_children():
+            if isinstance(child, widget_type) and (text is None or child.cget('text') == text):
+                return child
+            found = self.find(child, widget_type, text)
+            if found is not None:
+                return found
+        return None
+
+    def press(self, window, text):
+        """点击窗口中文字为 text 的按钮"""
+        button = self.find(window, tk.Button, text)
+        if button is None:
+            raise LookupError(f"找不到按钮: {text}")
+        button.invoke()
 
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='每日待办提醒小助手')
+    parser.add_argument('--backup', action='store_true', help='立即备份数据库后退出')
+    parser.add_argument('--list-backups', action='store_true', help='列出已有备份后退出')
+    parser.add_argument('--restore', metavar='FILE', help='从指定备份恢复数据库后退出')
+    parser.add_argument('--export', choices=ReportExporter.FORMATS, help='导出复盘报告后退出')
+    parser.add_argument('--period', choices=['week', 'month', 'year'], default='week',
+                        help='报告周期（本周/本月/今年），默认本周')
+    parser.add_argument('--from', dest='start_date', metavar='YYYY-MM-DD', help='报告开始日期（覆盖 --period）')
+    parser.add_argument('--to', dest='end_date', metavar='YYYY-MM-DD', help='报告结束日期，默认今天')
+    parser.add_argument('--output', metavar='FILE', help='报告输出文件，默认保存在当前目录')
+    parser.add_argument('--export-ics', metavar='FILE',
+                        help='导出待办任务、重复任务和周期内（--period/--from/--to）已完成任务的 iCalendar 文件后退出')
+    parser.add_argument('--import-ics', metavar='FILE', help='从 iCalendar 文件导入任务和重复任务后退出')
+    parser.add_argument('--check-db', action='store_true', help='检查数据库完整性和孤立记录后退出')
+    parser.add_argument('--repair-db', action='store_true', help='修复孤立记录（删除或置空）后退出')
+    parser.add_argument('--profile', action='store_true',
+                        help='从启动开始分析界面卡顿，退出时在数据库旁写出折叠栈和耗时汇总（运行中也可按 Ctrl+Shift+F12 开关）')
+    parser.add_argument('--soak', type=int, metavar='DAYS',
+                        help=f'用临时数据库模拟 DAYS 天的使用，检查内存和界面资源是否持续增长（至少 {SOAK_WARMUP_DAYS + 3} 天）')
+    args = parser.parse_args()
+
+    if args.soak:
+        try:
+            failures = SoakTest(args.soak).run()
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        for name, growth in failures:
+            print(f"❌ {name} 每天增长 {growth:.1f}，超过上限 {SOAK_GROWTH_LIMITS[name]}")
+        if not failures:
+            print("✅ 未发现持续增长")
+        sys.exit(1 if failures else 0)
+
+    if args.check_db or args.repair_db:
+        db = Database(DB_PATH)
+        if args.repair_db:
+            repaired = db.repair_integrity()
+            for (table, column), count in repaired.items():
+                print(f"已修复 {table}.{column}: {count} 条")
+            if not repaired:
+                print("没有需要修复的孤立记录")
+        problems = db.check_integrity()
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print("✅ 数据库完整")
+        sys.exit(1 if problems else 0)
+
+    if args.export_ics or args.import_ics:
+        calendar = CalendarSync(Database(DB_PATH))
+        if args.import_ics:
+            result = calendar.import_file(args.import_ics)
+            print(f"已导入 {result['todos']} 个任务、{result['templates']} 个重复任务，跳过 {result['skipped']} 条")
+        if args.export_ics:
+            start_date, end_date = get_report_range(args.period)
+            calendar.export(args.export_ics, args.start_date or start_date, args.end_date or end_date)
+            print(f"日历已导出到: {args.export_ics}")
+        return
+
+    if args.export:
+        start_date, end_date = get_report_range(args.period)
+        start_date = args.start_date or start_date
+        end_date = args.end_date or end_date
+        output = args.output or f"复盘报告-{start_date}-{end_date}.{args.export}"
+        ReportExporter(Database(DB_PATH)).export(args.export, start_date, end_date, output)
+        print(f"报告已导出到: {output}")
+        return
+
+    if args.backup or args.list_backups or args.restore:
+        backup_manager = BackupManager(DB_PATH)
+        if args.backup:
+            print(f"已备份到: {backup_manager.create_backup()}")
+        if args.list_backups:
+            for path in backup_manager.list_backups():
+                print(f"{path}  {os.path.getsize(path) // 1024} KB")
+        if args.restore:
+            safety_path = backup_manager.restore_backup(args.restore)
+            print(f"已从 {args.restore} 恢复数据库")
+            if safety_path:
+                print(f"恢复前的数据库已备份到: {safety_path}")
+        return
+
     root = tk.Tk()
-    app = TodoApp(root)
+    app = TodoApp(root, profile=args.profile)
     root.mainloop()
+    if app.profiler.running:
+        folded_path, summary_path = app.profiler.stop()
+        print(f"卡顿分析已保存到: {folded_path}、{summary_path}")
+    # 发送线程是守护线程，不等待的话退出时还在合并窗口里的通知会丢失
+    app.notifier.close(NOTIFY_CLOSE_TIMEOUT)
 
 
 if __name__ == '__main__':